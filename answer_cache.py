@@ -0,0 +1,155 @@
+# 职责：问答语义缓存 —— 归一化文本精确匹配 + 查询向量近似匹配，缓存上下文与最终答案。
+import os
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional
+
+import numpy as np
+
+import config
+
+
+def normalize_query(query: str) -> str:
+    """全角转半角、小写、合并空白、去掉首尾标点"""
+    text = unicodedata.normalize("NFKC", query).lower()
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(" \t?？!！.。,，;；~")
+
+
+class AnswerCache:
+    """
+    进程内 LRU + TTL 缓存。每个条目记录其上下文来自哪些父块；
+    入库进程通过 publish_invalidation 向失效日志追加父块 ID，查询时读取新增行并剔除受影响的条目。
+    """
+
+    def __init__(self, embed_fn: Optional[Callable[[str], List[float]]] = None,
+                 max_entries: int = config.ANSWER_CACHE_SIZE,
+                 ttl: float = config.ANSWER_CACHE_TTL,
+                 threshold: float = config.ANSWER_CACHE_THRESHOLD,
+                 invalidation_log: str = config.ANSWER_CACHE_INVALIDATION_LOG):
+        self.embed_fn = embed_fn
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.log_path = invalidation_log
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._log_inode = None
+        self._log_offset = 0
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._sync_invalidations(initial=True)
+
+    # --- 失效 ---
+    @staticmethod
+    def publish_invalidation(parent_ids: Iterable[str], path: str = config.ANSWER_CACHE_INVALIDATION_LOG):
+        """入库侧调用：追加失效的父块 ID ("*" 表示全部失效)"""
+        ids = [i for i in parent_ids if i]
+        if not ids:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(ids) + "\n")
+
+    def _sync_invalidations(self, initial: bool = False):
+        """读取失效日志的新增部分；日志被删除或重建 (全量入库) 时清空全部缓存"""
+        try:
+            st = os.stat(self.log_path)
+        except FileNotFoundError:
+            if self._log_inode is not None and not initial:
+                self._entries.clear()
+            self._log_inode, self._log_offset = None, 0
+            return
+        if st.st_ino != self._log_inode or st.st_size < self._log_offset:
+            # 日志被替换时旧内容已不可追踪，保守地全部失效；首次出现则从头读取
+            if self._log_inode is not None:
+                self._entries.clear()
+            self._log_inode = st.st_ino
+            self._log_offset = st.st_size if initial else 0
+        if st.st_size == self._log_offset:
+            return
+        with open(self.log_path, "r", encoding="utf-8") as f:
+            f.seek(self._log_offset)
+            stale = set(f.read().split())
+            self._log_offset = f.tell()
+        if "*" in stale:
+            self._entries.clear()
+        elif stale:
+            for key in [k for k, e in self._entries.items() if e["parent_ids"] & stale]:
+                del self._entries[key]
+
+    # --- 查询 ---
+    def _embed(self, query: str) -> Optional[np.ndarray]:
+        if self.embed_fn is None:
+            return None
+        try:
+            vec = np.asarray(self.embed_fn(query), dtype=np.float32)
+        except Exception as e:
+            print(f"⚠️ 语义缓存嵌入失败: {e}")
+            return None
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else None
+
+    def lookup(self, query: str) -> Optional[dict]:
+        key = normalize_query(query)
+        with self._lock:
+            self._sync_invalidations()
+            now = time.time()
+            for k in [k for k, e in self._entries.items() if now - e["created"] > self.ttl]:
+                del self._entries[k]
+
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            candidates = [(k, e) for k, e in self._entries.items() if e["vec"] is not None]
+
+        vec = self._embed(query) if candidates else None
+        with self._lock:
+            if vec is not None:
+                matrix = np.stack([e["vec"] for _, e in candidates])
+                sims = matrix @ vec
+                best = int(np.argmax(sims))
+                k, entry = candidates[best]
+                if sims[best] >= self.threshold and k in self._entries:
+                    self._entries.move_to_end(k)
+                    self.hits += 1
+                    self.semantic_hits += 1
+                    return entry
+            self.misses += 1
+        return None
+
+    def put(self, query: str, context: str, answer: str, parent_ids: Iterable[str]):
+        entry = {
+            "query": query,
+            "context": context,
+            "answer": answer,
+            "parent_ids": set(parent_ids),
+            "vec": self._embed(query),
+            "created": time.time(),
+        }
+        with self._lock:
+            self._entries[normalize_query(query)] = entry
+            self._entries.move_to_end(normalize_query(query))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+    def report(self) -> str:
+        s = self.stats()
+        return (f"💾 答案缓存: 命中率 {s['hit_rate']:.1%} "
+                f"(精确 {s['hits'] - s['semantic_hits']} / 语义 {s['semantic_hits']} / 未命中 {s['misses']}) | 条目 {s['entries']}")
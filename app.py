@@ -1,27 +1,18 @@
 import sys
 import os
+import time
+_IMPORT_START = time.perf_counter()
 import importlib.util
 import streamlit as st
 
 # --- 1. 绝对物理路径注入 ---
-# 这是你刚才 find 出来的真实坐标
-ENSEMBLE_PATH = "/home/reusnak/neuro-symbolic-rag/.venv/lib/python3.12/site-packages/langchain_classic/retrievers/ensemble.py"
 SITE_PACKAGES = "/home/reusnak/neuro-symbolic-rag/.venv/lib/python3.12/site-packages"
 
 # 强制将 site-packages 加入搜索路径
 if SITE_PACKAGES not in sys.path:
     sys.path.insert(0, SITE_PACKAGES)
 
-try:
-    # 暴力加载：直接从物理文件读取
-    spec = importlib.util.spec_from_file_location("ensemble_fixed", ENSEMBLE_PATH)
-    ensemble_module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(ensemble_module)
-    EnsembleRetriever = ensemble_module.EnsembleRetriever
-    print("✅ 物理加载 EnsembleRetriever 成功")
-except Exception as e:
-    # 如果物理加载失败，尝试最后一种标准导入
-    from langchain.retrievers import EnsembleRetriever
+# 注：检索已改用 hybrid.HybridRetriever，不再物理加载 EnsembleRetriever (其导入会拖慢首屏)
 
 from langchain_ollama import ChatOllama
 try:
@@ -46,9 +37,13 @@ except ImportError:
         else:
             st.error("❌ 无法定位 langchain_core。请运行: pip install langchain-core")
             st.stop()
+from answer_cache import AnswerCache
 from retriever import RAGRetriever
+from tracing import format_trace, tracer
 import config 
 
+IMPORT_MS = (time.perf_counter() - _IMPORT_START) * 1000
+
 # --- 3. Streamlit 页面配置 ---
 st.set_page_config(
     page_title="Neuro-Symbolic RAG", 
@@ -64,21 +59,24 @@ st.caption("基于 Obsidian 笔记、图谱增强与混合检索的本地 AI 助
 @st.cache_resource(show_spinner="正在加载 AI 模型与索引...")
 def init_all():
     try:
-        # 初始化检索引擎
+        # 初始化检索引擎 (索引与精排模型在后台加载，首屏不等待)
         engine = RAGRetriever()
+        engine.startup_profile["模块导入"] = IMPORT_MS
         # 初始化 LLM (Ollama)
         llm = ChatOllama(
             model=config.LLM_MODEL_NAME,
             base_url=config.OLLAMA_BASE_URL,
             temperature=0.3
         )
-        return engine, llm
+        # 问答缓存 (跨会话共享)，复用检索引擎的查询嵌入
+        answer_cache = AnswerCache(embed_fn=engine.storage.embedding.embed_query)
+        return engine, llm, answer_cache
     except Exception as e:
         st.error(f"❌ 初始化失败: {str(e)}")
         st.info("请确保已通过 scripts/ingest.py 构建了索引，并启动了 Ollama 服务。")
         st.stop()
 
-engine, llm = init_all()
+engine, llm, answer_cache = init_all()
 
 # --- 5. 聊天记录与侧边栏 ---
 if "messages" not in st.session_state:
@@ -86,12 +84,38 @@ if "messages" not in st.session_state:
 
 with st.sidebar:
     st.header("⚙️ 系统状态")
-    st.success("✅ 检索引擎: 就绪")
+    if engine.is_ready():
+        st.success("✅ 检索引擎: 就绪")
+    else:
+        st.warning("⏳ 检索引擎: 后台加载中 (首个问题会等待加载完成)")
+    with st.expander("🚀 启动耗时", expanded=False):
+        for stage, ms in list(engine.startup_profile.items()):
+            st.caption(f"{stage}: {ms:.0f}ms")
     st.info(f"🤖 当前模型: {config.LLM_MODEL_NAME}")
+    if hasattr(engine.storage.embedding, "report"):
+        st.caption(engine.storage.embedding.report())
+    st.caption(answer_cache.report())
+    # 上一次查询的分阶段耗时 (新查询完成后原地刷新)
+    trace_box = st.empty()
     if st.button("🗑️ 清空对话历史"):
         st.session_state.messages = []
         st.rerun()
 
+def render_trace(trace):
+    """侧边栏耗时明细：有追踪时按 span 缩进展示，追踪关闭时退回检索阶段计时"""
+    with trace_box.container():
+        with st.expander("⏱️ 本次查询耗时", expanded=True):
+            if trace is not None:
+                st.caption(f"总计: {trace['ms']:.0f}ms")
+                for line in format_trace(trace):
+                    st.caption(line)
+            else:
+                for stage, ms in engine.last_timings.items():
+                    st.caption(f"{stage}: {ms:.0f}ms")
+
+if st.session_state.get("last_trace") or engine.last_timings:
+    render_trace(st.session_state.get("last_trace"))
+
 # 渲染对话历史
 for msg in st.session_state.messages:
     with st.chat_message(msg["role"]):
@@ -110,26 +134,44 @@ if query := st.chat_input("输入你的问题..."):
         full_response = ""
         
         try:
-            # 第一步：执行检索 (Retrieval)
-            with st.status("🔍 正在检索知识库...", expanded=False) as status:
-                context = engine.search(query)
-                status.update(label="✅ 检索完成", state="complete")
-
-            # 第二步：构建消息序列
-            messages = [
-                SystemMessage(content=f"你是一个专业的 Obsidian 知识助手。请结合以下背景知识回答问题。\n\n背景知识：\n{context}"),
-                HumanMessage(content=query)
-            ]
-
-            # 第三步：流式生成 (Streaming)
-            for chunk in llm.stream(messages):
-                full_response += chunk.content
-                response_placeholder.markdown(full_response + "▌")
-            
-            response_placeholder.markdown(full_response)
-            
+            with tracer.trace("问答", query=query[:50]) as trace:
+                # 第零步：问答缓存 (精确 / 语义近似命中则直接返回)
+                cached = answer_cache.lookup(query)
+                if cached is not None:
+                    trace.set(答案缓存=True)
+                    full_response = cached["answer"]
+                    response_placeholder.markdown(full_response)
+                    st.caption("⚡ 来自答案缓存")
+                else:
+                    # 第一步：执行检索 (Retrieval)
+                    with st.status("🔍 正在检索知识库...", expanded=False) as status:
+                        context, parent_ids = engine.retrieve(query)
+                        status.update(label="✅ 检索完成", state="complete")
+
+                    # 第二步：构建消息序列
+                    messages = [
+                        SystemMessage(content=f"你是一个专业的 Obsidian 知识助手。请结合以下背景知识回答问题。\n\n背景知识：\n{context}"),
+                        HumanMessage(content=query)
+                    ]
+
+                    # 第三步：流式生成 (Streaming)
+                    with tracer.span("生成") as gen_span:
+                        gen_start = time.perf_counter()
+                        for chunk in llm.stream(messages):
+                            if not full_response:
+                                gen_span.set(首字ms=round((time.perf_counter() - gen_start) * 1000))
+                            gen_span.count("生成片段")
+                            full_response += chunk.content
+                            response_placeholder.markdown(full_response + "▌")
+
+                    response_placeholder.markdown(full_response)
+                    if parent_ids:
+                        answer_cache.put(query, context, full_response, parent_ids)
+
             # 保存到历史记录
             st.session_state.messages.append({"role": "assistant", "content": full_response})
+            st.session_state.last_trace = trace.result
+            render_trace(trace.result)
             
         except Exception as e:
             st.error(f"⚠️ 生成回答时出错: {str(e)}")
\ No newline at end of file
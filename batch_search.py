@@ -0,0 +1,85 @@
+# 职责：离线批量检索 —— 读取 JSONL 查询文件，按批调用 RAGRetriever.search_batch，结果流式写出 JSONL 并报告吞吐。
+# 用法: PYTHONPATH=. python batch_search.py queries.jsonl -o results.jsonl --batch 256
+#       输入每行一个 JSON 对象，查询取 --field 字段 (默认 query)，其余字段原样写回输出；纯文本行视为查询本身。
+import argparse
+import itertools
+import json
+import sys
+import time
+from typing import Dict, Iterator, List
+
+import config
+from retriever import RAGRetriever
+from storage import StorageManager
+
+
+def read_queries(path: str, field: str) -> Iterator[dict]:
+    """逐行读取 (不整体载入内存)，空行跳过；"-" 表示标准输入"""
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    try:
+        for lineno, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                record = line
+            if not isinstance(record, dict):
+                record = {field: str(record)}
+            if not isinstance(record.get(field), str):
+                print(f"⚠️ 第 {lineno} 行缺少字段 {field!r}，已跳过")
+                continue
+            yield record
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线批量检索 (JSONL 输入 / 输出)")
+    parser.add_argument("input", help="查询 JSONL 文件，- 为标准输入")
+    parser.add_argument("-o", "--output", default=None, help="结果 JSONL (默认 <input>.results.jsonl)")
+    parser.add_argument("--field", default="query", help="查询文本所在字段")
+    parser.add_argument("--batch", type=int, default=config.BATCH_QUERY_SIZE, help="每批查询数")
+    parser.add_argument("--no-context", action="store_true", help="只输出父块 ID 与分数，不写上下文正文")
+    parser.add_argument("--ollama", default=config.OLLAMA_BASE_URL, help="Ollama 地址")
+    args = parser.parse_args()
+
+    output = args.output or ("batch_results.jsonl" if args.input == "-" else f"{args.input}.results.jsonl")
+    engine = RAGRetriever(storage=StorageManager(base_url=args.ollama), background=False)
+
+    stages: Dict[str, float] = {}
+    done, start = 0, time.perf_counter()
+    records = read_queries(args.input, args.field)
+    with open(output, "w", encoding="utf-8") as out:
+        while True:
+            batch: List[dict] = list(itertools.islice(records, args.batch))
+            if not batch:
+                break
+            t0 = time.perf_counter()
+            results = engine.search_batch([r[args.field] for r in batch])
+            for record, result in zip(batch, results):
+                if args.no_context:
+                    result.pop("context")
+                out.write(json.dumps({**record, **result}, ensure_ascii=False) + "\n")
+            out.flush()
+
+            done += len(batch)
+            for stage, ms in engine.last_batch_timings.items():
+                stages[stage] = stages.get(stage, 0.0) + ms
+            elapsed = time.perf_counter() - start
+            batch_s = time.perf_counter() - t0
+            print(f"📈 已处理 {done} 条 | 本批 {len(batch) / batch_s:.1f} 条/s | "
+                  f"累计 {done / elapsed:.1f} 条/s | "
+                  + " | ".join(f"{k} {v:.0f}ms" for k, v in engine.last_batch_timings.items()))
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ 共 {done} 条查询，耗时 {elapsed:.1f}s ({done / elapsed if elapsed else 0:.1f} 条/s)，结果已写入 {output}")
+    if done:
+        print("⏱️ 每条平均: " + " | ".join(f"{k} {v / done:.1f}ms" for k, v in stages.items()))
+    print(f"🎯 精排缓存: {engine.reranker.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# 职责：微批调度 —— 把数毫秒内到达的并发请求合并为一次批量调用 (查询嵌入 / 交叉编码器前向)。
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+
+
+class Overloaded(RuntimeError):
+    """排队请求数超过上限 (准入控制拒绝)，服务层据此返回 503"""
+
+
+class MicroBatcher:
+    """
+    submit(item) 返回 Future；后台线程取到第一个请求后最多再等 max_wait_ms，
+    凑满 max_batch 个 (或超时) 即调用一次 fn(items)，fn 需按顺序返回等长的结果列表。
+    排队深度超过 max_queue 时直接拒绝，避免过载时延迟无限增长。
+    """
+
+    def __init__(self, fn: Callable[[List[Any]], Sequence[Any]], name: str,
+                 max_batch: int = 32, max_wait_ms: float = 5.0, max_queue: int = 256):
+        self.fn = fn
+        self.name = name
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.rejected = 0
+        self.batches = 0
+        self.batched_items = 0
+        self.max_depth = 0
+        self._thread = threading.Thread(target=self._loop, name=f"batcher-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        with self._lock:
+            depth = self._queue.qsize()
+            if depth >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded(f"{self.name} 队列已满 ({depth})")
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, depth + 1)
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item: Any, timeout: Optional[float] = None) -> Any:
+        return self.submit(item).result(timeout)
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = self.fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name}: 批处理返回 {len(results)} 个结果，期望 {len(items)}")
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            with self._lock:
+                self.batches += 1
+                self.batched_items += len(items)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_depth": self.max_depth,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "avg_batch": self.batched_items / self.batches if self.batches else 0.0,
+        }
+
+
+def flatten_batch(fn: Callable[[List[Any]], Sequence[Any]]) -> Callable[[List[List[Any]]], List[List[Any]]]:
+    """把「每个请求一个列表」的批合并成一次调用，再按原长度切回 (用于精排 pair 列表)"""
+    def run(groups: List[List[Any]]) -> List[List[Any]]:
+        flat = [x for g in groups for x in g]
+        results = list(fn(flat)) if flat else []
+        out, pos = [], 0
+        for g in groups:
+            out.append(results[pos:pos + len(g)])
+            pos += len(g)
+        return out
+    return run
+
+
+class BatchedEmbeddings(Embeddings):
+    """查询嵌入走微批：并发请求的 embed_query 合并为一次 embed_documents 调用"""
+
+    def __init__(self, base: Embeddings, batcher: Optional[MicroBatcher] = None, **batcher_kwargs):
+        self.base = base
+        self.batcher = batcher or MicroBatcher(base.embed_documents, "embed", **batcher_kwargs)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.batcher(text)
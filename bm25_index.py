@@ -0,0 +1,422 @@
+# 职责：原生稀疏 BM25 倒排索引 (CSR 倒排表 + memmap)，替代整体 pickle 的 BM25Retriever。
+import os
+import json
+import mmap
+import tempfile
+import uuid
+from array import array
+from collections import Counter
+from itertools import islice
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from tokenizer import get_tokenizer, resolve_tokenizer
+
+
+class SparseBM25Index:
+    """
+    磁盘布局 (目录下)：
+    - vocab.txt            每行一个词，行号即 term_id
+    - indptr.npy           CSR 行指针 (n_terms + 1)
+    - postings.npy/tfs.npy 按 term 分组的 doc_id 与词频
+    - doc_len.npy          各子块长度 (token 数)
+    - docs.bin + doc_offsets.npy  子块 JSON 记录 (正文 + 元数据)，仅对 top-k 解码
+    - parents.txt          每个子块所属父块 ID，仅在删除/保存时加载
+    - meta.json            文档数、BM25 参数与分词器名称 (查询时沿用建索引时的分词器)、主段代号 generation
+    - delta.npz            save_delta() 写出的增量段与删除标记 (实时索引)，generation 与主段一致时由 load() 回放
+    查询只触及查询词对应的倒排段；新增文档先进入增量段，save() 时与主段合并并剔除已删除文档。
+    增量段的子块正文直接追加到临时文件，内存中只保留紧凑的 (term, doc, tf) 数组，
+    因此可以边向量化边喂入子块，无需把整个语料再从 Chroma 拉回内存。
+    """
+
+    def __init__(self, path: str, tokenizer: str = "whitespace",
+                 k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.tokenizer = resolve_tokenizer(tokenizer)  # 元数据记录实际生效的分词器
+        self.preprocess_func: Callable[[str], List[str]] = get_tokenizer(tokenizer)
+        self.k1, self.b = k1, b
+
+        self.vocab = {}
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.postings = np.zeros(0, dtype=np.int32)
+        self.tfs = np.zeros(0, dtype=np.float32)
+        self.doc_len = np.zeros(0, dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.doc_offsets = np.zeros(1, dtype=np.int64)
+        self._blob = None
+        self._parents: Optional[List[str]] = None
+        self._n_base = 0
+        self.generation: Optional[str] = None  # 主段代号，save() 时更新；None 表示尚未写出过主段
+        self._n_terms_base = 0
+        self._replayed_parents: List[str] = []  # load() 回放的增量段父块 ID，parents.txt 按需加载时接在其后
+        self._rows_by_parent: Optional[dict] = None  # 父块 ID -> 子块行号，首次删除时构建
+
+        # 内存增量段：紧凑的 (term, doc, tf) 三元组，array 追加均摊 O(1)
+        self._delta_terms = array("i")
+        self._delta_docs = array("i")
+        self._delta_tfs = array("f")
+        self._doc_cap = 0  # doc_len / alive 几何增长缓冲区的容量 (0 表示尚未转为缓冲区)
+        self._delta_file = None  # 增量段子块记录 (临时文件，进程退出自动删除)
+        self._delta_offsets = array("q", [0])
+        self._delta_cache = None
+        self._avgdl = None
+
+    # --- 加载 ---
+    @classmethod
+    def load(cls, path: str, tokenizer: Optional[str] = None) -> Optional["SparseBM25Index"]:
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        built_with = meta.get("tokenizer", "whitespace")
+        if tokenizer and tokenizer != built_with:
+            print(f"⚠️ BM25 索引由 {built_with} 分词器构建，与配置 {tokenizer} 不一致，"
+                  f"查询沿用 {built_with}；重建索引后生效")
+        if resolve_tokenizer(built_with) != built_with:
+            raise RuntimeError(f"BM25 索引由 {built_with} 分词器构建，当前环境无法使用该分词器 (未安装 jieba？)")
+        index = cls(path, tokenizer=built_with, k1=meta.get("k1", 1.5), b=meta.get("b", 0.75))
+        with open(os.path.join(path, "vocab.txt"), "r", encoding="utf-8") as f:
+            index.vocab = {t: i for i, t in enumerate(f.read().split("\n")) if t}
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        index.indptr, index.postings, index.tfs = load("indptr"), load("postings"), load("tfs")
+        index.doc_offsets = load("doc_offsets")
+        index.doc_len = np.array(load("doc_len"))
+        index.alive = np.ones(len(index.doc_len), dtype=bool)
+        index._n_base = len(index.doc_len)
+        index.generation = meta.get("generation")
+        index._n_terms_base = len(index.vocab)
+        if index.doc_offsets[-1] > 0:
+            with open(os.path.join(path, "docs.bin"), "rb") as f:
+                index._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        delta_path = os.path.join(path, "delta.npz")
+        if index.generation and os.path.exists(delta_path):
+            index._apply_delta(delta_path)
+        return index
+
+    def _apply_delta(self, delta_path: str):
+        with np.load(delta_path, allow_pickle=False) as z:
+            if str(z["generation"]) != self.generation:
+                return  # 属于已被 save() 合并替换的旧主段
+            for term in filter(None, str(z["new_terms"]).split("\n")):
+                self.vocab[term] = len(self.vocab)
+            self._delta_terms.frombytes(z["terms"].astype(np.int32).tobytes())
+            self._delta_docs.frombytes(z["docs"].astype(np.int32).tobytes())
+            self._delta_tfs.frombytes(z["tfs"].astype(np.float32).tobytes())
+            doc_len = z["doc_len"]
+            if len(doc_len):
+                self._replayed_parents = str(z["parents"]).split("\n")
+                self._append_docs(doc_len)
+                spill = self._delta_spill()
+                spill.write(z["blob"].tobytes())
+                spill.flush()
+                self._delta_offsets = array("q", z["offsets"].tolist())
+            self.alive[z["dead"]] = False
+
+    def __len__(self) -> int:
+        return int(self.alive.sum())
+
+    def _load_parents(self) -> List[str]:
+        if self._parents is None:
+            self._parents = []
+            parents_path = os.path.join(self.path, "parents.txt")
+            if self._n_base and os.path.exists(parents_path):
+                with open(parents_path, "r", encoding="utf-8") as f:
+                    self._parents = f.read().split("\n")[:self._n_base]
+            self._parents.extend(self._replayed_parents)
+            self._replayed_parents = []
+        return self._parents
+
+    # --- 增删 ---
+    def _delta_spill(self):
+        if self._delta_file is None:
+            os.makedirs(self.path, exist_ok=True)
+            self._delta_file = tempfile.TemporaryFile(dir=self.path, prefix="delta-")
+        return self._delta_file
+
+    def _delta_record(self, i: int) -> bytes:
+        lo, hi = self._delta_offsets[i], self._delta_offsets[i + 1]
+        return os.pread(self._delta_file.fileno(), hi - lo, lo)
+
+    def _append_docs(self, lengths: Sequence[int]):
+        """doc_len / alive 写入按容量翻倍增长的缓冲区，对外仍是长度为子块数的视图 (逐批追加不再整体拷贝)"""
+        n, m = len(self.doc_len), len(lengths)
+        if n + m > self._doc_cap:
+            cap = max(2 * self._doc_cap, n + m, 1024)
+            doc_len, alive = np.empty(cap, dtype=np.float32), np.zeros(cap, dtype=bool)
+            doc_len[:n], alive[:n] = self.doc_len, self.alive
+            self._doc_len_buf, self._alive_buf, self._doc_cap = doc_len, alive, cap
+        self._doc_len_buf[n:n + m] = lengths
+        self._alive_buf[n:n + m] = True
+        self.doc_len, self.alive = self._doc_len_buf[:n + m], self._alive_buf[:n + m]
+
+    def add_documents(self, docs: Iterable[Document], id_key: str = "doc_id"):
+        parents = self._load_parents()
+        spill = self._delta_spill()
+        lengths = []
+        start = len(self.doc_len)
+        for i, doc in enumerate(docs):
+            counts = Counter(self.preprocess_func(doc.page_content))
+            self._delta_terms.extend(self.vocab.setdefault(t, len(self.vocab)) for t in counts)
+            self._delta_docs.extend([start + i] * len(counts))
+            self._delta_tfs.extend(counts.values())
+            record = json.dumps({"c": doc.page_content, "m": doc.metadata},
+                                ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            spill.write(record)
+            self._delta_offsets.append(self._delta_offsets[-1] + len(record))
+            parents.append(doc.metadata.get(id_key, ""))
+            if self._rows_by_parent is not None:
+                self._rows_by_parent.setdefault(parents[-1], []).append(start + i)
+            lengths.append(sum(counts.values()))
+        spill.flush()
+        if lengths:
+            self._append_docs(lengths)
+            self._delta_cache = None
+            self._avgdl = None
+
+    def delete_parents(self, parent_ids: Iterable[str]):
+        """按父块 ID 标记删除其全部子块 (save 时物理剔除)；父块 -> 行号映射首次删除时构建，之后每次只触及被删的行"""
+        stale = set(parent_ids)
+        if not stale:
+            return
+        if self._rows_by_parent is None:
+            self._rows_by_parent = {}
+            for row, parent in enumerate(self._load_parents()):
+                self._rows_by_parent.setdefault(parent, []).append(row)
+        rows = [r for p in stale for r in self._rows_by_parent.pop(p, ())]
+        self.alive[np.asarray(rows, dtype=np.int64)] = False
+        self._avgdl = None
+
+    # --- 查询 ---
+    def _delta(self):
+        """增量段按 term 排序后缓存，便于与主段同样地切片"""
+        if self._delta_cache is None:
+            if self._delta_terms:
+                # frombuffer 为零拷贝视图，排序后的花式索引产生副本，array 之后仍可继续追加
+                terms = np.frombuffer(self._delta_terms, dtype=np.int32)
+                order = np.argsort(terms, kind="stable")
+                self._delta_cache = (terms[order], np.frombuffer(self._delta_docs, dtype=np.int32)[order],
+                                     np.frombuffer(self._delta_tfs, dtype=np.float32)[order])
+                del terms
+            else:
+                empty = np.zeros(0, dtype=np.int32)
+                self._delta_cache = (empty, empty, np.zeros(0, dtype=np.float32))
+        return self._delta_cache
+
+    def _term_postings(self, tid: int) -> Tuple[np.ndarray, np.ndarray]:
+        docs, tfs = [], []
+        if tid < len(self.indptr) - 1:
+            lo, hi = self.indptr[tid], self.indptr[tid + 1]
+            docs.append(self.postings[lo:hi])
+            tfs.append(self.tfs[lo:hi])
+        d_terms, d_docs, d_tfs = self._delta()
+        lo, hi = np.searchsorted(d_terms, tid, "left"), np.searchsorted(d_terms, tid, "right")
+        if hi > lo:
+            docs.append(d_docs[lo:hi])
+            tfs.append(d_tfs[lo:hi])
+        if not docs:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        return np.concatenate(docs), np.concatenate(tfs)
+
+    def _term_weights(self, tid: int, n_alive: int) -> Tuple[np.ndarray, np.ndarray]:
+        """一个词的倒排段及其 BM25 权重 (未乘查询词频)"""
+        if self._avgdl is None:
+            self._avgdl = float(self.doc_len[self.alive].mean()) or 1.0
+        docs, tfs = self._term_postings(tid)
+        if not len(docs):
+            return docs, tfs
+        df = len(docs)
+        idf = np.log(1.0 + (n_alive - df + 0.5) / (df + 0.5))
+        dl = self.doc_len[docs]
+        return docs, idf * tfs * (self.k1 + 1) / (tfs + self.k1 * (1 - self.b + self.b * dl / self._avgdl))
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """返回 [(doc_idx, score)]，按分数降序"""
+        n_alive = len(self)
+        if n_alive == 0:
+            return []
+        q_terms = Counter(t for t in self.preprocess_func(query) if t in self.vocab)
+
+        all_docs, all_weights = [], []
+        for term, q_tf in q_terms.items():
+            docs, w = self._term_weights(self.vocab[term], n_alive)
+            if not len(docs):
+                continue
+            all_docs.append(docs)
+            all_weights.append(w * q_tf)
+        if not all_docs:
+            return []
+
+        docs = np.concatenate(all_docs)
+        cand, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_weights))
+        scores[~self.alive[cand]] = -np.inf
+        k = min(k, len(cand))
+        top = np.argpartition(-scores, k - 1)[:k]
+        # 同分时按子块序号取舍与排序 (cand 已升序)，结果确定且与 search_batch 一致
+        kth = scores[top].min()
+        top = np.concatenate([np.flatnonzero(scores > kth), np.flatnonzero(scores == kth)])[:k]
+        top = top[np.lexsort((cand[top], -scores[top]))]
+        return [(int(cand[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def search_batch(self, queries: Sequence[str], k: int) -> List[List[Tuple[int, float]]]:
+        """
+        多个查询一次打分，结果与逐条 search 相同。每个词的倒排段只读取、加权一次；
+        (查询, 子块) 分数按稀疏 COO 累加 (键 = 查询号 * 子块总数 + 子块号)，再按查询分组取 top-k。
+        """
+        results: List[List[Tuple[int, float]]] = [[] for _ in queries]
+        n_alive = len(self)
+        if n_alive == 0:
+            return results
+        weights = {}
+        rows, all_docs, all_weights = [], [], []
+        for qi, query in enumerate(queries):
+            for term, q_tf in Counter(t for t in self.preprocess_func(query) if t in self.vocab).items():
+                if term not in weights:
+                    weights[term] = self._term_weights(self.vocab[term], n_alive)
+                docs, w = weights[term]
+                if len(docs):
+                    rows.append(np.full(len(docs), qi, dtype=np.int64))
+                    all_docs.append(docs)
+                    all_weights.append(w * q_tf)
+        if not rows:
+            return results
+
+        n_docs = len(self.doc_len)
+        keys, inverse = np.unique(np.concatenate(rows) * n_docs + np.concatenate(all_docs), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_weights))
+        q_idx, d_idx = keys // n_docs, keys % n_docs
+        scores[~self.alive[d_idx]] = -np.inf
+        order = np.lexsort((d_idx, -scores, q_idx))  # 按查询分组，组内分数降序、同分按子块序号
+        starts = np.searchsorted(q_idx[order], np.arange(len(queries) + 1))
+        for qi in range(len(queries)):
+            top = order[starts[qi]:min(starts[qi + 1], starts[qi] + k)]
+            results[qi] = [(int(d_idx[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+        return results
+
+    def get_document(self, idx: int) -> Document:
+        if idx < self._n_base:
+            raw = self._blob[self.doc_offsets[idx]:self.doc_offsets[idx + 1]]
+        else:
+            raw = self._delta_record(idx - self._n_base)
+        obj = json.loads(raw)
+        return Document(page_content=obj["c"], metadata=obj["m"])
+
+    # --- 持久化 ---
+    def save(self):
+        """合并增量段、剔除已删除文档，并整体写出 (先写临时文件再替换)"""
+        os.makedirs(self.path, exist_ok=True)
+        parents = self._load_parents()
+        n_terms = len(self.vocab)
+        alive = self.alive
+
+        d_terms, d_docs, d_tfs = self._delta()
+        base_terms = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int32), np.diff(self.indptr))
+        terms = np.concatenate([base_terms, d_terms])
+        docs = np.concatenate([np.asarray(self.postings), d_docs])
+        tfs = np.concatenate([np.asarray(self.tfs), d_tfs])
+
+        keep = alive[docs]
+        remap = np.cumsum(alive, dtype=np.int64) - 1
+        terms, docs, tfs = terms[keep], remap[docs[keep]].astype(np.int32), tfs[keep]
+        order = np.lexsort((docs, terms))
+        terms, docs, tfs = terms[order], docs[order], tfs[order]
+        indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(terms, minlength=n_terms))
+
+        offsets = array("q", [0])
+
+        def write_records(f):
+            # 逐条流式写出，不在内存中拼接整个语料
+            for idx in np.flatnonzero(alive):
+                if idx < self._n_base:
+                    rec = self._blob[self.doc_offsets[idx]:self.doc_offsets[idx + 1]]
+                else:
+                    rec = self._delta_record(idx - self._n_base)
+                f.write(rec)
+                offsets.append(offsets[-1] + len(rec))
+
+        live_parents = [p for p, a in zip(parents, alive) if a]
+
+        def write(name, writer):
+            tmp = os.path.join(self.path, name + ".tmp")
+            with open(tmp, "wb") as f:
+                writer(f)
+            os.replace(tmp, os.path.join(self.path, name))
+
+        write("indptr.npy", lambda f: np.save(f, indptr))
+        write("postings.npy", lambda f: np.save(f, docs))
+        write("tfs.npy", lambda f: np.save(f, tfs))
+        write("doc_len.npy", lambda f: np.save(f, self.doc_len[alive]))
+        write("docs.bin", write_records)
+        write("doc_offsets.npy", lambda f: np.save(f, np.frombuffer(offsets, dtype=np.int64)))
+        vocab_terms = sorted(self.vocab, key=self.vocab.get)
+        write("vocab.txt", lambda f: f.write("\n".join(vocab_terms).encode("utf-8")))
+        write("parents.txt", lambda f: f.write("\n".join(live_parents).encode("utf-8")))
+        write("meta.json", lambda f: f.write(json.dumps({
+            "n_docs": len(live_parents), "n_terms": n_terms, "k1": self.k1, "b": self.b,
+            "tokenizer": self.tokenizer, "generation": uuid.uuid4().hex,
+        }).encode("utf-8")))
+        # 新主段已包含全部增量，旧 delta.npz 的 generation 不再匹配，删除即可
+        delta_path = os.path.join(self.path, "delta.npz")
+        if os.path.exists(delta_path):
+            os.remove(delta_path)
+
+        # 以新文件重新打开，释放增量段
+        fresh = SparseBM25Index.load(self.path)
+        if self._blob is not None:
+            self._blob.close()
+        if self._delta_file is not None:
+            self._delta_file.close()
+        self.__dict__.update(fresh.__dict__)
+
+    def save_delta(self):
+        """
+        只持久化上次 save() 以来的增量段与删除标记：整体写一个 delta.npz (fsync 后原子替换)，
+        开销与增量大小成正比，与语料规模无关 (实时索引的小事务)；尚无主段时退化为 save()。
+        """
+        if self.generation is None:
+            self.save()
+            return
+        base = self._n_base
+        parents = self._load_parents()
+        new_terms = list(islice(reversed(self.vocab), len(self.vocab) - self._n_terms_base))[::-1]
+        size = self._delta_offsets[-1]
+        blob = os.pread(self._delta_file.fileno(), size, 0) if size else b""
+        tmp = os.path.join(self.path, "delta.npz.tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, generation=np.array(self.generation), new_terms=np.array("\n".join(new_terms)),
+                     terms=np.array(self._delta_terms, dtype=np.int32), docs=np.array(self._delta_docs, dtype=np.int32),
+                     tfs=np.array(self._delta_tfs, dtype=np.float32), doc_len=self.doc_len[base:],
+                     dead=np.flatnonzero(~self.alive), parents=np.array("\n".join(parents[base:])),
+                     offsets=np.frombuffer(self._delta_offsets, dtype=np.int64).copy(),
+                     blob=np.frombuffer(blob, dtype=np.uint8))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.path, "delta.npz"))
+
+    @property
+    def n_delta(self) -> int:
+        """增量段子块数 (实时索引据此决定何时合并)"""
+        return len(self.doc_len) - self._n_base
+
+
+class SparseBM25Retriever(BaseRetriever):
+    """把 SparseBM25Index 适配为 LangChain 检索器，可直接放入 EnsembleRetriever"""
+
+    index: Any = None
+    k: int = 4
+
+    model_config = ConfigDict(
+        arbitrary_types_allowed=True,
+    )
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return [self.index.get_document(i) for i, _ in self.index.search(query, self.k)]
@@ -10,19 +10,38 @@ VAULT_PATH = "/mnt/c/Users/28232/Documents/Obsidian Vault"
 PERSIST_DIR = os.path.join(BASE_DIR, "storage_data")
 DB_PATH = os.path.join(PERSIST_DIR, "chroma_db")
 DOC_STORE_PATH = os.path.join(PERSIST_DIR, "doc_store")
+DOC_STORE_BACKEND = "packed"  # packed: 单文件追加存储 | files: 每个父块一个文件
 GRAPH_PATH = os.path.join(PERSIST_DIR, "knowledge_graph.pkl")
-BM25_PATH = os.path.join(PERSIST_DIR, "bm25.pkl")
+GRAPH_INDEX_DIR = os.path.join(PERSIST_DIR, "graph_index")  # 查询侧 CSR 图谱索引目录
+BM25_INDEX_DIR = os.path.join(PERSIST_DIR, "bm25_index")  # CSR 倒排索引目录
+VECTOR_INDEX_DIR = os.path.join(PERSIST_DIR, "vector_index")  # VECTOR_BACKEND="numpy" 时的量化向量索引目录
+MANIFEST_PATH = os.path.join(PERSIST_DIR, "manifest.json")  # 增量入库文件清单
+INDEX_VERSION_PATH = os.path.join(PERSIST_DIR, "index_version.json")  # 每次提交索引更新后递增，检索引擎据此热加载
 
 # 忽略的目录
 IGNORE_DIRS = {".obsidian", ".trash", ".git", ".idea", "node_modules"}
 
 # --- 2. 网络与模型配置 ---
-try:
-    # 获取 WSL 宿主机 IP
-    WINDOWS_IP = os.popen("ip route | grep default | awk '{print $3}'").read().strip()
-    if not WINDOWS_IP: WINDOWS_IP = "127.0.0.1"
-except:
-    WINDOWS_IP = "127.0.0.1"
+def _detect_host_ip():
+    """
+    获取 WSL 宿主机 IP (默认网关)。直接解析 /proc/net/route，不再在导入时启动 shell 子进程；
+    可用环境变量 RAG_HOST_IP 覆盖。结果在模块级缓存，每个进程只探测一次。
+    """
+    if os.environ.get("RAG_HOST_IP"):
+        return os.environ["RAG_HOST_IP"]
+    try:
+        with open("/proc/net/route") as f:
+            for line in f.readlines()[1:]:
+                fields = line.split()
+                if len(fields) > 2 and fields[1] == "00000000":  # 目标 0.0.0.0 即默认路由
+                    gw = bytes.fromhex(fields[2])[::-1]  # 小端十六进制
+                    return ".".join(str(b) for b in gw)
+    except (OSError, ValueError):
+        pass
+    return "127.0.0.1"
+
+# 获取 WSL 宿主机 IP
+WINDOWS_IP = _detect_host_ip()
 
 OLLAMA_BASE_URL = f"http://{WINDOWS_IP}:11434"
 
@@ -32,7 +51,97 @@ LLM_MODEL_NAME = "qwen2.5:7b"
 
 # --- 核心：补全 Reranker 物理路径 (报错就是因为少了这一行) ---
 RERANKER_MODEL_PATH = "/home/reusnak/neuro-symbolic-rag/models/bge-reranker-v2-m3"
+# CPU 推理后端: torch (fp32) | int8 (torch 动态量化) | onnx | onnx-int8 | lexical (无模型，基准用)；失败自动回退 torch
+RERANKER_BACKEND = "torch"
+RERANKER_ONNX_DIR = os.path.join(BASE_DIR, "models", "onnx")  # ONNX 导出缓存
+RERANK_THREADS = os.cpu_count() or 4  # CPU 推理线程数
 
-# --- 3. 检索参数 ---
+# --- 3. 切分与检索参数 ---
+PARENT_CHUNK_SIZE = 1000     # 父块：提供给 LLM 的完整语义上下文 (字符)
+PARENT_CHUNK_OVERLAP = 100
+CHILD_CHUNK_SIZE = 200       # 子块：用于精确向量匹配 (字符)
+CHILD_CHUNK_OVERLAP = 20
+SPLITTER = "structured"      # structured: 单遍解析，父子块带原文偏移 (start/end) | langchain: 标题预切 + 两级 RecursiveCharacterTextSplitter
 RETRIEVAL_K = 10     # 向量检索初步召回数量
-RERANK_TOP_K = 3     # 最终提供给 LLM 的上下文数量
\ No newline at end of file
+RERANK_TOP_K = 3     # 最终提供给 LLM 的上下文数量
+RECALL_WEIGHTS = [0.3, 0.7]  # 混合召回 RRF 权重 [BM25, 向量]
+BM25_TIMEOUT = 2.0           # 各路召回超时 (秒)，超时的一路被跳过
+VECTOR_TIMEOUT = 5.0
+VECTOR_BACKEND = "chroma"    # chroma | numpy (vector_index.py：int8 量化 memmap + IVF，候选全精度重打分)
+VECTOR_QUANT = "int8"        # numpy 后端的检索编码: int8 (每维标量量化) | float16
+VECTOR_DIM = None            # Matryoshka 截断：只用前 N 维做粗排 (需嵌入模型支持，如 nomic v1.5)；None 为全维
+VECTOR_IVF_LISTS = None      # IVF 分桶数；None 时取 sqrt(子块数)
+VECTOR_IVF_MIN = 50000       # 子块数低于此值时不分桶，直接全量扫描量化编码
+VECTOR_NPROBE = 16           # 每次查询扫描的最近桶数
+VECTOR_RESCORE = 4           # 粗排保留 k * VECTOR_RESCORE 个候选做全精度重打分
+RERANK_ON = "parent"       # 精排对象: parent (完整父块) | child (较短的子块，更快)
+RERANK_BATCH_SIZE = 16     # 交叉编码器单次前向的 pair 数
+RERANK_MAX_LENGTH = 512    # 交叉编码器截断长度 (token)
+RERANK_CACHE_SIZE = 10000  # (查询, 文档) -> 分数 LRU 缓存条目数
+CONTEXT_PACKING = True       # 按 token 预算打包上下文 (去重叠、合并相邻章节)；False 时拼接前 RERANK_TOP_K 个父块
+CONTEXT_TOKEN_BUDGET = 1500  # 背景知识的 token 上限 (不含系统提示与问题)
+CONTEXT_CANDIDATES = 8       # 参与打包的精排候选父块数
+CONTEXT_TOKENIZER = None     # 生成模型的 tokenizer.json (或其目录)，如 Qwen2.5；None 时按字符数估算
+CONTEXT_TOKEN_CACHE = 20000  # token 计数 LRU 条目数 (按正文缓存)
+FUSED_ROUTE_REWRITE = False  # True: 路由+重写合并为一次 LLM 调用 (不再投机检索)
+SPECULATIVE_REWRITE = True   # 投机检索前先重写查询 (重写与路由并发)；False 时直接用原始问题检索，省一次 LLM 调用但不做重写
+BM25_TOKENIZER = "bigram"  # 关键词分词: bigram (中文二元组) | jieba | whitespace (旧行为)
+GRAPH_TOP_N = 10              # 图谱索引为每个笔记预计算的邻居数 (按度数排序)
+GRAPH_EXPAND = True           # 将命中笔记的 1 跳双链邻居的父块加入精排候选
+GRAPH_EXPAND_NEIGHBORS = 3    # 每个命中笔记取前 N 个邻居
+GRAPH_EXPAND_PARENTS = 2      # 每个邻居笔记最多取前 N 个父块
+GRAPH_EXPAND_MAX = 8          # 图谱扩展候选总数上限
+
+# --- 4. 入库参数 ---
+LOAD_BATCH_SIZE = 64     # 流式加载时每批交给切分/向量化的原始文档数
+LOAD_WORKERS = os.cpu_count() or 4  # PDF 解析进程数
+PDF_PAGES_PER_TASK = 32  # 大 PDF 按页拆分的任务粒度
+EMBED_BATCH_SIZE = 512   # 每次 embed_documents 请求的子块数量
+EMBED_CONCURRENCY = 4    # 同时在途的嵌入请求数
+INGEST_SHARDS = 1        # >1 时按文件哈希分片，多进程并行入库后合并
+OLLAMA_ENDPOINTS = [OLLAMA_BASE_URL]  # 分片 i 使用 OLLAMA_ENDPOINTS[i % len]，可填多台机器
+SHARD_WORK_DIR = os.path.join(BASE_DIR, "shard_work")  # 分片中间结果与检查点 (不能放在 PERSIST_DIR 内)
+SHARD_CHECKPOINT_FILES = 200  # 每处理多少个文件写一次分片检查点
+MERGE_PAGE_SIZE = 2000        # 合并时每页从分片 Chroma 读取的子块数
+
+# --- 5. 嵌入缓存 (放在 PERSIST_DIR 之外，全量重建时保留) ---
+EMBED_CACHE_ENABLED = True
+EMBED_CACHE_DIR = os.path.join(BASE_DIR, "embed_cache")
+EMBED_CACHE_MAX_ENTRIES = 2_000_000  # nomic 768 维约 6GB 上限，按需调小
+
+# --- 6. 问答缓存 ---
+ANSWER_CACHE_SIZE = 1000          # 最多缓存的问答条数 (LRU)
+ANSWER_CACHE_TTL = 24 * 3600      # 条目有效期 (秒)
+ANSWER_CACHE_THRESHOLD = 0.95     # 查询向量余弦相似度阈值 (语义近似命中)
+ANSWER_CACHE_INVALIDATION_LOG = os.path.join(PERSIST_DIR, "answer_cache_invalidations.log")
+
+# --- 7. 启动 ---
+WARMUP_IN_BACKGROUND = True  # 检索组件与精排模型在后台线程加载，首个查询等待就绪
+
+# --- 8. 查询服务 (server.py) ---
+SERVE_HOST = "0.0.0.0"
+SERVE_PORT = 8765
+SERVE_MAX_INFLIGHT = 32     # 同时处理的请求上限，超出直接返回 503 (准入控制)
+SERVE_MAX_QUEUE = 256       # 每个微批队列的最大排队深度
+SERVE_BATCH_WAIT_MS = 5.0   # 微批收集窗口 (毫秒)
+SERVE_EMBED_BATCH = 64      # 单次合并的查询嵌入数
+SERVE_RERANK_BATCH = 16     # 单次合并的精排请求数 (每个请求含约 RETRIEVAL_K 个 pair)
+
+# --- 9. 追踪与指标 (tracing.py) ---
+TRACE_ENABLED = True     # 关闭后 span 退化为共享空对象，开销可忽略
+TRACE_JSONL_PATH = None  # 如 os.path.join(BASE_DIR, "traces", "query_trace.jsonl")：每次查询追加一行完整追踪
+TRACE_KEEP = 100         # 内存中保留的最近追踪条数
+
+# --- 10. 离线批量检索 (batch_search.py) ---
+BATCH_QUERY_SIZE = 256     # 每批交给 search_batch 的查询数 (各阶段在整批上合并执行)
+BATCH_RERANK_SIZE = 64     # 批量检索时交叉编码器单次前向的 pair 数 (离线任务不受单次延迟约束)
+
+# --- 11. 实时索引 (live_index.py / ingest.py --watch) ---
+WATCH_MODE = "auto"          # auto: WSL 下 /mnt/* 挂载 (收不到 Windows 侧写入的 inotify 事件) 轮询，其余 inotify | inotify | poll
+WATCH_POLL_INTERVAL = 2.0    # 轮询模式扫描间隔 (秒)
+WATCH_DEBOUNCE = 2.0         # 最后一次变更后静默多久才提交 (秒)，合并编辑器连续保存产生的事件
+WATCH_MAX_DELAY = 30.0       # 持续编辑时最长等待 (秒)，超过即强制提交，索引延迟有上界
+WATCH_MAX_BATCH = 20         # 单个事务最多处理的文件数，大批变更拆成多个小事务依次提交
+WATCH_COMPACT_FILES = 2000   # 事务只写增量段；累计变更这么多文件后，在队列空闲时合并进主段 (整体重写各索引)
+WATCH_COMPACT_INTERVAL = 600.0  # 有未合并增量时最长多久 (秒) 合并一次，同样只在队列空闲时执行
+LIVE_RELOAD_INTERVAL = 1.0   # 检索引擎检查索引版本的最小间隔 (秒)，发现新版本后在下一次查询前热加载
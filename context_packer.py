@@ -0,0 +1,192 @@
+# 职责：上下文打包 —— 在 token 预算内按「精排分数 / token」挑选父块，去除同源父块间的重叠并合并相邻章节。
+import os
+import re
+import math
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+import config
+
+_CJK = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")
+MIN_OVERLAP = 20  # 短于此的首尾重合视为巧合，不做裁剪
+
+
+@lru_cache(maxsize=1)
+def _load_tokenizer(path: Optional[str]):
+    """按需加载 HF tokenizers (只在配置了 CONTEXT_TOKENIZER 时导入)"""
+    if not path:
+        return None
+    try:
+        from tokenizers import Tokenizer
+        return Tokenizer.from_file(os.path.join(path, "tokenizer.json") if os.path.isdir(path) else path)
+    except Exception as e:
+        print(f"⚠️ 上下文分词器加载失败: {e}，改用字符数估算")
+        return None
+
+
+def _count_tokens(text: str) -> int:
+    """
+    生成模型视角的 token 数。配置了 CONTEXT_TOKENIZER 时精确计数，
+    否则估算 (Qwen 系列约 1.4 个汉字 / token，其他字符约 3.5 个 / token)。
+    """
+    tokenizer = _load_tokenizer(config.CONTEXT_TOKENIZER)
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    cjk = len(_CJK.findall(text))
+    return math.ceil(cjk / 1.4 + (len(text) - cjk) / 3.5)
+
+
+# 父块正文与来源标题会被反复打包，按正文缓存；一次性的整段上下文直接调用 _count_tokens
+count_tokens = lru_cache(maxsize=config.CONTEXT_TOKEN_CACHE)(_count_tokens)
+
+
+def _overlap(a: str, b: str, max_overlap: int) -> int:
+    """a 的后缀与 b 的前缀重合的最大长度 (父块切分的 chunk_overlap 区域)"""
+    for k in range(min(len(a), len(b), max_overlap), MIN_OVERLAP - 1, -1):
+        if a.endswith(b[:k]):
+            return k
+    return 0
+
+
+def _relevance(scores: Sequence[float]) -> List[float]:
+    """精排分数映射到 [0, 1]：交叉编码器若输出 logit 则过一次 sigmoid"""
+    if all(0.0 <= s <= 1.0 for s in scores):
+        return [float(s) for s in scores]
+    return [1 / (1 + math.exp(-s)) for s in scores]
+
+
+def _header(doc: Document) -> str:
+    path = " -> ".join(h for h in (doc.metadata.get("H1", ""), doc.metadata.get("H2", "")) if h)
+    return f" -> {path}" if path else ""
+
+
+class ContextPacker:
+    """
+    pack(ranked) 的三步：
+    1. 去重：同源父块中被另一块完整包含的丢弃 (父块带原文偏移时按区间判断)；
+    2. 选择：最高分必选，其余按 相关度 / 增量 token 降序装入预算 (与已选同源块重叠的部分不计成本)；
+    3. 组装：同一来源的入选父块按原文顺序 (parent_seq) 排列，相邻或首尾重叠的合并为一段、只保留一个来源标题。
+    """
+
+    def __init__(self, budget: int = config.CONTEXT_TOKEN_BUDGET,
+                 max_overlap: int = 2 * config.PARENT_CHUNK_OVERLAP):
+        self.budget = budget
+        self.max_overlap = max_overlap
+
+    @staticmethod
+    def _key(doc: Document):
+        return doc.metadata.get("path") or doc.metadata.get("source", "")
+
+    @staticmethod
+    def _offsets(doc: Document) -> Optional[Tuple[int, int]]:
+        start, end = doc.metadata.get("start"), doc.metadata.get("end")
+        return None if start is None or end is None else (start, end)
+
+    def _ov(self, a: Document, b: Document) -> int:
+        """a 尾部与 b 头部重叠的字符数：结构化切分的父块带原文偏移，可直接相减；否则比较文本"""
+        oa, ob = self._offsets(a), self._offsets(b)
+        if oa is not None and ob is not None:
+            return max(0, min(oa[1], ob[1]) - ob[0]) if oa[0] <= ob[0] < oa[1] else 0
+        return _overlap(a.page_content, b.page_content, self.max_overlap)
+
+    def _contains(self, outer: Document, inner: Document) -> bool:
+        oo, oi = self._offsets(outer), self._offsets(inner)
+        if oo is not None and oi is not None:
+            return oo[0] <= oi[0] and oi[1] <= oo[1]
+        return inner.page_content in outer.page_content
+
+    def _joins(self, a: Document, b: Document) -> Tuple[bool, int]:
+        """(b 是否可接在 a 之后, 重叠字符数)；相邻判断依赖入库时记录的 parent_seq，旧索引只能靠文本重叠"""
+        if self._key(a) != self._key(b):
+            return False, 0
+        ov = self._ov(a, b)
+        sa, sb = a.metadata.get("parent_seq"), b.metadata.get("parent_seq")
+        return ov > 0 or (sa is not None and sb is not None and sb == sa + 1), ov
+
+    def _cost(self, doc: Document, chosen: List[Document]) -> int:
+        tokens = count_tokens(doc.page_content)
+        saved, attached = 0, False
+        for other in chosen:
+            for a, b in ((other, doc), (doc, other)):
+                joined, ov = self._joins(a, b)
+                if joined:
+                    attached = True
+                    saved = max(saved, tokens * ov // max(len(doc.page_content), 1))
+        header = 0 if attached else count_tokens(f"【来源: {doc.metadata.get('source', '未知')}{_header(doc)}】")
+        return tokens - saved + header
+
+    def pack(self, ranked: Sequence[Tuple[Document, float]],
+             hint: Optional[Callable[[str, set], str]] = None) -> Tuple[str, List[str], Dict[str, int]]:
+        """返回 (上下文, 入选父块 ID, 统计)；hint(source, seen_sources) 生成图谱关联提示"""
+        docs = [d for d, _ in ranked]
+        rel = dict(zip((id(d) for d in docs), _relevance([s for _, s in ranked])))
+
+        # 1. 去重
+        kept = []
+        for doc in docs:
+            key = self._key(doc)
+            if any(self._key(k) == key and self._contains(k, doc) for k in kept):
+                continue
+            kept.append(doc)
+        dropped = len(docs) - len(kept)
+
+        # 2. 选择
+        chosen: List[Document] = []
+        used = 0
+        remaining = list(kept)
+        while remaining:
+            costs = [(self._cost(d, chosen), d) for d in remaining]
+            if chosen:
+                cost, best = max(costs, key=lambda c: rel[id(c[1])] / max(c[0], 1))
+            else:
+                cost, best = costs[0]  # 最高分必选
+            remaining.remove(best)
+            if chosen and used + cost > self.budget:
+                continue
+            chosen.append(best)
+            used += cost
+
+        # 3. 组装：来源按组内最高分排序，组内按原文顺序
+        groups: Dict[str, List[Document]] = {}
+        for doc in chosen:
+            groups.setdefault(self._key(doc), []).append(doc)
+        ordered = sorted(groups.values(), key=lambda g: -max(rel[id(d)] for d in g))
+
+        parts, seen, merged = [], set(), 0
+        for group in ordered:
+            group.sort(key=lambda d: (d.metadata.get("parent_seq", 0), docs.index(d)))
+            segments = [[group[0]]]
+            for doc in group[1:]:
+                if self._joins(segments[-1][-1], doc)[0]:
+                    segments[-1].append(doc)
+                    merged += 1
+                else:
+                    segments.append([doc])
+            for seg in segments:
+                first = seg[0]
+                src = first.metadata.get("source", "未知")
+                seen.add(src)
+                text = first.page_content
+                for prev, doc in zip(seg, seg[1:]):
+                    ov = self._ov(prev, doc)
+                    if _header(doc) != _header(prev):
+                        text += f"\n\n【{_header(doc)[4:] or src}】\n{doc.page_content}"
+                    else:
+                        text += ("" if ov else "\n") + doc.page_content[ov:]
+                graph_info = hint(src, seen) if hint is not None else ""
+                parts.append(f"【来源: {src}{_header(first)}】\n{text}{graph_info}")
+
+        context = "\n\n".join(parts)
+        baseline = sum(count_tokens(f"【来源: {d.metadata.get('source', '未知')}{_header(d)}】\n{d.page_content}")
+                       for d in docs[:config.RERANK_TOP_K])
+        stats = {
+            "候选": len(docs),
+            "入选": len(chosen),
+            "去重": dropped,
+            "合并": merged,
+            "上下文token": _count_tokens(context),
+            "基线token": baseline,  # 旧行为：直接拼接前 RERANK_TOP_K 个父块
+        }
+        return context, [d.id for d in chosen], stats
@@ -0,0 +1,291 @@
+# 职责：磁盘持久化的嵌入缓存，按 (模型名, 文本哈希) 复用向量，入库与查询共用。
+import os
+import re
+import json
+import atexit
+import hashlib
+import heapq
+import struct
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+import config
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    包装任意 Embeddings：
+    - 向量以 float32 存在按模型划分的 memmap 文件中；key -> 槽位记在追加式二进制日志 slots.log，
+      每次落盘只追加新增 / 淘汰 / 最近命中的记录，不重写整张映射表
+    - 条目数达到 max_entries 时按 LRU 批量淘汰；被淘汰的槽位要等墓碑记录落盘后才复用，
+      崩溃后旧日志不会把已淘汰的 key 指向被其他文本覆盖的向量
+    - 线程安全：缓存读写持锁，未命中的嵌入请求在锁外进行
+    """
+
+    GROW_STEP = 4096     # memmap 每次扩容的最小行数
+    EVICT_RATIO = 0.1    # 满载时一次淘汰的比例，避免每次插入都扫描
+    FLUSH_EVERY = 10000  # 新增多少条后自动落盘
+    RECORD = struct.Struct("<c20sI")  # 日志记录：key 前缀 (d / q) + sha1 摘要 + 槽位
+    TOMBSTONE = 0xFFFFFFFF
+    COMPACT_MIN = 100_000  # 日志记录数超过 2 倍存活条目且多于该值时重写日志
+
+    def __init__(self, base: Embeddings, model_name: str,
+                 cache_dir: str = config.EMBED_CACHE_DIR,
+                 max_entries: int = config.EMBED_CACHE_MAX_ENTRIES):
+        self.base = base
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.dir = os.path.join(cache_dir, re.sub(r"[^\w.-]", "_", model_name))
+        self.vec_path = os.path.join(self.dir, "vectors.f32")
+        self.meta_path = os.path.join(self.dir, "meta.json")
+        self.log_path = os.path.join(self.dir, "slots.log")
+        self.legacy_index_path = os.path.join(self.dir, "index.json")  # 旧版 JSON 全量映射，加载时迁移
+        os.makedirs(self.dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._dirty = 0
+        self._tick = 0
+        self.dim: Optional[int] = None
+        self.capacity = 0
+        self._next_slot = 0
+        self.slots: Dict[str, List[int]] = {}  # key -> [slot, last_used]
+        self.free: List[int] = []
+        self._evicted: List[int] = []        # 已淘汰、墓碑尚未落盘的槽位 (暂不可复用)
+        self._journal: List[bytes] = []      # 待追加的日志记录 (新增 / 墓碑)
+        self._touched: set = set()           # 上次落盘以来命中过的 key，落盘时追加记录以保留 LRU 顺序
+        self._log_records = 0
+        self.vectors: Optional[np.memmap] = None
+        self._load()
+        atexit.register(self.flush)
+
+    # --- 持久化 ---
+    def _record(self, key: str, slot: int) -> bytes:
+        return self.RECORD.pack(key[0].encode(), bytes.fromhex(key[2:]), slot)
+
+    def _load(self):
+        if not os.path.exists(self.vec_path):
+            return
+        try:
+            if not os.path.exists(self.meta_path):
+                if os.path.exists(self.legacy_index_path):
+                    self._import_legacy()
+                return
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dim = meta["dim"]
+            self.capacity = os.path.getsize(self.vec_path) // (self.dim * 4)
+            next_slot = meta["next_slot"]
+            data = b""
+            if os.path.exists(self.log_path):
+                with open(self.log_path, "rb") as f:
+                    data = f.read()
+            n = len(data) // self.RECORD.size
+            if n * self.RECORD.size != len(data):
+                with open(self.log_path, "r+b") as f:
+                    f.truncate(n * self.RECORD.size)  # 丢弃崩溃时写了一半的尾部记录
+            slots = {}
+            for tick, (prefix, digest, slot) in enumerate(self.RECORD.iter_unpack(data[:n * self.RECORD.size]), 1):
+                key = f"{prefix.decode()}:{digest.hex()}"
+                if slot == self.TOMBSTONE:
+                    slots.pop(key, None)
+                elif slot < self.capacity:
+                    slots[key] = [slot, tick]
+                    next_slot = max(next_slot, slot + 1)
+            self.slots, self._tick, self._log_records = slots, n, n
+            self._next_slot = min(next_slot, self.capacity)
+            used = {s for s, _ in self.slots.values()}
+            self.free = [i for i in range(self._next_slot) if i not in used]
+            self.vectors = np.memmap(self.vec_path, dtype=np.float32, mode="r+",
+                                     shape=(self.capacity, self.dim))
+        except Exception as e:
+            print(f"⚠️ 嵌入缓存加载失败: {e}，将重建缓存")
+            self.dim, self.capacity, self.slots, self.free, self.vectors = None, 0, {}, [], None
+            self._next_slot = 0
+
+    def _import_legacy(self):
+        """旧版 index.json (key -> [槽位, 最近使用]) 一次性迁移为 meta.json + slots.log"""
+        with open(self.legacy_index_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.dim, self.capacity = meta["dim"], meta["capacity"]
+        self._next_slot = meta["next_slot"]
+        self.slots = meta["slots"]
+        used = {s for s, _ in self.slots.values()}
+        self.free = [i for i in range(self._next_slot) if i not in used]
+        self.vectors = np.memmap(self.vec_path, dtype=np.float32, mode="r+",
+                                 shape=(self.capacity, self.dim))
+        self._compact_log()
+        self._write_meta()
+        os.remove(self.legacy_index_path)
+        print(f"🧊 嵌入缓存索引已迁移为追加日志 ({len(self.slots)} 条)")
+
+    def _write_meta(self):
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_name, "dim": self.dim, "next_slot": self._next_slot}, f)
+        os.replace(tmp, self.meta_path)
+
+    def _compact_log(self):
+        """按最近使用顺序重写日志 (只含存活条目)，原子替换"""
+        live = sorted(self.slots.items(), key=lambda kv: kv[1][1])
+        tmp = self.log_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"".join(self._record(key, slot) for key, (slot, _) in live))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.log_path)
+        self._log_records = len(live)
+
+    def _flush_locked(self):
+        if self.vectors is None:
+            return
+        # 先落盘向量，再追加引用它们的日志记录：日志中出现的槽位内容一定已写好
+        self.vectors.flush()
+        records = self._journal + [self._record(k, self.slots[k][0]) for k in self._touched if k in self.slots]
+        if self._log_records + len(records) > max(2 * len(self.slots), self.COMPACT_MIN):
+            self._compact_log()
+        elif records:
+            with open(self.log_path, "ab") as f:
+                f.write(b"".join(records))
+                f.flush()
+                os.fsync(f.fileno())
+            self._log_records += len(records)
+        self._write_meta()
+        # 墓碑已持久化，淘汰的槽位此后才可复用
+        self.free.extend(self._evicted)
+        self._evicted, self._journal, self._touched = [], [], set()
+        self._dirty = 0
+
+    def flush(self):
+        """将向量与新增日志落盘"""
+        with self._lock:
+            self._flush_locked()
+
+    # --- 槽位管理 (调用方持锁) ---
+    def _ensure_storage(self, dim: int):
+        if self.dim is None or self.dim != dim:
+            # 首次写入或模型维度变化：重置缓存
+            self.dim, self.capacity, self._next_slot = dim, 0, 0
+            self.slots, self.free, self._evicted, self._journal, self._touched = {}, [], [], [], set()
+            for path in (self.vec_path, self.log_path, self.legacy_index_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._log_records = 0
+            self.vectors = None
+
+    def _grow(self):
+        new_cap = min(self.max_entries, max(self.capacity * 2, self.GROW_STEP))
+        if self.vectors is not None:
+            self.vectors.flush()
+            del self.vectors
+        with open(self.vec_path, "ab") as f:
+            f.truncate(new_cap * self.dim * 4)
+        self.capacity = new_cap
+        self.vectors = np.memmap(self.vec_path, dtype=np.float32, mode="r+",
+                                 shape=(self.capacity, self.dim))
+
+    def _evict(self):
+        n = max(1, int(self.max_entries * self.EVICT_RATIO))
+        oldest = heapq.nsmallest(n, self.slots.items(), key=lambda kv: kv[1][1])
+        for key, (slot, _) in oldest:
+            del self.slots[key]
+            self._evicted.append(slot)
+            self._journal.append(self._record(key, self.TOMBSTONE))
+
+    def _alloc(self) -> int:
+        if self.free:
+            return self.free.pop()
+        if self._next_slot >= self.capacity:
+            if self.capacity < self.max_entries:
+                self._grow()
+            else:
+                self._evict()
+                self._flush_locked()  # 墓碑落盘后淘汰的槽位才进入 free
+                return self.free.pop()
+        slot = self._next_slot
+        self._next_slot += 1
+        return slot
+
+    # --- 缓存读写 ---
+    @staticmethod
+    def _key(prefix: str, text: str) -> str:
+        return prefix + hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> List[Optional[List[float]]]:
+        found = []
+        with self._lock:
+            for key in keys:
+                entry = self.slots.get(key)
+                if entry is None:
+                    found.append(None)
+                    self.misses += 1
+                    continue
+                self._tick += 1
+                entry[1] = self._tick
+                self._touched.add(key)
+                found.append(self.vectors[entry[0]].tolist())
+                self.hits += 1
+        return found
+
+    def _store(self, keys: List[str], vectors: List[List[float]]):
+        if not vectors:
+            return
+        arr = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            self._ensure_storage(arr.shape[1])
+            for key, vec in zip(keys, arr):
+                if key in self.slots:
+                    continue
+                slot = self._alloc()
+                self.vectors[slot] = vec
+                self._tick += 1
+                self.slots[key] = [slot, self._tick]
+                self._journal.append(self._record(key, slot))
+            self._dirty += len(keys)
+            if self._dirty >= self.FLUSH_EVERY:
+                self._flush_locked()
+
+    def _embed_cached(self, texts: List[str], prefix: str, embed_fn) -> List[List[float]]:
+        keys = [self._key(prefix, t) for t in texts]
+        results = self._lookup(keys)
+
+        # 未命中的文本去重后一次性请求底层模型
+        missing: Dict[str, str] = {}
+        for key, text, vec in zip(keys, texts, results):
+            if vec is None:
+                missing.setdefault(key, text)
+        if missing:
+            miss_keys = list(missing)
+            fresh = embed_fn([missing[k] for k in miss_keys])
+            self._store(miss_keys, fresh)
+            by_key = dict(zip(miss_keys, fresh))
+            results = [vec if vec is not None else list(by_key[k]) for k, vec in zip(keys, results)]
+        return results
+
+    # --- Embeddings 接口 ---
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_cached(texts, "d:", self.base.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_cached([text], "q:", lambda t: [self.base.embed_query(t[0])])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """批量查询嵌入 (离线批量检索)：与 embed_query 共用查询缓存，未命中的合并为一次请求"""
+        return self._embed_cached(texts, "q:", self.base.embed_documents)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.slots),
+        }
+
+    def report(self) -> str:
+        s = self.stats()
+        return f"🧊 嵌入缓存: 命中 {s['hits']} / 未命中 {s['misses']} (命中率 {s['hit_rate']:.1%}) | 条目 {s['entries']}"
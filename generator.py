@@ -1,54 +1,139 @@
 # 职责：负责逻辑路由（Router）、查询重写（Rewriter）和最终答案生成（LLM）。
+import time
 from langchain_ollama import ChatOllama
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
 import config
+from tracing import tracer
+
+
+def _traced_stream(chunks):
+    """生成 span：记录首字延迟与流出的片段数"""
+    with tracer.span("生成") as span:
+        t0, first = time.perf_counter(), True
+        for chunk in chunks:
+            if first:
+                span.set(首字ms=round((time.perf_counter() - t0) * 1000))
+                first = False
+            span.count("生成片段")
+            yield chunk
+
+
+async def _atraced_stream(chunks):
+    with tracer.span("生成") as span:
+        t0, first = time.perf_counter(), True
+        async for chunk in chunks:
+            if first:
+                span.set(首字ms=round((time.perf_counter() - t0) * 1000))
+                first = False
+            span.count("生成片段")
+            yield chunk
+
 
 class RAGGenerator:
-    def __init__(self):
+    def __init__(self, base_url: str = config.OLLAMA_BASE_URL):
         # 统一使用配置中的模型地址和名称
         self.llm = ChatOllama(
             model=config.LLM_MODEL_NAME, 
-            base_url=config.OLLAMA_BASE_URL,
+            base_url=base_url,
             temperature=0  # 路由和重写需要高确定性
         )
 
-    def router(self, query: str) -> bool:
-        """
-        Agent 路由：判断是否需要检索本地笔记。
-        """
+    def _router_chain(self):
         prompt = ChatPromptTemplate.from_messages([
             ("system", "你是一个意图分类专家。判断用户输入是否需要查询其个人笔记或专业文档。"),
             ("human", "闲聊/简单问候 -> NO; 专业问题/具体事实/文档查询 -> YES。\n输入内容: {q}\n只输出 YES 或 NO:")
         ])
-        chain = prompt | self.llm | StrOutputParser()
+        return prompt | self.llm | StrOutputParser()
+
+    def router(self, query: str) -> bool:
+        """
+        Agent 路由：判断是否需要检索本地笔记。
+        """
+        chain = self._router_chain()
         try:
             result = chain.invoke({"q": query}).strip().upper()
             return "YES" in result
         except:
             return True # 默认检索以保证安全
 
+    async def arouter(self, query: str) -> bool:
+        """router 的异步版本，便于与检索并发执行"""
+        chain = self._router_chain()
+        try:
+            result = (await chain.ainvoke({"q": query})).strip().upper()
+            return "YES" in result
+        except:
+            return True
+
+    def _rewriter_chain(self):
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", "你是一个检索优化专家。请将用户的问题重写为 3-5 个适合检索的关键词组合。"),
+            ("human", "去除无意义助词，补充隐含的领域上下文。\n原始问题: {q}\n优化后关键词:")
+        ])
+        return prompt | self.llm | StrOutputParser()
+
+    @staticmethod
+    def _clean_rewrite(text: str) -> str:
+        # 清洗可能出现的引号或编号
+        return text.strip().replace('"', '').replace('1.', '')
+
     def rewriter(self, query: str) -> str:
         """
         查询重写：将口语化问题转化为更适合向量检索的专业关键词。
         """
+        return self._clean_rewrite(self._rewriter_chain().invoke({"q": query}))
+
+    async def arewriter(self, query: str) -> str:
+        """rewriter 的异步版本，便于与路由并发执行；失败或结果为空时返回原始问题"""
+        try:
+            return self._clean_rewrite(await self._rewriter_chain().ainvoke({"q": query})) or query
+        except Exception:
+            return query
+
+    async def aroute_and_rewrite(self, query: str):
+        """
+        路由 + 重写合并为一次结构化调用，省去一次 LLM 往返。
+        返回 (是否检索, 检索关键词)；解析失败时默认检索原始问题。
+        """
         prompt = ChatPromptTemplate.from_messages([
-            ("system", "你是一个检索优化专家。请将用户的问题重写为 3-5 个适合检索的关键词组合。"),
-            ("human", "去除无意义助词，补充隐含的领域上下文。\n原始问题: {q}\n优化后关键词:")
+            ("system", "你是一个检索路由与优化专家。判断用户输入是否需要查询其个人笔记或专业文档，"
+                       "若需要，再将问题重写为 3-5 个适合检索的关键词组合。"),
+            ("human", "闲聊/简单问候 -> NO; 专业问题/具体事实/文档查询 -> YES。\n输入内容: {q}\n"
+                      "只输出 JSON: {{\"retrieve\": \"YES\" 或 \"NO\", \"keywords\": \"关键词\"}}")
         ])
-        chain = prompt | self.llm | StrOutputParser()
-        # 清洗可能出现的引号或编号
-        rewritten = chain.invoke({"q": query}).strip().replace('"', '').replace('1.', '')
-        return rewritten
+        chain = prompt | self.llm | JsonOutputParser()
+        try:
+            result = await chain.ainvoke({"q": query})
+            need = "YES" in str(result.get("retrieve", "YES")).upper()
+            keywords = self._clean_rewrite(str(result.get("keywords") or query))
+            return need, keywords or query
+        except Exception:
+            return True, query
+
+    def _answer_chain(self, with_context: bool = True):
+        if with_context:
+            prompt = ChatPromptTemplate.from_messages([
+                ("system", "你是一个知识库助手。请根据提供的【背景知识】诚实地回答问题。如果知识库中没有相关信息，请直接说明，严禁编造。"),
+                ("human", "【背景知识】:\n{ctx}\n\n---\n【用户提问】: {q}")
+            ])
+        else:
+            # 路由判定无需检索 (闲聊) 时直接回答
+            prompt = ChatPromptTemplate.from_messages([
+                ("system", "你是一个友好的知识库助手。"),
+                ("human", "{q}")
+            ])
+        return prompt | self.llm | StrOutputParser()
 
     def generate_stream(self, query: str, context: str):
         """
         最终生成：基于检索到的上下文进行流式回答。
         """
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "你是一个知识库助手。请根据提供的【背景知识】诚实地回答问题。如果知识库中没有相关信息，请直接说明，严禁编造。"),
-            ("human", "【背景知识】:\n{ctx}\n\n---\n【用户提问】: {q}")
-        ])
         # 使用较低温度保证回答的稳定性
-        chain = prompt | self.llm | StrOutputParser()
-        return chain.stream({"ctx": context, "q": query})
\ No newline at end of file
+        chain = self._answer_chain()
+        return _traced_stream(chain.stream({"ctx": context, "q": query}))
+
+    def agenerate_stream(self, query: str, context: str = None):
+        """generate_stream 的异步版本；context 为 None 时不带背景知识直接回答"""
+        chain = self._answer_chain(with_context=context is not None)
+        return _atraced_stream(chain.astream({"ctx": context, "q": query}))
@@ -0,0 +1,198 @@
+# 职责：知识图谱的紧凑只读索引 (CSR 邻接 + 预计算 top-N 邻居 + 笔记 -> 父块映射)，查询路径无需 networkx。
+import os
+import json
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+class GraphIndex:
+    """
+    目录布局：
+    - names.txt                    每行一个节点名，行号即 node_id
+    - indptr.npy / indices.npy     CSR 无向邻接表
+    - degree.npy                   节点度数
+    - topn.npy                     (n, top_n) 预计算邻居，按邻居度数降序，-1 填充
+    - parent_indptr.npy / parent_ids.npy  笔记 -> 父块 ID (定长 bytes)
+    - meta.json                    含主段代号 generation
+    - delta.json                   实时索引写出的增量：节点名 -> {adj, attrs, neighbors, parents}，删除的节点为 null；
+                                   generation 匹配时覆盖主段中的同名节点，build() 时并入主段并删除
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.indptr = self.indices = self.degree = self.topn = None
+        self.parent_indptr = self.parent_ids = None
+        self.overlay: Dict[str, Optional[dict]] = {}
+
+    @classmethod
+    def load(cls, path: str) -> Optional["GraphIndex"]:
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        index = cls(path)
+        with open(os.path.join(path, "names.txt"), "r", encoding="utf-8") as f:
+            text = f.read()
+        index.names = text.split("\n") if text else []
+        index.ids = {name: i for i, name in enumerate(index.names)}
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        index.indptr, index.indices = load("indptr"), load("indices")
+        index.degree, index.topn = load("degree"), load("topn")
+        index.parent_indptr, index.parent_ids = load("parent_indptr"), load("parent_ids")
+        index.overlay = GraphIndex.read_delta(path)
+        return index
+
+    @staticmethod
+    def generation_of(path: str) -> Optional[str]:
+        """主段代号；索引不存在或由旧版本构建时为 None"""
+        try:
+            with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+                return json.load(f).get("generation")
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def read_delta(path: str) -> Dict[str, Optional[dict]]:
+        """读取与当前主段同代的增量节点 (无增量或已被 build() 合并时为空)"""
+        generation = GraphIndex.generation_of(path)
+        try:
+            with open(os.path.join(path, "delta.json"), "r", encoding="utf-8") as f:
+                delta = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return delta["nodes"] if generation and delta.get("generation") == generation else {}
+
+    @staticmethod
+    def write_delta(graph, nodes: Iterable[str], parents_by_source: Dict[str, List[str]], path: str,
+                    top_n: int = 10):
+        """
+        只为本次事务触及的节点 (变更笔记及其新旧链接目标) 写出邻接、top-N 邻居与父块，与已有增量合并后原子替换。
+        边只在笔记与其链接目标之间增删，因此邻接发生变化的节点都在 nodes 中；
+        其余节点的邻居排序 (依赖度数) 在下次 build() 合并时刷新。
+        """
+        generation = GraphIndex.generation_of(path)
+        delta = GraphIndex.read_delta(path)
+        for node in nodes:
+            if not graph.has_node(node):
+                delta[node] = None
+                continue
+            adj = list(graph.neighbors(node))
+            ranked = sorted((nb for nb in adj if nb != node), key=graph.degree, reverse=True)[:top_n]
+            delta[node] = {"adj": adj, "attrs": dict(graph.nodes[node]), "neighbors": ranked,
+                           "parents": parents_by_source.get(node, [])}
+        tmp = os.path.join(path, "delta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"generation": generation, "nodes": delta}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(path, "delta.json"))
+
+    @staticmethod
+    def build(graph, parents_by_source: Dict[str, List[str]], path: str, top_n: int = 10):
+        """由 networkx 图与「笔记 -> 父块 ID」映射构建索引 (仅在入库侧调用)"""
+        os.makedirs(path, exist_ok=True)
+        # 节点名中的换行会破坏 names.txt，统一替换为空格
+        names = [str(n).replace("\n", " ") for n in graph.nodes]
+        ids = {n: i for i, n in enumerate(graph.nodes)}
+        n = len(names)
+
+        rows, cols = [], []
+        for u, v in graph.edges:
+            if u == v:
+                continue
+            rows += [ids[u], ids[v]]
+            cols += [ids[v], ids[u]]
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int32)
+        order = np.lexsort((cols, rows))
+        rows, cols = rows[order], cols[order]
+        degree = np.bincount(rows, minlength=n).astype(np.int32)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(degree)
+
+        # 预计算 top-N 邻居：按邻居度数降序 (枢纽笔记优先)
+        topn = np.full((n, top_n), -1, dtype=np.int32)
+        for i in range(n):
+            nbrs = cols[indptr[i]:indptr[i + 1]]
+            if len(nbrs):
+                best = nbrs[np.argsort(-degree[nbrs], kind="stable")[:top_n]]
+                topn[i, :len(best)] = best
+
+        p_indptr = np.zeros(n + 1, dtype=np.int64)
+        flat: List[str] = []
+        for i, node in enumerate(graph.nodes):
+            flat.extend(parents_by_source.get(node, []))
+            p_indptr[i + 1] = len(flat)
+        width = max((len(p) for p in flat), default=1)
+        p_ids = np.asarray([p.encode("ascii") for p in flat], dtype=f"S{width}")
+
+        def write(name, arr):
+            tmp = os.path.join(path, f"{name}.npy.tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, arr)
+            os.replace(tmp, os.path.join(path, f"{name}.npy"))
+
+        write("indptr", indptr)
+        write("indices", cols)
+        write("degree", degree)
+        write("topn", topn)
+        write("parent_indptr", p_indptr)
+        write("parent_ids", p_ids)
+        with open(os.path.join(path, "names.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(names))
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"nodes": n, "edges": int(len(cols) // 2), "top_n": top_n,
+                       "generation": uuid.uuid4().hex}, f)
+        # 新主段已包含全部增量
+        if os.path.exists(os.path.join(path, "delta.json")):
+            os.remove(os.path.join(path, "delta.json"))
+        print(f"🕸️ 图谱索引已构建: {n} 节点 / {len(cols) // 2} 边")
+
+    # --- 查询 ---
+    def has_node(self, name: str) -> bool:
+        if name in self.overlay:
+            return self.overlay[name] is not None
+        return name in self.ids
+
+    def neighbors(self, name: str, limit: Optional[int] = None) -> List[str]:
+        """预计算的 top-N 邻居 (按度数降序)"""
+        if name in self.overlay:
+            return (self.overlay[name] or {}).get("neighbors", [])[:limit]
+        i = self.ids.get(name)
+        if i is None:
+            return []
+        row = self.topn[i]
+        return [self.names[j] for j in row[row >= 0][:limit]]
+
+    def parents_of(self, name: str, limit: Optional[int] = None) -> List[str]:
+        if name in self.overlay:
+            return (self.overlay[name] or {}).get("parents", [])[:limit]
+        i = self.ids.get(name)
+        if i is None:
+            return []
+        lo, hi = self.parent_indptr[i], self.parent_indptr[i + 1]
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return [p.decode("ascii") for p in self.parent_ids[lo:hi]]
+
+    def expand(self, sources: Iterable[str], exclude: Iterable[str], neighbors_per_note: int,
+               parents_per_note: int, max_total: int) -> List[str]:
+        """为命中的笔记收集 1 跳邻居笔记的父块 ID，作为额外精排候选 (按 sources 的排名顺序展开，结果可复现)"""
+        exclude = set(exclude)
+        ordered = list(dict.fromkeys(sources))
+        seen_notes = set(ordered)  # 仅用于判重
+        result: List[str] = []
+        for src in ordered:
+            for nb in self.neighbors(src, neighbors_per_note):
+                if nb in seen_notes:
+                    continue
+                seen_notes.add(nb)
+                for pid in self.parents_of(nb, parents_per_note):
+                    if pid not in exclude:
+                        result.append(pid)
+                        exclude.add(pid)
+                        if len(result) >= max_total:
+                            return result
+        return result
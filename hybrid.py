@@ -0,0 +1,89 @@
+# 职责：混合召回 —— 并发执行多路检索器，带超时降级，并以向量化的加权 RRF 融合结果。
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+from tracing import tracer
+
+
+def weighted_rrf(result_lists: Sequence[List[Document]], weights: Sequence[float], c: int = 60) -> List[Document]:
+    """
+    加权倒数排名融合：score(d) = Σ w_i / (rank_i(d) + c)，按正文去重
+    (与 EnsembleRetriever 默认行为一致)，一次 np.add.at 完成累加。
+    """
+    index: Dict[str, int] = {}
+    docs: List[Document] = []
+    slots, contrib = [], []
+    for results, w in zip(result_lists, weights):
+        for rank, doc in enumerate(results, start=1):
+            slot = index.get(doc.page_content)
+            if slot is None:
+                slot = index[doc.page_content] = len(docs)
+                docs.append(doc)
+            slots.append(slot)
+            contrib.append(w / (rank + c))
+    if not docs:
+        return []
+    scores = np.zeros(len(docs))
+    np.add.at(scores, np.asarray(slots), np.asarray(contrib))
+    order = np.argsort(-scores, kind="stable")
+    return [docs[i] for i in order]
+
+
+class HybridRetriever:
+    """
+    并发召回：每路检索器在线程池中同时运行，各自有独立超时。
+    超时或异常的一路被丢弃 (例如嵌入服务缓慢时降级为仅 BM25)，其余结果照常融合。
+    """
+
+    def __init__(self, retrievers: Sequence, weights: Sequence[float], timeouts: Sequence[float],
+                 names: Optional[Sequence[str]] = None, c: int = 60):
+        self.retrievers = list(retrievers)
+        self.weights = list(weights)
+        self.timeouts = list(timeouts)
+        self.names = list(names) if names else [f"r{i}" for i in range(len(self.retrievers))]
+        self.c = c
+        # 超时的请求仍会占用线程直到返回，因此预留余量
+        self.pool = ThreadPoolExecutor(max_workers=4 * len(self.retrievers), thread_name_prefix="recall")
+        self.last_timings: Dict[str, float] = {}
+        self.last_degraded: List[str] = []
+
+    def invoke(self, query: str) -> List[Document]:
+        start = time.perf_counter()
+        # 复制上下文：各路召回的 span 归入调用方的追踪
+        futures = [self.pool.submit(contextvars.copy_context().run, self._timed, r, name, query)
+                   for r, name in zip(self.retrievers, self.names)]
+
+        results, weights = [], []
+        self.last_timings, self.last_degraded = {}, []
+        for name, fut, w, timeout in zip(self.names, futures, self.weights, self.timeouts):
+            remaining = max(0.0, start + timeout - time.perf_counter())
+            try:
+                docs, elapsed = fut.result(timeout=remaining)
+            except FutureTimeout:
+                print(f"⚠️ {name} 召回超时 ({timeout:.1f}s)，本次查询跳过该路")
+                self.last_degraded.append(name)
+                continue
+            except Exception as e:
+                print(f"⚠️ {name} 召回失败: {e}，本次查询跳过该路")
+                self.last_degraded.append(name)
+                continue
+            self.last_timings[name] = elapsed
+            results.append(docs)
+            weights.append(w)
+        if self.last_degraded:
+            tracer.current().set(降级="/".join(self.last_degraded))
+
+        return weighted_rrf(results, weights, self.c)
+
+    @staticmethod
+    def _timed(retriever, name: str, query: str):
+        t0 = time.perf_counter()
+        with tracer.span(f"召回/{name}") as span:
+            docs = retriever.invoke(query)
+            span.set(命中=len(docs))
+        return docs, (time.perf_counter() - t0) * 1000
@@ -1,34 +1,201 @@
 # 数据处理：串联 Loader, Splitter, Storage。
-from loader import ContentLoader
+import os
+import time
+import argparse
+import resource
+import config
+from answer_cache import AnswerCache
+from loader import ContentLoader, NoteIndex
+from manifest import FileManifest
 from splitter import TextSplitterFactory
 from storage import StorageManager
 
-def main():
-    print("🚀 启动数据入库流水线...")
-    
-    # 1. 初始化存储
-    storage = StorageManager()
-    storage.clear_data() # 如果需要增量更新，可以注释掉这行
+SUPPORTED_EXTS = (".md", ".pdf")
 
-    # 2. 加载文档 & 图谱
-    loader = ContentLoader()
-    raw_docs, graph = loader.load_vault()
-    
-    if not raw_docs:
+
+def _note_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _detach_links(graph, manifest, paths):
+    """
+    从图谱中移除 paths 对应笔记此前写出的双链边。
+    若对端笔记 (不在本次变更中) 也反向链接了它，则保留该无向边。
+    """
+    touched = set(paths)
+
+    def links_back(target, name):
+        # 对端笔记 (同名 md / pdf 任一，且不在本次变更中) 是否也链接了 name；按笔记名索引只查对端，不扫描整个清单
+        return any(p not in touched and name in manifest.entries[p].get("links", ())
+                   for p in manifest.paths_of(target))
+
+    for path in paths:
+        entry = manifest.entries.get(path)
+        if not entry or not graph.has_node(entry["source"]):
+            continue
+        name = entry["source"]
+        for target in entry.get("links", []):
+            if graph.has_edge(name, target) and not links_back(target, name):
+                graph.remove_edge(name, target)
+        # 无人引用的孤立节点直接删除；仍被引用的保留为悬空目标节点
+        if graph.degree(name) == 0:
+            graph.remove_node(name)
+        else:
+            graph.nodes[name].clear()
+
+
+def _record(manifest, paths, loader, id_map):
+    for path in paths:
+        manifest.update(path, _note_name(path), loader.links.get(path, []), id_map.get(path, []),
+                        loader.aliases.get(path, []))
+
+
+def full_ingest(storage, loader, splitter, paths):
+    """全量重建：清空索引后重新解析、切分、向量化整个仓库。返回索引是否变化 (已清空重建，恒为 True)"""
+    storage.clear_data()
+    AnswerCache.publish_invalidation(["*"])  # 父块 ID 全部重新生成
+    manifest = FileManifest()
+
+    # 1. 流式加载文档 & 图谱，边解析边预处理 (三段式切分时按 Header 预切)
+    batches = loader.iter_vault(paths=paths)
+    structured_docs = (d for batch in batches for d in splitter.pre_split(batch))
+
+    # 2. 存入向量库与 BM25 (Storage 内部会调用 Parent/Child Splitter)
+    id_map = storage.build_vector_bm25_index(structured_docs)
+    loader.report_parse_stats()
+
+    if not id_map:
         print("⚠️ 未找到文档，请检查 config.py 路径")
+        return True  # 旧索引已清空，运行中的检索引擎同样需要重新加载
+
+    # 3. 记录入库清单，供下次增量对比
+    _record(manifest, paths, loader, id_map)
+    manifest.save()
+
+    # 4. 保存图谱 (解析过程中已逐步构建) 并重建图谱索引
+    storage.save_graph(loader.graph, manifest.parents_by_source())
+    return True
+
+
+def incremental_ingest(storage, loader, splitter, paths, manifest):
+    """增量更新：仅重新解析新增/修改的文件，并清理已删除文件的数据。返回索引是否变化"""
+    changed, removed, unchanged = manifest.diff(paths)
+    print(f"📋 新增/修改 {len(changed)} | 删除 {len(removed)} | 未变化 {len(unchanged)}")
+
+    if not changed and not removed:
+        manifest.save()  # 保存被 touch 过的文件的新 mtime
+        print("✨ 索引已是最新，无需更新")
+        return False
+
+    apply_changes(storage, loader, splitter, manifest, changed, removed)
+    return True
+
+
+def apply_changes(storage, loader, splitter, manifest, changed, removed, graph=None, compact=True):
+    """
+    把一组新增/修改 (changed) 与删除 (removed) 的文件应用到全部索引，增量入库与实时索引 (live_index.py) 共用。
+    graph: 常驻进程传入内存中的图谱，避免每个事务重新反序列化；为 None 时从磁盘加载。
+    compact=False (实时索引)：各索引只落盘增量段，清单只追加日志，合并由调用方按计划执行 (storage.compact_indexes)。
+    """
+    # 1. 从图谱中摘除变更文件的旧双链 (先记下旧的笔记名与链接目标，图谱增量需要重写这些节点)
+    graph = storage.load_graph() if graph is None else graph
+    nodes = set()
+    for path in changed + removed:
+        entry = manifest.entries.get(path)
+        if entry:
+            nodes.add(entry["source"])
+            nodes.update(entry.get("links", []))
+    _detach_links(graph, manifest, changed + removed)
+    stale_ids = manifest.parent_ids(changed + removed)
+
+    # 2. 只流式解析变更文件，新边直接追加到已有图谱；
+    #    笔记名索引覆盖全仓库 (未变化文件的别名取自清单，变更文件的别名解析时补入)
+    touched = set(changed) | set(removed)
+    unchanged = [p for p in manifest.entries if p not in touched]
+    note_index = NoteIndex.build(unchanged, manifest.aliases())
+    for path in changed:
+        note_index.add(path)
+    batches = loader.iter_vault(paths=changed, graph=graph, note_index=note_index)
+    structured_docs = (d for batch in batches for d in splitter.pre_split(batch))
+
+    # 3. 删除旧父子块并写入新块 (Chroma / 父文档库 / BM25)
+    id_map = storage.update_vector_bm25_index(structured_docs, stale_ids, compact=compact)
+    AnswerCache.publish_invalidation(stale_ids)  # 运行中的前端据此剔除受影响的缓存答案
+    loader.report_parse_stats()
+
+    # 4. 持久化清单与图谱 (整体保存时图谱索引整体重建，开销远小于向量化)
+    for path in removed:
+        manifest.remove(path)
+    _record(manifest, changed, loader, id_map)
+    if compact:
+        manifest.save()
+        storage.save_graph(graph, manifest.parents_by_source())
         return
+    # 增量：索引增量段 -> 图谱增量 -> 清单日志 (提交点，调用方随后发布索引版本)
+    for path in changed:
+        nodes.add(_note_name(path))
+        nodes.update(loader.links.get(path, []))
+    if not storage.save_graph_delta(graph, nodes, manifest.parents_by_source(nodes)):
+        storage.save_graph(graph, manifest.parents_by_source())
+    manifest.save_delta()
+
 
-    # 3. 保存图谱
-    storage.save_graph(graph)
+def _memory_report(start):
+    """入库结束时打印内存峰值 (ru_maxrss 在 Linux 下以 KB 为单位)"""
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    try:
+        with open("/proc/self/statm") as f:
+            rss_mb = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    except (OSError, ValueError):
+        rss_mb = float("nan")
+    print(f"🧠 内存: 峰值 RSS {peak_mb:.0f} MB | 当前 RSS {rss_mb:.0f} MB | 耗时 {time.perf_counter() - start:.1f}s")
 
-    # 4. 预处理 Markdown (按 Header 切分)
+
+def main():
+    parser = argparse.ArgumentParser(description="Obsidian 数据入库流水线")
+    parser.add_argument("--full", action="store_true", help="清空现有索引并全量重建")
+    parser.add_argument("--shards", type=int, default=config.INGEST_SHARDS,
+                        help="分片数 (>1 时多进程分片全量入库，各分片轮流使用 OLLAMA_ENDPOINTS)")
+    parser.add_argument("--watch", action="store_true",
+                        help="常驻监听仓库，防抖后增量提交变更 (实时索引，见 live_index.py)")
+    args = parser.parse_args()
+
+    print("🚀 启动数据入库流水线...")
+    start = time.perf_counter()
+
+    if args.watch:
+        from live_index import LiveIndexer  # live_index 反向依赖本模块的 apply_changes
+        print("👀 实时索引模式")
+        LiveIndexer().run()
+        return
+
+    # 1. 初始化存储与组件
+    storage = StorageManager()
+    loader = ContentLoader()
     splitter = TextSplitterFactory()
-    structured_docs = splitter.pre_split_markdown(raw_docs)
+    manifest = FileManifest()
+
+    paths = [p for p in loader.scan_vault() if os.path.splitext(p)[1].lower() in SUPPORTED_EXTS]
+
+    # 没有清单时无法判断已有数据归属，只能全量重建
+    if args.shards > 1:
+        from shard_ingest import sharded_ingest  # shard_ingest 反向依赖本模块的辅助函数
+        print(f"🧩 分片全量重建模式: {args.shards} 个分片")
+        if not sharded_ingest(storage, paths, args.shards):
+            return
+        mode, updated = "shards", True
+    elif args.full or not manifest.exists():
+        print("🧹 全量重建模式")
+        mode, updated = "full", full_ingest(storage, loader, splitter, paths)
+    else:
+        print("🔁 增量更新模式")
+        mode, updated = "incremental", incremental_ingest(storage, loader, splitter, paths, manifest)
 
-    # 5. 存入向量库与 BM25 (Storage 内部会调用 Parent/Child Splitter)
-    storage.build_vector_bm25_index(structured_docs)
-    
+    # 运行中的检索引擎 (前端 / 查询服务) 看到版本变化后热加载新索引；索引未变化时不发布，避免无谓的热加载
+    if updated:
+        storage.publish_index_version(mode=mode)
+    _memory_report(start)
     print("✅ 全部完成！")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
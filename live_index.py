@@ -0,0 +1,334 @@
+# 职责：实时索引守护进程 —— 监听 Obsidian 仓库的文件变更，防抖合并后只重新解析被改动的文件，
+# 按小事务增量更新向量库 / 父文档库 / BM25 / 图谱，每个事务提交后发布索引版本 (运行中的 RAGRetriever 据此热加载)，
+# 并报告索引延迟 (文件首次变更 -> 事务提交)。事务只落盘增量段 (开销与变更大小成正比)，
+# 累积到一定量或一定时间后在队列空闲时合并进主段。
+# 用法: python ingest.py --watch        (先按清单补齐停机期间的变更，再持续监听)
+#
+# 监听后端：安装了 watchdog 时用 inotify；WSL 下 /mnt/* 挂载的 Windows 分区收不到 Windows 侧写入的 inotify 事件，
+# 改为定期扫描 (mtime, size) 快照对比。两者都只产出"哪些路径可能变了"，是否真的变化仍由 FileManifest 判定。
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import config
+from ingest import SUPPORTED_EXTS, apply_changes, full_ingest
+from loader import ContentLoader
+from manifest import FileManifest
+from splitter import TextSplitterFactory
+from storage import StorageManager
+from tracing import tracer
+
+
+def is_indexable(path: str, root: str = None) -> bool:
+    """与 scan_vault 的过滤规则一致：扩展名受支持，且不在 IGNORE_DIRS 之下"""
+    root = root or config.VAULT_PATH
+    if os.path.splitext(path)[1].lower() not in SUPPORTED_EXTS:
+        return False
+    rel = os.path.relpath(path, root)
+    return not rel.startswith("..") and not any(part in config.IGNORE_DIRS for part in rel.split(os.sep)[:-1])
+
+
+def _on_wsl_mount(path: str) -> bool:
+    """WSL 中的 /mnt/<盘符> 由 9p/drvfs 挂载，Windows 侧的写入不会触发 inotify"""
+    try:
+        with open("/proc/version", "r") as f:
+            wsl = "microsoft" in f.read().lower()
+    except OSError:
+        wsl = False
+    return wsl and os.path.abspath(path).startswith("/mnt/")
+
+
+class PollingWatcher:
+    """轮询后端：每隔 interval 秒扫描一次仓库 (跳过 IGNORE_DIRS)，把 (mtime, size) 变化或增删的路径交给回调"""
+
+    def __init__(self, root: str, on_change: Callable[[Iterable[str]], None],
+                 interval: float = config.WATCH_POLL_INTERVAL):
+        self.root = root
+        self.on_change = on_change
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._snapshot = self._scan()
+
+    def _scan(self) -> Dict[str, Tuple[float, int]]:
+        snapshot = {}
+        for root, dirs, files in os.walk(self.root):
+            dirs[:] = [d for d in dirs if d not in config.IGNORE_DIRS]
+            for f in files:
+                path = os.path.join(root, f)
+                if os.path.splitext(f)[1].lower() not in SUPPORTED_EXTS:
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue  # 扫描期间被删除
+                snapshot[path] = (st.st_mtime, st.st_size)
+        return snapshot
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            current = self._scan()
+            old, self._snapshot = self._snapshot, current
+            touched = [p for p, sig in current.items() if old.get(p) != sig]
+            touched += [p for p in old if p not in current]
+            if touched:
+                self.on_change(touched)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="vault-poller")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class InotifyWatcher:
+    """inotify 后端 (watchdog)：文件事件直接上报；目录事件 (整体移动 / 删除) 上报目录路径，由索引器展开"""
+
+    def __init__(self, root: str, on_change: Callable[[Iterable[str]], None]):
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.event_type in ("opened", "closed_no_write") or \
+                        (event.is_directory and event.event_type == "modified"):
+                    return  # 只读访问 / 目录 mtime 变化 (其中文件的事件会单独上报)
+                paths = [event.src_path, getattr(event, "dest_path", "")]
+                on_change([os.fsdecode(p) for p in paths if p])
+
+        self.observer = Observer()
+        self.observer.schedule(Handler(), root, recursive=True)
+
+    def start(self):
+        self.observer.start()
+
+    def stop(self):
+        self.observer.stop()
+        self.observer.join()
+
+
+def make_watcher(root: str, on_change: Callable[[Iterable[str]], None], mode: str = config.WATCH_MODE):
+    """mode: auto | inotify | poll；auto 在 WSL 挂载盘或未安装 watchdog 时退回轮询"""
+    if mode == "auto":
+        mode = "poll" if _on_wsl_mount(root) else "inotify"
+    if mode == "inotify":
+        try:
+            watcher = InotifyWatcher(root, on_change)
+            print(f"👀 inotify 监听: {root}")
+            return watcher
+        except ImportError:
+            print("⚠️ 未安装 watchdog，退回轮询监听")
+    print(f"👀 轮询监听 (每 {config.WATCH_POLL_INTERVAL:g}s): {root}")
+    return PollingWatcher(root, on_change)
+
+
+class LiveIndexer:
+    """
+    变更队列 + 防抖提交：
+    - 监听线程只登记 path -> 首次变更时间，不做任何 I/O
+    - 主循环在"最后一次变更后静默 WATCH_DEBOUNCE 秒"或"最早的变更已等待 WATCH_MAX_DELAY 秒"时取走整个队列，
+      每 WATCH_MAX_BATCH 个文件一个事务调用 ingest.apply_changes，事务间检索端即可看到已提交的部分
+    - 图谱常驻内存，各事务直接在其上摘除 / 追加双链，不重复反序列化
+    - 事务只写增量段 (BM25 / 向量 delta.npz、图谱索引 delta.json、清单日志)，增量落盘后才发布索引版本；
+      累计 compact_files 个文件或距上次合并超过 compact_interval 秒时，在队列空闲时合并进主段，停止时也合并一次
+    """
+
+    def __init__(self, storage: Optional[StorageManager] = None, vault: str = None, mode: str = config.WATCH_MODE,
+                 debounce: float = config.WATCH_DEBOUNCE, max_delay: float = config.WATCH_MAX_DELAY,
+                 max_batch: int = config.WATCH_MAX_BATCH, compact_files: int = config.WATCH_COMPACT_FILES,
+                 compact_interval: float = config.WATCH_COMPACT_INTERVAL):
+        self.storage = storage or StorageManager()
+        self.vault = vault or config.VAULT_PATH
+        self.mode = mode
+        self.debounce, self.max_delay, self.max_batch = debounce, max_delay, max_batch
+        self.compact_files, self.compact_interval = compact_files, compact_interval
+        self.loader = ContentLoader()
+        self.splitter = TextSplitterFactory()
+        self.manifest = FileManifest()
+        self.graph = None
+
+        self._pending: Dict[str, float] = {}  # path -> 首次变更时间 (time.time())
+        self._last_event = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.lags: deque = deque(maxlen=1000)  # 最近提交文件的索引延迟 (秒)
+        self.commits = 0
+        self.uncompacted = 0  # 上次合并以来以增量提交的文件数
+        self._last_compact = time.monotonic()
+
+    # --- 变更队列 ---
+    def notify(self, paths: Iterable[str]):
+        """监听回调：登记可能变化的路径 (同一路径保留最早的时间，延迟从第一次编辑算起)"""
+        now = time.time()
+        with self._lock:
+            for path in paths:
+                self._pending.setdefault(path, now)
+            self._last_event = now
+
+    def _take_due(self) -> Dict[str, float]:
+        with self._lock:
+            if not self._pending:
+                return {}
+            now = time.time()
+            quiet = now - self._last_event >= self.debounce
+            overdue = now - min(self._pending.values()) >= self.max_delay
+            if not (quiet or overdue):
+                return {}
+            pending, self._pending = self._pending, {}
+            return pending
+
+    def _expand(self, pending: Dict[str, float]) -> Dict[str, float]:
+        """目录事件展开为其下的已入库文件与当前磁盘上的文件，并按扫描规则过滤"""
+        files = {}
+        for path, first in pending.items():
+            if os.path.isdir(path) or not os.path.splitext(path)[1]:
+                prefix = path.rstrip(os.sep) + os.sep
+                inside = [p for p in self.manifest.entries if p.startswith(prefix)]
+                for root, dirs, names in os.walk(path):
+                    dirs[:] = [d for d in dirs if d not in config.IGNORE_DIRS]
+                    inside += [os.path.join(root, n) for n in names]
+                for p in inside:
+                    files.setdefault(p, first)
+            else:
+                files[path] = min(first, files.get(path, first))
+        return {p: t for p, t in files.items() if is_indexable(p, self.vault)}
+
+    # --- 事务 ---
+    def _commit(self, changed: List[str], removed: List[str], first_seen: Dict[str, float]):
+        t0 = time.perf_counter()
+        with tracer.trace("实时索引", 变更=len(changed), 删除=len(removed)):
+            try:
+                apply_changes(self.storage, self.loader, self.splitter, self.manifest, changed, removed,
+                              graph=self.graph, compact=False)
+            except Exception:
+                # 常驻图谱已摘除旧双链 / 追加了部分新边：按已提交状态 (graph.pkl + 图谱增量) 重新加载
+                self.graph = self.storage.load_graph()
+                raise
+            self.graph = self.loader.graph
+            committed = time.time()
+            lags = [committed - first_seen[p] for p in changed + removed if p in first_seen]
+            for lag in lags:
+                tracer.record("索引延迟", lag * 1000)
+        self.lags.extend(lags)
+        self.commits += 1
+        self.uncompacted += len(changed) + len(removed)
+        info = {"changed": len(changed), "removed": len(removed),
+                "commit_ms": round((time.perf_counter() - t0) * 1000, 1)}
+        if lags:
+            info["lag_s"] = {"p50": round(sorted(lags)[len(lags) // 2], 3), "max": round(max(lags), 3)}
+        record = self.storage.publish_index_version(**info)
+        print(f"⚡ 索引版本 v{record['version']}: 更新 {len(changed)} / 删除 {len(removed)} 个文件 | "
+              f"事务 {info['commit_ms']:.0f}ms | " + self.lag_report())
+
+    def compact(self):
+        """把增量段合并进主段 (各索引整体重写、清单重写并清空日志)，完成后发布新版本让检索端切换到新主段"""
+        t0 = time.perf_counter()
+        with tracer.trace("索引合并", 文件=self.uncompacted):
+            self.storage.compact_indexes(self.graph, self.manifest.parents_by_source())
+            self.manifest.save()
+        info = {"compacted": self.uncompacted, "compact_ms": round((time.perf_counter() - t0) * 1000, 1)}
+        self.uncompacted = 0
+        self._last_compact = time.monotonic()
+        record = self.storage.publish_index_version(**info)
+        print(f"🧱 索引版本 v{record['version']}: 已合并 {info['compacted']} 个文件的增量段 | "
+              f"耗时 {info['compact_ms']:.0f}ms")
+
+    def _maybe_compact(self):
+        """队列空闲时检查合并计划：累计文件数或距上次合并的时间达到阈值"""
+        if not self.uncompacted:
+            return
+        with self._lock:
+            if self._pending:
+                return
+        if self.uncompacted >= self.compact_files or \
+                time.monotonic() - self._last_compact >= self.compact_interval:
+            try:
+                self.compact()
+            except Exception as e:
+                # 增量段与清单日志仍然有效，检索不受影响；推迟到下一个合并周期重试
+                self._last_compact = time.monotonic()
+                print(f"❌ 索引合并失败: {e}，增量段保持有效，稍后重试")
+
+    def lag_report(self) -> str:
+        if not self.lags:
+            return "索引延迟: 暂无"
+        lags = sorted(self.lags)
+        return (f"索引延迟 (最近 {len(lags)} 个文件) p50 {lags[len(lags) // 2]:.1f}s | "
+                f"p95 {lags[int(len(lags) * 0.95)]:.1f}s | 最大 {lags[-1]:.1f}s")
+
+    def apply(self, pending: Dict[str, float]):
+        """把一批可能变化的路径落实为 (修改, 删除)，按 max_batch 拆成多个事务依次提交"""
+        files = self._expand(pending)
+        existing = [p for p in files if os.path.isfile(p)]
+        removed = [p for p in files if p not in existing and p in self.manifest.entries]
+        changed, _, _ = self.manifest.diff(existing)  # 仅 touch 的文件在此被过滤，只刷新指纹
+        if not changed and not removed:
+            self.manifest.save_delta()
+            return
+        # 删除不需要解析，随第一个事务一起提交
+        for start in range(0, max(len(changed), 1), self.max_batch):
+            self._commit(changed[start:start + self.max_batch], removed if start == 0 else [], files)
+
+    def catch_up(self):
+        """启动时对比全仓库与清单，补齐守护进程停机期间的变更；没有清单时全量重建"""
+        paths = [p for p in self.loader.scan_vault() if os.path.splitext(p)[1].lower() in SUPPORTED_EXTS]
+        if not self.manifest.exists():
+            print("🧹 未发现入库清单，先全量重建")
+            full_ingest(self.storage, self.loader, self.splitter, paths)
+            self.manifest = FileManifest()
+            self.graph = self.loader.graph
+            self.storage.publish_index_version(changed=len(paths), removed=0)
+            return
+        changed, removed, unchanged = self.manifest.diff(paths)
+        print(f"📋 停机期间: 新增/修改 {len(changed)} | 删除 {len(removed)} | 未变化 {len(unchanged)}")
+        self.graph = self.storage.load_graph()  # 含上次运行未合并的图谱增量
+        if self.storage.has_index_delta():
+            print("🧱 发现上次运行未合并的增量段，先行合并")
+            self.compact()
+        if changed or removed:
+            now = time.time()
+            self.apply({p: now for p in changed + removed})
+        else:
+            self.manifest.save()
+
+    # --- 主循环 ---
+    def run(self, tick: float = 0.2):
+        """阻塞运行直到 stop() 或 Ctrl+C；先启动监听再补齐，补齐期间的编辑不会丢失"""
+        watcher = make_watcher(self.vault, self.notify, self.mode)
+        watcher.start()
+        try:
+            self.catch_up()
+            print(f"🟢 实时索引已启动 (防抖 {self.debounce:g}s / 最长等待 {self.max_delay:g}s / "
+                  f"每事务 ≤{self.max_batch} 个文件)")
+            while not self._stop.wait(tick):
+                pending = self._take_due()
+                if not pending:
+                    self._maybe_compact()
+                    continue
+                try:
+                    self.apply(pending)
+                except Exception as e:
+                    # 失败的文件重新入队，等下一轮 (例如文件仍在写入 / Ollama 暂时不可用)
+                    print(f"❌ 索引事务失败: {e}，{len(pending)} 个路径将重试")
+                    with self._lock:
+                        for path, first in pending.items():
+                            self._pending[path] = min(first, self._pending.get(path, first))
+                        self._last_event = time.time()
+        except KeyboardInterrupt:
+            print("\n🛑 收到中断，停止监听")
+        finally:
+            watcher.stop()
+            if self.uncompacted:
+                try:
+                    self.compact()
+                except Exception as e:
+                    print(f"⚠️ 停止前合并失败: {e}，增量段已落盘，下次启动时合并")
+            print(f"📊 共提交 {self.commits} 个事务 | " + self.lag_report())
+
+    def stop(self):
+        self._stop.set()
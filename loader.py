@@ -1,77 +1,320 @@
 import os
 import re
+import time
+import yaml
 import networkx as nx
-import fitz  
+import fitz
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from tqdm import tqdm
 from langchain_core.documents import Document
 import config
 
+# Obsidian 双链 [[Target]] / [[Target|Alias]] / [[folder/Note#Heading]] / ![[嵌入]]
+LINK_PATTERN = re.compile(r"!?\[\[([^\[\]\n]+?)\]\]")
+FRONTMATTER_PATTERN = re.compile(r"\A---[ \t]*\r?\n(.*?)\r?\n---[ \t]*(?:\r?\n|\Z)", re.S)
+NOTE_EXTS = (".md", ".pdf")
+# 嵌入 / 链接的附件 (非笔记节点)；仅在目标不是已有笔记时才按扩展名判定，"Node.js"、"ASP.NET" 之类笔记名不受影响
+ATTACHMENT_EXTS = {
+    ".png", ".jpg", ".jpeg", ".gif", ".bmp", ".svg", ".webp", ".avif", ".ico",
+    ".mp3", ".wav", ".m4a", ".ogg", ".flac", ".webm", ".3gp",
+    ".mp4", ".mkv", ".mov", ".ogv", ".avi",
+    ".canvas", ".excalidraw", ".zip", ".docx", ".xlsx", ".pptx", ".csv",
+}
+
+
+def parse_aliases(text):
+    """读取 YAML frontmatter 中的 aliases (兼容单数 alias 与逗号分隔字符串)"""
+    m = FRONTMATTER_PATTERN.match(text)
+    if not m:
+        return []
+    try:
+        meta = yaml.safe_load(m.group(1))
+    except yaml.YAMLError:
+        return []
+    if not isinstance(meta, dict):
+        return []
+    raw = meta.get("aliases", meta.get("alias"))
+    if isinstance(raw, str):
+        raw = raw.split(",")
+    if not isinstance(raw, list):
+        return []
+    return [str(a).strip() for a in raw if a is not None and str(a).strip()]
+
+
+def read_aliases(path):
+    """只读取文件开头的 frontmatter 获取别名 (用于在解析正文前建立全仓库笔记名索引)"""
+    if not path.lower().endswith(".md"):
+        return []
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        head = f.read(4096)
+        if not head.startswith("---"):
+            return []
+        if not FRONTMATTER_PATTERN.match(head):
+            head += f.read()
+    return parse_aliases(head)
+
+
+class NoteIndex:
+    """
+    笔记名索引：文件名 / 仓库内相对路径 / frontmatter 别名 -> 规范笔记名 (即文档 metadata 中的 source)。
+    查找不区分大小写，优先级：相对路径 > 文件名 > 别名，与 Obsidian 的解析顺序一致。
+    """
+
+    def __init__(self):
+        self.by_path = {}
+        self.by_name = {}
+        self.by_alias = {}
+
+    @staticmethod
+    def _key(text):
+        return text.strip().replace("\\", "/").lower()
+
+    def add(self, path, aliases=()):
+        stem, _ = os.path.splitext(path)
+        name = os.path.basename(stem)
+        rel = os.path.relpath(stem, config.VAULT_PATH)
+        self.by_path[self._key(rel)] = name
+        self.by_name.setdefault(self._key(name), name)
+        for alias in aliases:
+            self.by_alias.setdefault(self._key(alias), name)
+
+    @classmethod
+    def build(cls, paths, aliases_by_path=None):
+        index = cls()
+        aliases_by_path = aliases_by_path or {}
+        for path in paths:
+            index.add(path, aliases_by_path.get(path, ()))
+        return index
+
+    @classmethod
+    def scan(cls, paths):
+        """预扫描全部 Markdown 的 frontmatter，得到含别名的完整索引 (分片入库时各分片共用)"""
+        return cls.build(paths, {p: read_aliases(p) for p in paths})
+
+    def resolve(self, link):
+        """
+        将双链原文解析为规范笔记名。
+        返回 (笔记名, 是否命中)；同笔记内的标题链接与附件返回 (None, False)。
+        """
+        target = link.split("|", 1)[0].split("#", 1)[0].strip().replace("\\", "/")
+        if not target:
+            return None, False  # [[#Heading]]：指向自身
+        stem, ext = os.path.splitext(target)
+        ext = ext.lower()
+        # 先按笔记查找，"Node.js" 这类带点的笔记名优先于附件判定
+        for candidate in ((stem, target) if ext in NOTE_EXTS else (target,)):
+            hit = self._lookup(candidate)
+            if hit:
+                return hit, True
+        if ext in ATTACHMENT_EXTS:
+            return None, False  # 图片等附件不是笔记节点
+        if ext in NOTE_EXTS:
+            target = stem
+        # 悬空链接：以文件名部分作为节点名，笔记日后创建时自然合并
+        return target.rsplit("/", 1)[-1], False
+
+    def _lookup(self, target):
+        key = self._key(target)
+        if "/" in key:
+            hit = self.by_path.get(key.lstrip("/"))
+            if hit:
+                return hit
+            key = key.rsplit("/", 1)[1]
+        return self.by_name.get(key) or self.by_alias.get(key)
+
+
+def _parse_pdf_range(path, start, end):
+    """进程池任务：使用 PyMuPDF 提取 PDF [start, end) 页的文本层内容"""
+    t0 = time.perf_counter()
+    try:
+        doc = fitz.open(path)
+        text = "\n".join(doc[i].get_text() for i in range(start, min(end, doc.page_count)))
+        doc.close()
+        return text, time.perf_counter() - t0, None
+    except Exception as e:
+        return "", time.perf_counter() - t0, str(e)
+
+
 class ContentLoader:
     def __init__(self):
         """只保留轻量级初始化"""
-        pass
+        self.links = {}        # path -> 该文件写出的双链目标 (规范笔记名)
+        self.aliases = {}      # path -> frontmatter 别名
+        self.parse_stats = {}  # path -> (解析耗时秒, 字符数)
+        self.edges = []        # 本次解析产生的 (源笔记, 目标笔记) 边列表
+        self.graph = None
+        self._raw_links = {}   # path -> (笔记名, 双链原文)，全部解析完后统一消解
 
     def _extract_links(self, text):
-        """解析 Obsidian 双链 [[Target]] 或 [[Target|Alias]]"""
-        return re.findall(r'\[\[(.*?)\]\]', text)
+        """解析 Obsidian 双链原文 (含别名/标题后缀，由 NoteIndex.resolve 处理)"""
+        return LINK_PATTERN.findall(text)
 
-    def _load_pdf(self, filepath):
-        """使用 PyMuPDF 提取 PDF 文本层内容"""
+    def _page_ranges(self, path):
+        """大 PDF 按页拆成多个任务，实现页级并行"""
+        step = config.PDF_PAGES_PER_TASK
         try:
-            doc = fitz.open(filepath)
-            text = "\n".join([page.get_text() for page in doc])
-            doc.close()
-            if not text.strip():
-                print(f"⚠️ 跳过扫描版或无文本PDF: {os.path.basename(filepath)}")
-            return text
-        except Exception as e:
-            print(f"❌ PDF 解析错误 {filepath}: {e}")
-            return ""
-
-    def load_vault(self):
-        """遍历 Obsidian 库，构建文档列表与关系图谱"""
-        docs = []
-        graph = nx.Graph()
-        
+            with fitz.open(path) as doc:
+                pages = doc.page_count
+        except Exception:
+            return [(0, 1 << 30)]  # 交给工作进程报告具体错误
+        return [(s, s + step) for s in range(0, max(pages, 1), step)]
+
+    def scan_vault(self):
+        """递归扫描仓库，返回全部文件路径 (跳过 IGNORE_DIRS)"""
         if not os.path.exists(config.VAULT_PATH):
             raise FileNotFoundError(f"未找到路径: {config.VAULT_PATH}")
 
-        # 1. 递归扫描文件
         all_files = []
         for root, dirs, files in os.walk(config.VAULT_PATH):
             dirs[:] = [d for d in dirs if d not in config.IGNORE_DIRS]
             for f in files:
                 all_files.append(os.path.join(root, f))
+        return all_files
+
+    def _make_doc(self, path, content):
+        """建立知识图谱节点与双链边，并生成 LangChain 标准文档对象"""
+        ext = os.path.splitext(path)[1].lower()
+        name = os.path.splitext(os.path.basename(path))[0]
+        if not content.strip():
+            if ext == ".pdf":
+                print(f"⚠️ 跳过扫描版或无文本PDF: {os.path.basename(path)}")
+            return None
+
+        self.graph.add_node(name, path=path, type=ext)
+        self._raw_links[path] = (name, self._extract_links(content))
+        if ext == ".md":
+            self.aliases[path] = parse_aliases(content)
+
+        return Document(
+            page_content=content,
+            metadata={"source": name, "type": ext, "path": path}
+        )
 
-        print(f"📂 扫描到 {len(all_files)} 个文件，正在解析文本...")
+    def _resolve_links(self, note_index):
+        """
+        用笔记名索引一次性消解本次解析的全部双链，生成边列表并批量写入图谱。
+        放在全部文件解析之后，保证别名表已包含本批新增笔记。
+        """
+        t0 = time.perf_counter()
+        for path, aliases in self.aliases.items():
+            note_index.add(path, aliases)
+
+        resolved = dangling = 0
+        for path, (name, raw_links) in self._raw_links.items():
+            targets = []
+            for link in raw_links:
+                target, hit = note_index.resolve(link)
+                if target is None or target == name or target in targets:
+                    continue
+                targets.append(target)
+                resolved += hit
+                dangling += not hit
+            self.links[path] = targets
+            self.edges.extend((name, t) for t in targets)
+        self.graph.add_edges_from(self.edges)
+        self._raw_links = {}
+        print(f"🔗 双链消解: {resolved} 条命中 / {dangling} 条悬空 / {len(self.edges)} 条边 "
+              f"({(time.perf_counter() - t0) * 1000:.0f}ms)")
+
+    def iter_vault(self, paths=None, graph=None, note_index=None, batch_size=config.LOAD_BATCH_SIZE,
+                   workers=config.LOAD_WORKERS):
+        """
+        流式遍历 Obsidian 库，按批 yield 文档列表，下游可边解析边切分、向量化。
+        Markdown 在主进程读取；PDF 提交进程池解析，大 PDF 拆页并行，
+        在途任务数受 workers 限制，内存占用与仓库规模无关。
+        图谱写入 self.graph，双链记录在 self.links，单文件耗时记录在 self.parse_stats。
+        note_index: 全仓库笔记名索引 (增量模式需包含未变化文件)，为 None 时由本次文件列表构建。
+        双链在全部文件解析完后统一消解，最后一批文档 yield 前图谱即已完整。
+        """
+        self.graph = nx.Graph() if graph is None else graph
+        self.links = {}
+        self.aliases = {}
+        self.parse_stats = {}
+        self.edges = []
+        self._raw_links = {}
+
+        # 1. 递归扫描文件
+        all_files = self.scan_vault() if paths is None else list(paths)
+        if note_index is None:
+            note_index = NoteIndex.build(all_files)
+        md_files = [p for p in all_files if p.lower().endswith(".md")]
+        pdf_files = [p for p in all_files if p.lower().endswith(".pdf")]
 
-        # 2. 遍历解析
-        for path in tqdm(all_files, desc="Parsing"):
-            ext = os.path.splitext(path)[1].lower()
-            name = os.path.basename(path).replace(ext, "")
-            content = ""
+        print(f"📂 扫描到 {len(all_files)} 个文件 (MD {len(md_files)} / PDF {len(pdf_files)})，正在解析文本...")
 
-            if ext == ".md":
+        batch = []
+        pdf_queue = list(reversed(pdf_files))
+        in_flight = OrderedDict()  # path -> [future, ...]
+        max_tasks = workers * 2
+
+        def fill(pool):
+            while pdf_queue and sum(len(f) for f in in_flight.values()) < max_tasks:
+                path = pdf_queue.pop()
+                in_flight[path] = [pool.submit(_parse_pdf_range, path, s, e) for s, e in self._page_ranges(path)]
+
+        def collect(bar):
+            """收集所有页都已解析完的 PDF"""
+            for path in [p for p, futs in in_flight.items() if all(f.done() for f in futs)]:
+                parts = [f.result() for f in in_flight.pop(path)]
+                errors = [err for _, _, err in parts if err]
+                if errors:
+                    print(f"❌ PDF 解析错误 {path}: {errors[0]}")
+                content = "\n".join(text for text, _, _ in parts)
+                self.parse_stats[path] = (sum(t for _, t, _ in parts), len(content))
+                bar.update(1)
+                doc = self._make_doc(path, content)
+                if doc is not None:
+                    batch.append(doc)
+
+        with ProcessPoolExecutor(max_workers=workers) as pool, \
+                tqdm(total=len(md_files) + len(pdf_files), desc="Parsing") as bar:
+            fill(pool)
+
+            # 2. Markdown 在主进程读取，期间轮询已完成的 PDF
+            for path in md_files:
+                t0 = time.perf_counter()
                 with open(path, 'r', encoding='utf-8', errors='ignore') as f:
                     content = f.read()
-            elif ext == ".pdf":
-                content = self._load_pdf(path)
-            else:
-                continue
-
-            if not content.strip():
-                continue
-
-            # 3. 建立知识图谱节点与双链边
-            graph.add_node(name, path=path, type=ext)
-            for link in self._extract_links(content):
-                target = link.split('|')[0] # 过滤别名
-                graph.add_edge(name, target)
-
-            # 4. 生成 LangChain 标准文档对象
-            docs.append(Document(
-                page_content=content, 
-                metadata={"source": name, "type": ext}
-            ))
-
-        return docs, graph
\ No newline at end of file
+                self.parse_stats[path] = (time.perf_counter() - t0, len(content))
+                bar.update(1)
+                doc = self._make_doc(path, content)
+                if doc is not None:
+                    batch.append(doc)
+                collect(bar)
+                fill(pool)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+
+            # 3. 等待剩余 PDF
+            while in_flight:
+                wait([f for futs in in_flight.values() for f in futs], return_when=FIRST_COMPLETED)
+                collect(bar)
+                fill(pool)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+
+        self._resolve_links(note_index)
+        if batch:
+            yield batch
+
+    def load_vault(self, paths=None, graph=None, note_index=None):
+        """
+        遍历 Obsidian 库，构建文档列表与关系图谱 (iter_vault 的一次性收集版本)。
+        paths: 仅解析指定文件 (增量模式)，为 None 时扫描整个仓库；
+        graph: 在已有图谱上追加节点与边，为 None 时新建。
+        """
+        docs = [doc for batch in self.iter_vault(paths=paths, graph=graph, note_index=note_index) for doc in batch]
+        return docs, self.graph
+
+    def report_parse_stats(self, top=10):
+        """打印解析最慢的文件，便于定位病态 PDF"""
+        if not self.parse_stats:
+            return
+        total = sum(t for t, _ in self.parse_stats.values())
+        print(f"📑 解析 {len(self.parse_stats)} 个文件，累计耗时 {total:.1f}s，最慢的 {top} 个:")
+        slowest = sorted(self.parse_stats.items(), key=lambda kv: kv[1][0], reverse=True)[:top]
+        for path, (seconds, chars) in slowest:
+            print(f"   {seconds:7.2f}s  {chars:>9} 字符  {os.path.relpath(path, config.VAULT_PATH)}")
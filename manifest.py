@@ -0,0 +1,171 @@
+# 职责：记录每个已入库文件的指纹 (mtime / size / 内容哈希)，用于增量入库。
+import os
+import json
+import hashlib
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import config
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """按块计算文件内容哈希，避免一次性读入大 PDF"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class FileManifest:
+    """
+    入库清单：path -> {mtime, size, hash, source, links, aliases, parent_ids}
+    parent_ids 记录该文件生成的全部父块 ID，删除/更新时据此清理旧数据。
+    实时索引的小事务用 save_delta() 把变更条目追加到 <清单>.log (每行一个 JSON)，加载时在主文件之上回放；
+    save() 整体重写主文件并清空日志。
+    """
+
+    def __init__(self, path: str = config.MANIFEST_PATH):
+        self.path = path
+        self.log_path = path + ".log"
+        self.entries: Dict[str, dict] = {}
+        self._dirty: Set[str] = set()  # 上次落盘以来新增 / 修改 / 删除的路径
+        self._by_source: Optional[Dict[str, Set[str]]] = None  # 笔记名 -> 路径，首次按名查询时构建
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f).get("files", {})
+            except Exception as e:
+                print(f"⚠️ 清单加载失败: {e}，将视为全新入库")
+                self.entries = {}
+        if self.entries and os.path.exists(self.log_path):
+            self._replay_log()
+
+    def _replay_log(self):
+        with open(self.log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # 崩溃时写了一半的尾行
+                if record["entry"] is None:
+                    self.entries.pop(record["path"], None)
+                else:
+                    self.entries[record["path"]] = record["entry"]
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def diff(self, paths: List[str]) -> Tuple[List[str], List[str], List[str]]:
+        """
+        对比当前文件列表与清单，返回 (新增或修改, 已删除, 未变化)。
+        mtime + size 一致时直接视为未变化；否则再比较内容哈希，
+        仅 touch 过但内容未变的文件只刷新指纹，不重新解析。
+        """
+        changed, unchanged = [], []
+        for path in paths:
+            entry = self.entries.get(path)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if entry is None:
+                changed.append(path)
+                continue
+            if entry["mtime"] == st.st_mtime and entry["size"] == st.st_size:
+                unchanged.append(path)
+                continue
+            digest = file_sha256(path)
+            if digest == entry["hash"]:
+                entry["mtime"], entry["size"] = st.st_mtime, st.st_size
+                self._dirty.add(path)
+                unchanged.append(path)
+            else:
+                changed.append(path)
+
+        current = set(paths)
+        removed = [p for p in self.entries if p not in current]
+        return changed, removed, unchanged
+
+    def update(self, path: str, source: str, links: List[str], parent_ids: List[str],
+               aliases: Optional[List[str]] = None):
+        """写入/覆盖单个文件的指纹与其父块 ID"""
+        st = os.stat(path)
+        self._unindex(path)
+        self._dirty.add(path)
+        self.entries[path] = {
+            "mtime": st.st_mtime,
+            "size": st.st_size,
+            "hash": file_sha256(path),
+            "source": source,
+            "links": links,
+            "aliases": aliases or [],
+            "parent_ids": parent_ids,
+        }
+        if self._by_source is not None:
+            self._by_source.setdefault(source, set()).add(path)
+
+    def _unindex(self, path: str):
+        entry = self.entries.get(path)
+        if entry is not None and self._by_source is not None:
+            self._by_source.get(entry["source"], set()).discard(path)
+
+    def paths_of(self, source: str) -> Set[str]:
+        """笔记名 -> 路径 (同名的 md / pdf)；索引随 update / remove 维护"""
+        if self._by_source is None:
+            self._by_source = {}
+            for path, entry in self.entries.items():
+                self._by_source.setdefault(entry["source"], set()).add(path)
+        return self._by_source.get(source, set())
+
+    def parents_by_source(self, sources: Optional[Iterable[str]] = None) -> Dict[str, List[str]]:
+        """笔记名 -> 父块 ID (同名的 md / pdf 合并)，供图谱索引做邻居扩展；sources 指定时只取这些笔记"""
+        result: Dict[str, List[str]] = {}
+        if sources is not None:
+            for source in sources:
+                for path in self.paths_of(source):
+                    result.setdefault(source, []).extend(self.entries[path].get("parent_ids", []))
+            return result
+        for entry in self.entries.values():
+            result.setdefault(entry["source"], []).extend(entry.get("parent_ids", []))
+        return result
+
+    def aliases(self) -> Dict[str, List[str]]:
+        """path -> frontmatter 别名，供增量入库重建笔记名索引"""
+        return {p: e.get("aliases", []) for p, e in self.entries.items()}
+
+    def remove(self, path: str) -> dict:
+        self._unindex(path)
+        self._dirty.add(path)
+        return self.entries.pop(path, {})
+
+    def parent_ids(self, paths: List[str]) -> List[str]:
+        ids = []
+        for p in paths:
+            ids.extend(self.entries.get(p, {}).get("parent_ids", []))
+        return ids
+
+    def save(self):
+        """原子写入：先写临时文件再替换，防止中途崩溃损坏清单"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "files": self.entries}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self._dirty.clear()
+
+    def save_delta(self):
+        """只把上次落盘以来变更的条目追加到日志并 fsync (主文件不存在时退化为 save)"""
+        if not self.exists():
+            self.save()
+            return
+        if not self._dirty:
+            return
+        lines = [json.dumps({"path": p, "entry": self.entries.get(p)}, ensure_ascii=False) + "\n"
+                 for p in self._dirty]
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        self._dirty.clear()
@@ -0,0 +1,102 @@
+# 职责：异步查询流水线 —— 路由与检索并发 (投机检索)，流式生成并统计首字延迟。
+import sys
+import time
+import asyncio
+import threading
+from typing import AsyncIterator, Dict
+
+import config
+from generator import RAGGenerator
+from retriever import RAGRetriever
+
+
+class AsyncRAGPipeline:
+    """
+    两种模式：
+    - 默认 (投机检索)：不等路由结果就开始检索；路由判定 NO 时取消检索，直接闲聊回答。
+      speculative_rewrite=True 时重写与路由并发，重写完成即用关键词检索 (与原先串行 router -> rewriter -> 检索
+      的结果一致，只是重叠了路由耗时)；False 时直接检索原始问题，不做查询重写。
+    - fused_rewrite=True：路由 + 关键词重写合并为一次结构化 LLM 调用，检索使用重写后的关键词。
+      该模式无法投机检索，但比分别调用 router / rewriter 少一次 LLM 往返。
+    """
+
+    def __init__(self, retriever: RAGRetriever, generator: RAGGenerator,
+                 fused_rewrite: bool = config.FUSED_ROUTE_REWRITE,
+                 speculative_rewrite: bool = config.SPECULATIVE_REWRITE):
+        self.retriever = retriever
+        self.generator = generator
+        self.fused_rewrite = fused_rewrite
+        self.speculative_rewrite = speculative_rewrite
+        self.last_timings: Dict[str, float] = {}
+        self.last_context = ""
+
+    async def _retrieve(self, query: str, cancel: threading.Event):
+        t0 = time.perf_counter()
+        context = await asyncio.to_thread(self.retriever.search, query, cancel)
+        self.last_timings["检索"] = (time.perf_counter() - t0) * 1000
+        return context
+
+    async def _speculate(self, query: str, cancel: threading.Event):
+        """投机检索：先 (可选) 重写查询，再检索；路由判定 NO 时整个任务被取消"""
+        keywords = query
+        if self.speculative_rewrite:
+            t0 = time.perf_counter()
+            keywords = await self.generator.arewriter(query)
+            self.last_timings["重写"] = (time.perf_counter() - t0) * 1000
+        if cancel.is_set():
+            return None
+        return await self._retrieve(keywords, cancel)
+
+    async def _route(self, query: str):
+        t0 = time.perf_counter()
+        if self.fused_rewrite:
+            need, keywords = await self.generator.aroute_and_rewrite(query)
+        else:
+            need, keywords = await self.generator.arouter(query), query
+        self.last_timings["路由"] = (time.perf_counter() - t0) * 1000
+        return need, keywords
+
+    async def astream(self, query: str) -> AsyncIterator[str]:
+        start = time.perf_counter()
+        self.last_timings = {}
+        cancel = threading.Event()
+
+        if self.fused_rewrite:
+            need, keywords = await self._route(query)
+            context = await self._retrieve(keywords, cancel) if need else None
+        else:
+            # 投机检索：不等路由结果，先 (重写后) 开始检索
+            retrieval = asyncio.create_task(self._speculate(query, cancel))
+            need, _ = await self._route(query)
+            if need:
+                context = await retrieval
+            else:
+                cancel.set()  # 检索线程在精排前退出，结果被丢弃
+                retrieval.cancel()
+                context = None
+        self.last_context = context or ""
+
+        gen_start = time.perf_counter()
+        first = True
+        async for chunk in self.generator.agenerate_stream(query, context):
+            if first:
+                now = time.perf_counter()
+                self.last_timings["首字(生成)"] = (now - gen_start) * 1000
+                self.last_timings["TTFT"] = (now - start) * 1000
+                first = False
+            yield chunk
+        self.last_timings["总计"] = (time.perf_counter() - start) * 1000
+
+    def report(self) -> str:
+        return "⏱️ " + " | ".join(f"{k} {v:.0f}ms" for k, v in self.last_timings.items())
+
+
+async def _main(query: str):
+    pipeline = AsyncRAGPipeline(RAGRetriever(), RAGGenerator())
+    async for chunk in pipeline.astream(query):
+        print(chunk, end="", flush=True)
+    print("\n" + pipeline.report())
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(" ".join(sys.argv[1:]) or "什么是知识图谱？"))
@@ -0,0 +1,284 @@
+# 职责：交叉编码器精排 (批大小 / 截断长度可配)，带去重与 (查询, 文档) 分数 LRU 缓存。
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+import config
+from batching import MicroBatcher, Overloaded, flatten_batch
+from tracing import tracer
+
+
+def _sha1(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class OnnxCrossEncoder:
+    """
+    ONNX Runtime 版交叉编码器 (CPU)：首次使用时从本地 HF 模型导出 model.onnx，
+    quantize=True 时再做一次 int8 动态量化；接口与 CrossEncoder.predict 对齐。
+    推理只依赖 onnxruntime 与 tokenizers (读取 tokenizer.json)；torch / transformers 仅在导出时导入。
+    """
+
+    def __init__(self, model_path: str, max_length: int, threads: int, quantize: bool = False):
+        import onnxruntime as ort
+
+        self.max_length = max_length
+        out_dir = os.path.join(config.RERANKER_ONNX_DIR, os.path.basename(model_path.rstrip("/")))
+        onnx_path = os.path.join(out_dir, "model.onnx")
+        if not os.path.exists(onnx_path):
+            self._export(model_path, onnx_path)
+        tokenizer_path = os.path.join(out_dir, "tokenizer.json")
+        if not os.path.exists(tokenizer_path):
+            tokenizer_path = os.path.join(model_path, "tokenizer.json")  # 导出缓存早于本版本时直接用模型自带的
+        self.tokenizer = self._load_tokenizer(tokenizer_path, max_length)
+        if quantize:
+            q_path = os.path.join(out_dir, "model.int8.onnx")
+            if not os.path.exists(q_path):
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+                print("🗜️ 正在对 ONNX 重排序模型做 int8 动态量化...")
+                quantize_dynamic(onnx_path, q_path, weight_type=QuantType.QInt8)
+            onnx_path = q_path
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = threads
+        opts.inter_op_num_threads = 1
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(onnx_path, opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    @staticmethod
+    def _load_tokenizer(path: str, max_length: int):
+        """fast tokenizer (tokenizers 库)：截断到 max_length，批内按最长样本补齐"""
+        from tokenizers import Tokenizer
+
+        tokenizer = Tokenizer.from_file(path)
+        tokenizer.enable_truncation(max_length)
+        pad = tokenizer.padding or {}
+        pad_token = pad.get("pad_token") or next(
+            (t for t in ("<pad>", "[PAD]") if tokenizer.token_to_id(t) is not None), "[PAD]")
+        tokenizer.enable_padding(pad_id=pad.get("pad_id", tokenizer.token_to_id(pad_token) or 0), pad_token=pad_token)
+        return tokenizer
+
+    def _encode(self, pairs: Sequence[Sequence[str]]) -> Dict[str, np.ndarray]:
+        encs = self.tokenizer.encode_batch([(q, p) for q, p in pairs])
+        return {
+            "input_ids": np.asarray([e.ids for e in encs], dtype=np.int64),
+            "attention_mask": np.asarray([e.attention_mask for e in encs], dtype=np.int64),
+            "token_type_ids": np.asarray([e.type_ids for e in encs], dtype=np.int64),
+        }
+
+    def _export(self, model_path: str, onnx_path: str):
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        print(f"📦 正在导出 ONNX 重排序模型: {onnx_path}")
+        os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(model_path)
+        # 同时导出 fast tokenizer，推理时无需 transformers
+        tokenizer.backend_tokenizer.save(os.path.join(os.path.dirname(onnx_path), "tokenizer.json"))
+        model = AutoModelForSequenceClassification.from_pretrained(model_path).eval()
+        dummy = tokenizer(["query"], ["passage"], return_tensors="pt")
+        axes = {0: "batch", 1: "seq"}
+        with torch.no_grad():
+            torch.onnx.export(
+                model, (dummy["input_ids"], dummy["attention_mask"]), onnx_path,
+                input_names=["input_ids", "attention_mask"], output_names=["logits"],
+                dynamic_axes={"input_ids": axes, "attention_mask": axes, "logits": {0: "batch"}},
+                opset_version=17,
+            )
+
+    def predict(self, pairs: List[List[str]], batch_size: int = 16, **kwargs) -> np.ndarray:
+        scores = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            feed = {k: v for k, v in self._encode(batch).items() if k in self.input_names}
+            logits = self.session.run(None, feed)[0]
+            scores.append(logits[:, 0])
+        # 与 CrossEncoder 单标签默认激活一致 (sigmoid)
+        return 1.0 / (1.0 + np.exp(-np.concatenate(scores))) if scores else np.zeros(0)
+
+
+class LexicalScorer:
+    """
+    无模型的词重叠打分器 (查询二元组在文档中的覆盖率)：用于基准测试与没有本地精排模型的机器，
+    不依赖 torch，分数仅供排序参考。
+    """
+
+    def predict(self, pairs: List[List[str]], batch_size: int = 16, **kwargs) -> np.ndarray:
+        from tokenizer import bigram_tokenize
+
+        scores = []
+        for query, passage in pairs:
+            q = set(bigram_tokenize(query))
+            p = set(bigram_tokenize(passage))
+            scores.append(len(q & p) / len(q) if q else 0.0)
+        return np.asarray(scores, dtype=np.float32)
+
+
+class Reranker:
+    def __init__(self, batch_size: int = config.RERANK_BATCH_SIZE,
+                 max_length: int = config.RERANK_MAX_LENGTH,
+                 cache_size: int = config.RERANK_CACHE_SIZE,
+                 backend: str = config.RERANKER_BACKEND,
+                 threads: int = config.RERANK_THREADS,
+                 lazy: bool = False):
+        """lazy=True 时不在构造时加载模型 (torch 等重型依赖也推迟导入)，由 load() 或首次打分触发"""
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.cache_size = cache_size
+        self.backend = backend  # 实际生效的后端：加载失败回退时改为 torch
+        self.threads = threads
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.batcher = None  # enable_batching() 后跨请求合并前向
+        self.model = None
+        self._load_lock = threading.Lock()
+        if not lazy:
+            self.load()
+
+    def load(self):
+        """加载模型 (幂等，可在后台线程预热)"""
+        with self._load_lock:
+            if self.model is None:
+                self.model = self._load_model()
+        return self.model
+
+    def enable_batching(self, max_batch: int, max_wait_ms: float, max_queue: int) -> MicroBatcher:
+        """查询服务中启用跨请求微批：并发请求的未命中 pair 合并为一次 predict"""
+        self.batcher = MicroBatcher(flatten_batch(self.predict), "rerank",
+                                    max_batch=max_batch, max_wait_ms=max_wait_ms, max_queue=max_queue)
+        return self.batcher
+
+    def _load_model(self):
+        """按 RERANKER_BACKEND 加载：onnx / onnx-int8 / int8 (torch 动态量化) / torch / lexical；失败回退 torch"""
+        if self.backend == "lexical":
+            print("📥 使用词重叠打分代替精排模型 (lexical)")
+            return LexicalScorer()
+        model_name = os.path.basename(config.RERANKER_MODEL_PATH)
+        # ONNX 是 CPU 后端：显式选择时直接加载，不导入 torch (仅首次导出模型时才需要)
+        if self.backend in ("onnx", "onnx-int8"):
+            try:
+                print(f"📥 加载重排序模型: {model_name} (后端: {self.backend}, 线程: {self.threads})")
+                return OnnxCrossEncoder(config.RERANKER_MODEL_PATH, self.max_length, self.threads,
+                                        quantize=self.backend == "onnx-int8")
+            except Exception as e:
+                print(f"⚠️ ONNX 后端加载失败，回退到 PyTorch: {e}")
+
+        import torch
+        from langchain_community.cross_encoders import HuggingFaceCrossEncoder
+
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        if device == "cpu" and self.threads:
+            torch.set_num_threads(self.threads)
+
+        if self.backend == "int8" and device == "cpu":
+            try:
+                print(f"📥 加载重排序模型: {model_name} (后端: int8 动态量化, 线程: {self.threads})")
+                model = HuggingFaceCrossEncoder(
+                    model_name=config.RERANKER_MODEL_PATH,
+                    model_kwargs={'device': 'cpu', 'max_length': self.max_length}
+                )
+                model.client.model = torch.quantization.quantize_dynamic(
+                    model.client.model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+                return model
+            except Exception as e:
+                print(f"⚠️ int8 量化失败，回退到 fp32: {e}")
+
+        self.backend = "torch"
+        print(f"📥 加载重排序模型: {model_name} (设备: {device}, max_length: {self.max_length})")
+        try:
+            return HuggingFaceCrossEncoder(
+                model_name=config.RERANKER_MODEL_PATH,
+                model_kwargs={'device': device, 'max_length': self.max_length}
+            )
+        except Exception as e:
+            print(f"⚠️ GPU 加载重排序模型失败，回退到 CPU: {e}")
+            return HuggingFaceCrossEncoder(
+                model_name=config.RERANKER_MODEL_PATH,
+                model_kwargs={'device': 'cpu', 'max_length': self.max_length}
+            )
+
+    def predict(self, pairs: List[List[str]], batch_size: Optional[int] = None) -> List[float]:
+        """兼容性调用：LangChain 0.3+ 可能会封装底层模型；batch_size 默认取构造参数"""
+        if not pairs:
+            return []
+        model = self.model or self.load()
+        batch_size = batch_size or self.batch_size
+        if hasattr(model, 'client') and hasattr(model.client, 'predict'):
+            scores = model.client.predict(pairs, batch_size=batch_size, show_progress_bar=False)
+        elif hasattr(model, 'predict'):
+            scores = model.predict(pairs, batch_size=batch_size)
+        else:
+            scores = model.score(pairs)
+        return [float(s) for s in scores]
+
+    def score(self, query: str, docs: Sequence[Document]) -> List[float]:
+        """
+        为 (query, doc) 打分：命中缓存的直接返回，内容完全相同的文档只计算一次。
+        缓存键为 (查询哈希, 文档 ID 或正文哈希)，文档 ID 取自 doc.id。
+        """
+        return self.score_many([(query, docs)])[0]
+
+    def score_many(self, groups: Sequence[Tuple[str, Sequence[Document]]],
+                   batch_size: Optional[int] = None) -> List[List[float]]:
+        """
+        多个查询的 (query, docs) 一并打分：全部未命中的 pair 去重后合并为一次 predict，
+        离线批量检索时用较大的 batch_size 摊薄每次前向的固定开销。
+        """
+        keys, scores = [], []
+        todo: Dict[Tuple[str, str], List[Tuple[int, int]]] = {}  # (查询, 正文) -> 需要回填的位置
+        with self._lock:
+            for g, (query, docs) in enumerate(groups):
+                q_key = _sha1(query)
+                keys.append([(q_key, d.id or _sha1(d.page_content)) for d in docs])
+                scores.append([0.0] * len(docs))
+                for i, (key, doc) in enumerate(zip(keys[g], docs)):
+                    if key in self._cache:
+                        self._cache.move_to_end(key)
+                        scores[g][i] = self._cache[key]
+                        self.hits += 1
+                    else:
+                        todo.setdefault((query, doc.page_content), []).append((g, i))
+                        self.misses += 1
+
+        if todo:
+            pairs = [list(p) for p in todo]
+            total = sum(len(docs) for _, docs in groups)
+            with tracer.span("精排模型", 对数=len(pairs), 缓存命中=total - len(pairs)):
+                if self.batcher is not None:
+                    fresh = self.batcher(pairs)
+                else:
+                    fresh = self.predict(pairs, batch_size)
+            with self._lock:
+                for slots, s in zip(todo.values(), fresh):
+                    for g, i in slots:
+                        scores[g][i] = s
+                        self._cache[keys[g][i]] = s
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
+    def rerank(self, query: str, docs: Sequence[Document], top_k: int) -> List[Tuple[Document, float]]:
+        try:
+            scores = self.score(query, docs)
+        except Overloaded:
+            raise  # 准入控制拒绝交给服务层处理，不降级
+        except Exception as e:
+            print(f"⚠️ 重排序失败: {e}，将按原始顺序排列")
+            scores = [1.0] * len(docs)
+        ranked = sorted(zip(docs, scores), key=lambda x: x[1], reverse=True)
+        return ranked[:top_k]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0, "entries": len(self._cache)}
+
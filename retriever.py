@@ -1,127 +1,332 @@
-import torch
-import pickle
-import os
-import networkx as nx
-import sys
-import importlib.util
-
-# --- 1. 绝对物理路径注入 (处理 langchain_classic 兼容性) ---
-ENSEMBLE_PATH = "/home/reusnak/neuro-symbolic-rag/.venv/lib/python3.12/site-packages/langchain_classic/retrievers/ensemble.py"
-SITE_PACKAGES = "/home/reusnak/neuro-symbolic-rag/.venv/lib/python3.12/site-packages"
-
-if SITE_PACKAGES not in sys.path:
-    sys.path.insert(0, SITE_PACKAGES)
-
-try:
-    spec = importlib.util.spec_from_file_location("ensemble_fixed", ENSEMBLE_PATH)
-    ensemble_module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(ensemble_module)
-    EnsembleRetriever = ensemble_module.EnsembleRetriever
-except:
-    from langchain.retrievers import EnsembleRetriever
-
-from langchain_community.cross_encoders import HuggingFaceCrossEncoder
+import time
+import threading
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
 import config
-from storage import StorageManager
+from context_packer import ContextPacker
+from embedding_cache import CachedEmbeddings
+from hybrid import HybridRetriever, weighted_rrf
+from reranker import Reranker
+from storage import StorageManager, loads_doc
+from tracing import tracer
+
+
+class StageTimer:
+    """按阶段记录耗时 (毫秒)，用于定位检索瓶颈；traced=True 时各阶段同时登记到当前追踪"""
+    def __init__(self, traced: bool = False):
+        self.timings: Dict[str, float] = {}
+        self.traced = traced
+        self._t = time.perf_counter()
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        self.timings[stage] = (now - self._t) * 1000
+        self._t = now
+        if self.traced:
+            tracer.record(stage, self.timings[stage])
+
+    def report(self) -> str:
+        parts = " | ".join(f"{k} {v:.0f}ms" for k, v in self.timings.items())
+        return f"⏱️ {parts} | 总计 {sum(self.timings.values()):.0f}ms"
+
+
+class IndexSet(NamedTuple):
+    """一次加载得到的整套检索组件：热加载时整体替换，单次查询从头到尾只使用同一套 (不会新旧混用)"""
+    vectorstore: Any = None
+    docstore: Any = None
+    bm25: Any = None
+    graph_index: Any = None
+    ensemble: Any = None
+
 
 class RAGRetriever:
-    def __init__(self):
+    def __init__(self, storage: Optional[StorageManager] = None,
+                 background: bool = config.WARMUP_IN_BACKGROUND):
+        """
+        background=True 时构造函数只做轻量初始化并立即返回：
+        向量库 / BM25 / 图谱索引与精排模型在两个后台线程中并行加载，首个查询在 retrieve() 中等待就绪。
+        各组件加载耗时记录在 startup_profile (毫秒)。
+        """
         print("⚙️ 正在初始化多模态检索引擎...")
-        self.storage = StorageManager()
-        
-        # 获取检索组件 (vectorstore, docstore, bm25)
-        components = self.storage.get_retriever_components()
-        # --- 变量名对齐：确保使用的是 self.docstore ---
-        self.vectorstore, self.docstore, self.bm25 = components
-            
-        self.graph = self.storage.load_graph()
-        
-        # 1. 初始化 Reranker (精排模型)
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        model_name = os.path.basename(config.RERANKER_MODEL_PATH)
-        print(f"📥 加载重排序模型: {model_name} (设备: {device})")
-        
+        t0 = time.perf_counter()
+        self.storage = storage or StorageManager()
+        self.startup_profile: Dict[str, float] = {"存储管理器": (time.perf_counter() - t0) * 1000}
+        self.last_timings: Dict[str, float] = {}
+        self.last_batch_timings: Dict[str, float] = {}
+        self.packer = ContextPacker()
+        self.last_packing: Dict[str, int] = {}
+
+        # 组件占位，由 _load_indexes / _load_reranker 填充；索引组件整体存放在一个 IndexSet 中
+        self.indexes = IndexSet()
+        self._swap_lock = threading.Lock()
+        # 索引热加载：入库 / 实时索引提交后版本文件变化，下一次查询前重新打开各索引
+        self.index_version: Optional[dict] = None
+        self._index_stamp = None
+        self._version_checked = time.monotonic()
+        self._reload_lock = threading.Lock()
+        # 精排对象先创建 (供服务层挂接微批)，模型延后加载
+        self.reranker = Reranker(lazy=True)
+
+        self._ready = threading.Event()
+        self._load_error: Optional[BaseException] = None
+        self._started = time.perf_counter()
+        self._pending = 2
+        self._pending_lock = threading.Lock()
+        if background:
+            for target in (self._load_indexes, self._load_reranker):
+                threading.Thread(target=self._run_loader, args=(target,), daemon=True,
+                                 name=f"warmup{target.__name__}").start()
+        else:
+            self._run_loader(self._load_indexes)
+            self._run_loader(self._load_reranker)
+            self.wait_ready()
+
+    # --- 启动 / 预热 ---
+    def _run_loader(self, target):
         try:
-            self.reranker = HuggingFaceCrossEncoder(
-                model_name=config.RERANKER_MODEL_PATH,
-                model_kwargs={'device': device}
-            )
-        except Exception as e:
-            print(f"⚠️ GPU 加载重排序模型失败，回退到 CPU: {e}")
-            self.reranker = HuggingFaceCrossEncoder(
-                model_name=config.RERANKER_MODEL_PATH,
-                model_kwargs={'device': 'cpu'}
-            )
-
-        # 2. 组合检索器 (混合召回：向量 + 关键词)
-        if self.vectorstore:
-            self.child_retriever = self.vectorstore.as_retriever(search_kwargs={"k": config.RETRIEVAL_K})
-            
-            if self.bm25:
-                self.bm25.k = config.RETRIEVAL_K
-                self.ensemble = EnsembleRetriever(
-                    retrievers=[self.bm25, self.child_retriever], 
-                    weights=[0.3, 0.7] 
+            target()
+        except BaseException as e:
+            self._load_error = e
+            print(f"❌ 检索组件加载失败: {e}")
+        with self._pending_lock:
+            self._pending -= 1
+            done = self._pending == 0
+        if done:
+            self.startup_profile["就绪总耗时"] = (time.perf_counter() - self._started) * 1000
+            print("🚀 检索引擎就绪: " + self.profile_report())
+            self._ready.set()
+
+    def _load_indexes(self):
+        profile = StageTimer()
+        # 先取版本指纹再打开索引：加载期间若有新提交，下一次检查仍会触发热加载
+        self._index_stamp = self.storage.index_stamp()
+        self.index_version = self.storage.read_index_version()
+        # 获取检索组件 (vectorstore, docstore, bm25)；全部先构建为局部变量，最后一次性替换
+        vectorstore, docstore, bm25 = self.storage.get_retriever_components(profile)
+
+        # 图谱索引 (CSR + memmap)，查询路径不加载 networkx
+        graph_index = self.storage.load_graph_index()
+        profile.lap("图谱索引")
+
+        # 组合检索器 (混合召回：向量 + 关键词)
+        ensemble = None
+        if vectorstore:
+            child_retriever = vectorstore.as_retriever(search_kwargs={"k": config.RETRIEVAL_K})
+
+            if bm25:
+                bm25.k = config.RETRIEVAL_K
+                # 两路并发召回 + 加权 RRF；向量路超时则降级为仅 BM25
+                ensemble = HybridRetriever(
+                    retrievers=[bm25, child_retriever],
+                    weights=config.RECALL_WEIGHTS,
+                    timeouts=[config.BM25_TIMEOUT, config.VECTOR_TIMEOUT],
+                    names=["BM25", "向量"]
                 )
             else:
                 print("⚠️ 未发现 BM25 索引，仅使用向量检索。")
-                self.ensemble = self.child_retriever
-        else:
-            self.ensemble = None
+                ensemble = child_retriever
+        with self._swap_lock:
+            self.indexes = IndexSet(vectorstore, docstore, bm25, graph_index, ensemble)
+        if not self._ready.is_set():
+            self.startup_profile.update(profile.timings)
 
-    def _get_parent_content(self, child_docs):
-        """还原父文档：使用 self.docstore (对齐 StorageManager)"""
-        parent_ids = list({d.metadata.get("doc_id") for d in child_docs if "doc_id" in d.metadata})
-        if not parent_ids: 
-            return []
-        
-        # --- 关键修改：确保变量名是 docstore ---
-        bytes_data = self.docstore.mget(parent_ids)
-        return [pickle.loads(b) for b in bytes_data if b]
+    def _load_reranker(self):
+        # 精排模型 (torch / ONNX 在此才导入)，带批处理与分数缓存
+        t0 = time.perf_counter()
+        self.reranker.load()
+        self.startup_profile["精排模型"] = (time.perf_counter() - t0) * 1000
+
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """等待后台加载完成；加载失败时抛出原始异常"""
+        if not self._ready.wait(timeout):
+            return False
+        if self._load_error is not None:
+            raise self._load_error
+        return True
+
+    def _maybe_reload(self):
+        """
+        查询入口调用：每 LIVE_RELOAD_INTERVAL 秒至多 stat 一次版本文件；版本变化时由一个线程重新打开索引，
+        其余并发查询不等待，继续使用旧组件 (新组件整体替换后对后续查询生效)。
+        """
+        now = time.monotonic()
+        if now - self._version_checked < config.LIVE_RELOAD_INTERVAL:
+            return
+        self._version_checked = now
+        if self.storage.index_stamp() == self._index_stamp or not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            t0 = time.perf_counter()
+            self.storage.reopen()
+            self._load_indexes()
+            version = (self.index_version or {}).get("version")
+            print(f"🔄 索引已热加载 (v{version}, {(time.perf_counter() - t0) * 1000:.0f}ms)")
+        except Exception as e:
+            print(f"⚠️ 索引热加载失败: {e}，继续使用旧索引")
+        finally:
+            self._reload_lock.release()
+
+    def profile_report(self) -> str:
+        return " | ".join(f"{k} {v:.0f}ms" for k, v in self.startup_profile.items())
+
+    # 兼容只读访问 (脚本 / 调试)：查询路径内部应先取一次 self.indexes 再全程使用
+    @property
+    def vectorstore(self):
+        return self.indexes.vectorstore
+
+    @property
+    def docstore(self):
+        return self.indexes.docstore
 
-    def _graph_enhance(self, source_name, seen_sources):
+    @property
+    def bm25(self):
+        return self.indexes.bm25
+
+    @property
+    def graph_index(self):
+        return self.indexes.graph_index
+
+    @property
+    def ensemble(self):
+        return self.indexes.ensemble
+
+    def _fetch_parents(self, parent_ids: Iterable[str], ix: IndexSet) -> Dict[str, Document]:
+        """一次 mget 取回父块 (缺失的跳过)"""
+        parent_ids = list(parent_ids)
+        if not parent_ids:
+            return {}
+        parents = {}
+        for pid, b in zip(parent_ids, ix.docstore.mget(parent_ids)):
+            if b:
+                doc = loads_doc(b)
+                doc.id = pid  # 父块 ID 作为精排缓存键
+                parents[pid] = doc
+        return parents
+
+    def _get_parent_content(self, child_docs, ix: IndexSet):
+        """还原父文档"""
+        # 按召回排名去重 (精排同分时保持召回顺序，与 search_batch 一致)
+        parent_ids = dict.fromkeys(d.metadata["doc_id"] for d in child_docs if "doc_id" in d.metadata)
+        return list(self._fetch_parents(parent_ids, ix).values())
+
+    @staticmethod
+    def _graph_enhance(graph_index, source_name, seen_sources):
         """图谱增强：寻找 Obsidian 中的双链关联"""
-        if self.graph is None or not self.graph.has_node(source_name): 
+        if graph_index is None:
             return ""
-        neighbors = [n for n in self.graph.neighbors(source_name) if n not in seen_sources]
+        neighbors = [n for n in graph_index.neighbors(source_name) if n not in seen_sources]
         if not neighbors: 
             return ""
         return f"\n   [💡 关联笔记建议]: {', '.join(neighbors[:3])}"
 
-    def search(self, query):
-        """核心检索流程：混合召回 -> 父块映射 -> 重排序 -> 图谱增强"""
-        if self.ensemble is None:
-            return "❌ 系统尚未初始化，请先运行数据注入脚本。"
-
-        # (1) 混合召回子文档块
-        child_docs = self.ensemble.invoke(query)
-        
-        # (2) 映射回具有完整语义的父文档
-        parents = self._get_parent_content(child_docs)
-        if not parents: 
-            return "未找到相关背景知识。"
-
-        # (3) 重排序 (Rerank)：解决 predict 属性丢失问题
-        pairs = [[query, doc.page_content] for doc in parents]
-        
-        try:
-            # 兼容性调用：LangChain 0.3+ 可能会封装底层模型
-            if hasattr(self.reranker, 'model') and hasattr(self.reranker.model, 'predict'):
-                scores = self.reranker.model.predict(pairs)
-            elif hasattr(self.reranker, 'predict'):
-                scores = self.reranker.predict(pairs)
-            else:
-                # 最后的保底方案
-                print("⚠️ 无法在 Reranker 上找到 predict 方法，尝试直接调用底层的 client")
-                scores = self.reranker.client.predict(pairs)
-        except Exception as e:
-            print(f"⚠️ 重排序失败: {e}，将按原始顺序排列")
-            scores = [1.0] * len(parents)
+    @staticmethod
+    def _graph_expand_ids(graph_index, sources: Sequence[str], exclude: Sequence[str]) -> List[str]:
+        if not config.GRAPH_EXPAND or graph_index is None:
+            return []
+        return graph_index.expand(
+            sources,
+            exclude=exclude,
+            neighbors_per_note=config.GRAPH_EXPAND_NEIGHBORS,
+            parents_per_note=config.GRAPH_EXPAND_PARENTS,
+            max_total=config.GRAPH_EXPAND_MAX,
+        )
 
-        ranked = sorted(zip(parents, scores), key=lambda x: x[1], reverse=True)
-        top_docs = [doc for doc, score in ranked[:config.RERANK_TOP_K]]
+    def _graph_expand(self, parents, ix: IndexSet):
+        """图谱扩展：命中笔记的 1 跳双链邻居的父块作为额外精排候选"""
+        extra_ids = self._graph_expand_ids(
+            ix.graph_index, [p.metadata.get("source") for p in parents], [p.id for p in parents])
+        return list(self._fetch_parents(extra_ids, ix).values())
+
+    def search(self, query, cancel=None):
+        """
+        核心检索流程：混合召回 -> 父块映射 -> 图谱扩展 -> 重排序 -> 图谱增强
+        cancel: 可选 threading.Event，置位后在进入精排前提前返回 (用于投机检索被路由否决时)
+        """
+        return self.retrieve(query, cancel)[0]
+
+    def retrieve(self, query, cancel=None):
+        """与 search 相同，额外返回上下文所用父块 ID (供答案缓存做失效追踪)"""
+        with tracer.trace("检索", query=query[:50]) as span:
+            return self._retrieve(query, cancel, span)
+
+    def _retrieve(self, query, cancel, span):
+        timer = StageTimer(traced=True)
+        if not self.is_ready():
+            self.wait_ready()
+            timer.lap("等待就绪")
+        self._maybe_reload()
+        ix = self.indexes  # 本次查询全程使用同一套组件，热加载的整体替换不会中途混入
+        if ix.ensemble is None:
+            return "❌ 系统尚未初始化，请先运行数据注入脚本。", []
+
+        # (1) 混合召回子文档块 (BM25 与向量并发)
+        child_docs = ix.ensemble.invoke(query)
+        timer.lap("召回")
+        span.count("召回候选", len(child_docs))
+        if not child_docs:
+            return "未找到相关背景知识。", []
+        if cancel is not None and cancel.is_set():
+            return "", []
+
+        if config.RERANK_ON == "child":
+            # (2') 先对较短的子块精排，再只映射 top 子块对应的父块
+            ranked_children = self.reranker.rerank(query, child_docs, len(child_docs))
+            timer.lap("精排")
+            best: Dict[str, float] = {}
+            for doc, score in ranked_children:
+                pid = doc.metadata.get("doc_id")
+                if pid and pid not in best:
+                    best[pid] = score
+            top_ids = list(best)[:config.CONTEXT_CANDIDATES if config.CONTEXT_PACKING else config.RERANK_TOP_K]
+            parents = {p.id: p for p in self._get_parent_content(
+                [d for d, _ in ranked_children if d.metadata.get("doc_id") in top_ids], ix)}
+            ranked = [(parents[i], best[i]) for i in top_ids if i in parents]
+            timer.lap("父块")
+            span.count("父块", len(parents))
+            if not ranked:
+                return "未找到相关背景知识。", []
+        else:
+            # (2) 映射回具有完整语义的父文档
+            parents = self._get_parent_content(child_docs, ix)
+            timer.lap("父块")
+            span.count("父块", len(parents))
+            if not parents: 
+                return "未找到相关背景知识。", []
+            extra = self._graph_expand(parents, ix)
+            parents += extra
+            timer.lap("图谱")
+            span.count("图谱扩展", len(extra))
+
+            # (3) 重排序 (Rerank)：批处理 + 截断 + 分数缓存
+            ranked = self.reranker.rerank(
+                query, parents, config.CONTEXT_CANDIDATES if config.CONTEXT_PACKING else config.RERANK_TOP_K)
+            timer.lap("精排")
+
+        context, used_ids, packing = self._assemble(ranked, ix.graph_index)
+        if config.CONTEXT_PACKING:
+            self.last_packing = packing
+            timer.lap("打包")
+            span.set(上下文token=packing["上下文token"], 基线token=packing["基线token"])
+        else:
+            timer.lap("组装")
+        self.last_timings = timer.timings
+        print(timer.report())
+        return context, used_ids
 
-        # (4) 组装最终上下文
+    def _assemble(self, ranked: Sequence[Tuple[Document, float]],
+                  graph_index) -> Tuple[str, List[str], Dict[str, int]]:
+        """精排结果 -> (上下文, 入选父块 ID, 打包统计)"""
+        if config.CONTEXT_PACKING:
+            # (4) 在 token 预算内打包：去重叠、合并相邻章节、按分数/token 取舍
+            return self.packer.pack(ranked, hint=lambda src, seen: self._graph_enhance(graph_index, src, seen))
+
+        # (4') 组装最终上下文 (旧行为：直接拼接前 RERANK_TOP_K 个父块)
+        top_docs = [doc for doc, score in ranked[:config.RERANK_TOP_K]]
         context_parts = []
         seen_sources = set()
         for doc in top_docs:
@@ -134,8 +339,105 @@ class RAGRetriever:
             if h2: path_info += f" -> {h2}"
 
             header = f"【来源: {src}{path_info}】"
-            graph_info = self._graph_enhance(src, seen_sources)
+            graph_info = self._graph_enhance(graph_index, src, seen_sources)
             
             context_parts.append(f"{header}\n{doc.page_content}{graph_info}")
+        return "\n\n".join(context_parts), [doc.id for doc in top_docs], {}
+
+    # --- 离线批量检索 ---
+    def search_batch(self, queries: Sequence[str]) -> List[dict]:
+        """
+        批量检索 (夜间回归 / 分析任务)：流程与逐条 retrieve 相同，但每个阶段在整批上只执行一次 ——
+        查询嵌入合并请求，BM25 稀疏矩阵打分，向量库一次多向量查询，父块 (含图谱扩展) 一次去重 mget，
+        全部 (查询, 候选) pair 以 BATCH_RERANK_SIZE 大批量精排。召回两路不设超时，也不做降级。
+        返回每条查询的 {"context", "parent_ids", "ranked": [(父块 ID, 来源, 分数)]}；各阶段耗时见 last_batch_timings。
+        """
+        queries = list(queries)
+        with tracer.trace("批量检索", 条数=len(queries)) as span:
+            timer = StageTimer(traced=True)
+            if not self.is_ready():
+                self.wait_ready()
+                timer.lap("等待就绪")
+            self._maybe_reload()
+            ix = self.indexes
+            if ix.vectorstore is None:
+                return [{"context": "❌ 系统尚未初始化，请先运行数据注入脚本。", "parent_ids": [], "ranked": []}
+                        for _ in queries]
+
+            # (1) 两路召回 + 逐条 RRF 融合
+            children = self._recall_batch(queries, timer, ix)
+            span.count("召回候选", sum(map(len, children)))
+            n_keep = config.CONTEXT_CANDIDATES if config.CONTEXT_PACKING else config.RERANK_TOP_K
+
+            if config.RERANK_ON == "child":
+                # (2') 子块精排 -> 每条查询取 top 父块 -> 一次 mget
+                scores = self.reranker.score_many(list(zip(queries, children)), config.BATCH_RERANK_SIZE)
+                timer.lap("精排")
+                best_ids = []
+                for docs, doc_scores in zip(children, scores):
+                    best: Dict[str, float] = {}
+                    for doc, score in sorted(zip(docs, doc_scores), key=lambda x: x[1], reverse=True):
+                        pid = doc.metadata.get("doc_id")
+                        if pid and pid not in best:
+                            best[pid] = score
+                    best_ids.append(dict(list(best.items())[:n_keep]))
+                parents = self._fetch_parents({pid for best in best_ids for pid in best}, ix)
+                ranked_all = [[(parents[i], s) for i, s in best.items() if i in parents] for best in best_ids]
+                timer.lap("父块")
+            else:
+                # (2) 命中父块与图谱扩展父块合并为一次去重 mget (扩展按子块携带的来源计算)
+                candidate_ids = []
+                for docs in children:
+                    ids = list(dict.fromkeys(d.metadata["doc_id"] for d in docs if "doc_id" in d.metadata))
+                    sources = list(dict.fromkeys(d.metadata.get("source") for d in docs))
+                    candidate_ids.append(ids + self._graph_expand_ids(ix.graph_index, sources, ids) if ids else [])
+                parents = self._fetch_parents(dict.fromkeys(i for ids in candidate_ids for i in ids), ix)
+                candidates = [[parents[i] for i in ids if i in parents] for ids in candidate_ids]
+                timer.lap("父块")
+                span.count("父块", len(parents))
+
+                # (3) 全部 (查询, 父块) pair 合并精排
+                scores = self.reranker.score_many(list(zip(queries, candidates)), config.BATCH_RERANK_SIZE)
+                ranked_all = [sorted(zip(docs, s), key=lambda x: x[1], reverse=True)[:n_keep]
+                              for docs, s in zip(candidates, scores)]
+                timer.lap("精排")
+
+            # (4) 逐条组装上下文
+            results = []
+            for ranked in ranked_all:
+                if not ranked:
+                    results.append({"context": "未找到相关背景知识。", "parent_ids": [], "ranked": []})
+                    continue
+                context, used_ids, _ = self._assemble(ranked, ix.graph_index)
+                results.append({"context": context, "parent_ids": used_ids,
+                                "ranked": [(d.id, d.metadata.get("source", "未知"), float(s)) for d, s in ranked]})
+            timer.lap("打包" if config.CONTEXT_PACKING else "组装")
+            self.last_batch_timings = timer.timings
+            return results
+
+    def _recall_batch(self, queries: List[str], timer: StageTimer, ix: IndexSet) -> List[List[Document]]:
+        """批量召回：查询嵌入按 EMBED_BATCH_SIZE 分段合并请求，向量库多向量查询，BM25 一次稀疏打分"""
+        embedding = self.storage.embedding
+        vectors = []
+        for start in range(0, len(queries), config.EMBED_BATCH_SIZE):
+            batch = queries[start:start + config.EMBED_BATCH_SIZE]
+            # 带缓存时与单条查询共用查询嵌入缓存；Ollama 的查询与文档嵌入相同，可直接批量
+            if isinstance(embedding, CachedEmbeddings):
+                vectors.extend(embedding.embed_queries(batch))
+            else:
+                vectors.extend(embedding.embed_documents(batch))
+        timer.lap("查询嵌入")
+
+        hits = ix.vectorstore._collection.query(
+            query_embeddings=vectors, n_results=config.RETRIEVAL_K, include=["documents", "metadatas"])
+        vector_lists = [[Document(id=i, page_content=d, metadata=m or {}) for i, d, m in zip(*row)]
+                        for row in zip(hits["ids"], hits["documents"], hits["metadatas"])]
+        timer.lap("向量召回")
+        if ix.bm25 is None:
+            return vector_lists
 
-        return "\n\n".join(context_parts)
\ No newline at end of file
+        index = ix.bm25.index
+        bm25_lists = [[index.get_document(i) for i, _ in found]
+                      for found in index.search_batch(queries, config.RETRIEVAL_K)]
+        timer.lap("BM25")
+        return [weighted_rrf([b, v], config.RECALL_WEIGHTS) for b, v in zip(bm25_lists, vector_lists)]
@@ -0,0 +1,398 @@
+# 端到端基准：生成合成 Obsidian 仓库 (Markdown + PDF) -> 入库 -> 标注查询检索 + 生成，全程使用本地 Ollama 桩服务。
+# 报告入库吞吐、磁盘索引大小、各阶段查询延迟、峰值内存与 recall@k，结果写为 JSON 便于跨提交对比。
+# 用法: PYTHONPATH=. python -m scripts.bench_e2e --notes 300 --pdfs 20 --queries 100
+#       比较参数: ... --set RETRIEVAL_K=20 --set RERANK_TOP_K=5 --set "RECALL_WEIGHTS=[0.5, 0.5]"
+#       分片入库: ... --shards 2；真实精排模型: --set RERANKER_BACKEND='"torch"'
+#       上下文打包前后对比 (token 节省与首字延迟): ... --set CONTEXT_PACKING=False
+#
+# 入库与查询各在独立子进程中运行 (峰值 RSS 互不干扰)。子进程在导入其他模块前按环境变量
+# RAG_BENCH_CONFIG 改写 config，分片入库的 spawn 工作进程重新导入本模块时同样生效。
+import argparse
+import ast
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import config
+
+ENV_KEY = "RAG_BENCH_CONFIG"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 结果中记录的检索参数 (加上 --set 覆盖的键)
+TRACKED = ["PARENT_CHUNK_SIZE", "CHILD_CHUNK_SIZE", "RETRIEVAL_K", "RERANK_TOP_K", "RERANK_ON",
+           "RECALL_WEIGHTS", "BM25_TOKENIZER", "RERANKER_BACKEND", "GRAPH_EXPAND",
+           "CONTEXT_PACKING", "CONTEXT_TOKEN_BUDGET", "CONTEXT_CANDIDATES", "VECTOR_BACKEND"]
+
+
+def _patch_config(overrides):
+    """把持久化路径整体移到工作目录下，再应用其余覆盖项"""
+    persist = overrides.get("PERSIST_DIR")
+    if persist:
+        for key in ("DB_PATH", "DOC_STORE_PATH", "GRAPH_PATH", "GRAPH_INDEX_DIR", "BM25_INDEX_DIR",
+                    "VECTOR_INDEX_DIR", "MANIFEST_PATH", "INDEX_VERSION_PATH", "ANSWER_CACHE_INVALIDATION_LOG"):
+            setattr(config, key, os.path.join(persist, os.path.relpath(getattr(config, key), config.PERSIST_DIR)))
+    for key, value in overrides.items():
+        setattr(config, key, value)
+
+
+if os.environ.get(ENV_KEY):
+    _patch_config(json.loads(os.environ[ENV_KEY]))
+
+
+# ---------------------------------------------------------------- 合成仓库
+
+SURNAMES = "赵钱孙李周吴郑王冯陈褚卫蒋沈韩杨朱秦尤许何吕施张孔曹严华金魏陶姜"
+GIVEN = "伟芳娜敏静丽强磊军洋勇艳杰涛明超秀霞平刚桂英华玉兰辉鹏飞宇轩浩然子涵"
+TERMS = ["检索增强生成", "向量数据库", "倒排索引", "知识图谱", "交叉编码器", "父子分块", "双链笔记",
+         "嵌入模型", "近似最近邻", "查询重写", "上下文窗口", "语义相似度", "关键词召回", "量化推理",
+         "批处理调度", "缓存失效", "分词器", "混合检索", "重排序", "文档切分"]
+VERBS = ["依赖", "改进了", "替代了", "补充了", "限制了", "加速了", "简化了", "影响"]
+EN_WORDS = ["retrieval", "index", "vector", "graph", "latency", "throughput", "embedding", "reranker",
+            "chunk", "query", "cache", "storage", "pipeline", "benchmark", "model", "corpus"]
+
+
+def _person(rng):
+    return rng.choice(SURNAMES) + "".join(rng.choice(GIVEN) for _ in range(2))
+
+
+def _code(rng, prefix, used):
+    while True:
+        code = f"{prefix}-{rng.randint(1000, 9999)}"
+        if code not in used:
+            used.add(code)
+            return code
+
+
+def _filler(rng, sentences):
+    return "".join(f"{rng.choice(TERMS)}{rng.choice(VERBS)}{rng.choice(TERMS)}，"
+                   f"在{rng.choice(TERMS)}场景中尤为明显。" for _ in range(sentences))
+
+
+def _en_filler(rng, sentences):
+    return " ".join(" ".join(rng.choice(EN_WORDS) for _ in range(12)).capitalize() + "."
+                    for _ in range(sentences))
+
+
+def _link(rng, notes, i):
+    """随机一种双链写法：笔记名 / 带目录 / 带标题锚点 / 别名加显示文本"""
+    folder, name, alias = notes[i]
+    return rng.choice([f"[[{name}]]", f"[[{folder}/{name}]]", f"[[{name}#第 1 节]]", f"[[{alias}|参见]]"])
+
+
+def generate_vault(vault, n_notes, n_pdfs, sections, seed):
+    """返回标注查询列表 [{query, source, kind}]：每篇笔记 / 每个 PDF 含一条唯一事实"""
+    import fitz
+
+    rng = random.Random(seed)
+    used = set()
+    notes = [(f"专题{i % 8}", f"笔记{i:04d}", f"别名{i:04d}") for i in range(n_notes)]
+    labels = []
+    for i, (folder, name, alias) in enumerate(notes):
+        os.makedirs(os.path.join(vault, folder), exist_ok=True)
+        code, owner, budget = _code(rng, "ZX", used), _person(rng), rng.randint(10, 900)
+        fact_at = rng.randrange(sections)
+        parts = [f"---\naliases: [{alias}]\ntags: [bench]\n---\n", f"# {name}\n", _filler(rng, 2) + "\n"]
+        for s in range(sections):
+            links = " ".join(_link(rng, notes, rng.randrange(n_notes)) for _ in range(rng.randint(0, 2)))
+            body = _filler(rng, rng.randint(4, 10))
+            if s == fact_at:
+                body += f"项目代号 {code} 由{owner}负责，预算 {budget} 万元。" + _filler(rng, 2)
+            parts.append(f"\n## 第 {s + 1} 节\n{body} {links}\n")
+        with open(os.path.join(vault, folder, f"{name}.md"), "w", encoding="utf-8") as f:
+            f.write("".join(parts))
+        labels.append({"query": f"项目代号 {code} 由谁负责？预算多少？", "source": name, "kind": "md"})
+
+    os.makedirs(os.path.join(vault, "papers"), exist_ok=True)
+    for i in range(n_pdfs):
+        name = f"paper{i:03d}"
+        code, owner = _code(rng, "PX", used), f"{rng.choice(EN_WORDS).title()} {rng.choice(EN_WORDS).title()}"
+        fact_page = rng.randrange(3)
+        doc = fitz.open()
+        for p in range(3):
+            text = _en_filler(rng, 10)
+            if p == fact_page:
+                text += f" Project code {code} is owned by {owner}. " + _en_filler(rng, 3)
+            doc.new_page().insert_textbox(fitz.Rect(50, 50, 545, 792), text, fontsize=10)
+        doc.save(os.path.join(vault, "papers", f"{name}.pdf"))
+        doc.close()
+        labels.append({"query": f"Who owns project code {code}?", "source": name, "kind": "pdf"})
+    return labels
+
+
+# ---------------------------------------------------------------- 子进程阶段
+
+def _peak_rss_mb():
+    """本进程与已回收子进程 (分片工作进程) 的峰值 RSS，ru_maxrss 在 Linux 下以 KB 为单位"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return {"self": own, "children": children}
+
+
+def _dir_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+
+def phase_ingest(args):
+    from ingest import SUPPORTED_EXTS, full_ingest
+    from loader import ContentLoader
+    from manifest import FileManifest
+    from splitter import TextSplitterFactory
+    from storage import StorageManager
+
+    storage = StorageManager()
+    loader = ContentLoader()
+    paths = [p for p in loader.scan_vault() if os.path.splitext(p)[1].lower() in SUPPORTED_EXTS]
+    input_bytes = sum(os.path.getsize(p) for p in paths)
+
+    t0 = time.perf_counter()
+    if args.shards > 1:
+        from shard_ingest import sharded_ingest
+        if not sharded_ingest(storage, paths, args.shards):
+            raise RuntimeError("分片入库失败")
+    else:
+        full_ingest(storage, loader, TextSplitterFactory(), paths)
+    seconds = time.perf_counter() - t0
+
+    children = storage._open_vectorstore()._collection.count()
+    parents = sum(len(ids) for ids in FileManifest().parents_by_source().values())
+    sizes = {name: _dir_size(os.path.join(config.PERSIST_DIR, name))
+             for name in sorted(os.listdir(config.PERSIST_DIR))}
+    return {
+        "files": len(paths),
+        "input_mb": input_bytes / (1 << 20),
+        "parents": parents,
+        "children": children,
+        "seconds": seconds,
+        "files_per_s": len(paths) / seconds,
+        "children_per_s": children / seconds,
+        "index_bytes": sizes,
+        "index_total_mb": sum(sizes.values()) / (1 << 20),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _summary(values):
+    arr = np.asarray(values, dtype=float)
+    if not len(arr):
+        return {}
+    p50, p95 = np.percentile(arr, [50, 95])
+    return {"mean": float(arr.mean()), "p50": float(p50), "p95": float(p95)}
+
+
+def phase_query(args):
+    from generator import RAGGenerator
+    from retriever import RAGRetriever
+    from storage import loads_doc
+
+    with open(args.labels, "r", encoding="utf-8") as f:
+        labels = json.load(f)[:args.queries]
+
+    t0 = time.perf_counter()
+    engine = RAGRetriever(background=False)
+    startup_ms = (time.perf_counter() - t0) * 1000
+    generator = RAGGenerator(base_url=config.OLLAMA_BASE_URL) if args.generate else None
+
+    stages, totals, ttft, gen_total, packing, context_chars = {}, [], [], [], {}, []
+    hits = {"recall_at_k": 0, "hit_at_1": 0, "candidate_recall": 0}
+    by_kind = {}
+    for item in labels:
+        query, target = item["query"], item["source"]
+        t0 = time.perf_counter()
+        context, parent_ids = engine.retrieve(query)
+        totals.append((time.perf_counter() - t0) * 1000)
+        context_chars.append(len(context))
+        for stage, ms in engine.last_timings.items():
+            stages.setdefault(stage, []).append(ms)
+        for key, value in engine.last_packing.items():
+            packing.setdefault(key, []).append(value)
+
+        sources = [loads_doc(b).metadata.get("source") for b in engine.docstore.mget(parent_ids) if b]
+        candidates = {d.metadata.get("source") for d in engine.ensemble.invoke(query)}
+        found = target in sources
+        hits["recall_at_k"] += found
+        hits["hit_at_1"] += bool(sources) and sources[0] == target
+        hits["candidate_recall"] += target in candidates
+        kind = by_kind.setdefault(item["kind"], [0, 0])
+        kind[0] += found
+        kind[1] += 1
+
+        if generator is not None:
+            t0 = time.perf_counter()
+            first = None
+            for _ in generator.generate_stream(query, context):
+                if first is None:
+                    first = (time.perf_counter() - t0) * 1000
+            gen_total.append((time.perf_counter() - t0) * 1000)
+            ttft.append(first or gen_total[-1])
+
+    n = len(labels)
+    if ttft:
+        stages["生成首字"] = ttft
+        stages["生成"] = gen_total
+    return {
+        "queries": n,
+        "k": "packed" if config.CONTEXT_PACKING else config.RERANK_TOP_K,
+        "startup_ms": startup_ms,
+        **{name: count / n for name, count in hits.items()},
+        "recall_by_kind": {kind: found / total for kind, (found, total) in by_kind.items()},
+        "retrieve_ms": _summary(totals),
+        "context_chars": _summary(context_chars),
+        # 打包统计 (CONTEXT_PACKING=True)：上下文token 对比 基线token 即 prompt 节省量
+        "packing": {key: float(np.mean(v)) for key, v in packing.items()},
+        "stage_ms": {stage: _summary(v) for stage, v in stages.items()},
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+# ---------------------------------------------------------------- 调度
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return out.stdout.strip() + ("-dirty" if dirty else "")
+    except OSError:
+        return None
+
+
+def _run_phase(phase, args, overrides):
+    env = dict(os.environ, **{ENV_KEY: json.dumps(overrides)})
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    out_path = os.path.join(args.workdir, f"{phase}.json")
+    cmd = [sys.executable, "-m", "scripts.bench_e2e", "--phase", phase, "--phase-out", out_path,
+           "--labels", os.path.join(args.workdir, "queries.json"), "--queries", str(args.queries),
+           "--shards", str(args.shards)] + (["--no-generate"] if not args.generate else [])
+    print(f"▶️ 阶段: {phase}")
+    subprocess.run(cmd, cwd=ROOT, env=env, check=True)
+    with open(out_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _parse_sets(items):
+    overrides = {}
+    for item in items:
+        key, _, value = item.partition("=")
+        if not hasattr(config, key):
+            raise SystemExit(f"config 中没有 {key}")
+        try:
+            overrides[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            overrides[key] = value  # 裸字符串，如 RERANK_ON=child
+    return overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端检索基准 (合成仓库 + Ollama 桩服务)")
+    parser.add_argument("--notes", type=int, default=200, help="Markdown 笔记数")
+    parser.add_argument("--pdfs", type=int, default=10, help="PDF 文件数 (每个 3 页)")
+    parser.add_argument("--sections", type=int, default=4, help="每篇笔记的二级标题数")
+    parser.add_argument("--queries", type=int, default=100, help="最多评测的标注查询数")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="覆盖 config 项 (值按 Python 字面量解析)，可重复")
+    parser.add_argument("--no-generate", dest="generate", action="store_false", help="跳过生成阶段")
+    parser.add_argument("--port", type=int, default=11511, help="桩服务端口")
+    parser.add_argument("--embed-latency", type=float, default=5.0, help="桩 embed 每次调用固定耗时 (ms)")
+    parser.add_argument("--token-delay", type=float, default=2.0, help="桩生成每个 token 间隔 (ms)")
+    parser.add_argument("--prefill-ms", type=float, default=50.0,
+                        help="桩每千字符提示词的 prefill 耗时 (ms)，使首字延迟随上下文长度变化")
+    parser.add_argument("--workdir", help="仓库与索引目录 (默认临时目录，结束后删除)")
+    parser.add_argument("--out", default=os.path.join(ROOT, "bench_results"), help="结果 JSON 输出目录")
+    # 内部参数：子进程阶段
+    parser.add_argument("--phase", choices=["ingest", "query"], help=argparse.SUPPRESS)
+    parser.add_argument("--phase-out", help=argparse.SUPPRESS)
+    parser.add_argument("--labels", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase:
+        result = (phase_ingest if args.phase == "ingest" else phase_query)(args)
+        with open(args.phase_out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        return
+
+    from scripts.ollama_stub import start_stub
+
+    keep = bool(args.workdir)
+    args.workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="rag_bench_"))
+    vault = os.path.join(args.workdir, "vault")
+    if os.path.exists(vault):
+        shutil.rmtree(vault)
+    print(f"🏗️ 生成合成仓库: {args.notes} 篇笔记 / {args.pdfs} 个 PDF -> {vault}")
+    labels = generate_vault(vault, args.notes, args.pdfs, args.sections, args.seed)
+    random.Random(args.seed).shuffle(labels)
+    with open(os.path.join(args.workdir, "queries.json"), "w", encoding="utf-8") as f:
+        json.dump(labels, f, ensure_ascii=False)
+
+    server, stub_stats = start_stub(args.port, embed_latency=args.embed_latency, token_delay=args.token_delay,
+                                    prefill_ms=args.prefill_ms)
+    stub_url = f"http://127.0.0.1:{args.port}"
+    user_sets = _parse_sets(args.set)
+    overrides = {
+        "VAULT_PATH": vault,
+        "PERSIST_DIR": os.path.join(args.workdir, "storage_data"),
+        "SHARD_WORK_DIR": os.path.join(args.workdir, "shard_work"),
+        "EMBED_CACHE_ENABLED": False,  # 每次都真实走嵌入链路，吞吐才可比
+        "OLLAMA_BASE_URL": stub_url,
+        "OLLAMA_ENDPOINTS": [stub_url],
+        "RERANKER_BACKEND": "lexical",
+        "WARMUP_IN_BACKGROUND": False,
+        **user_sets,
+    }
+    try:
+        ingest_stats = _run_phase("ingest", args, overrides)
+        query_stats = _run_phase("query", args, overrides)
+    finally:
+        server.shutdown()
+        if not keep:
+            shutil.rmtree(args.workdir, ignore_errors=True)
+
+    for key, value in overrides.items():
+        setattr(config, key, value)
+    result = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {"notes": args.notes, "pdfs": args.pdfs, "sections": args.sections, "queries": args.queries,
+                   "shards": args.shards, "seed": args.seed, "embed_latency_ms": args.embed_latency,
+                   "prefill_ms_per_kchar": args.prefill_ms},
+        "config": {key: getattr(config, key) for key in dict.fromkeys(TRACKED + list(user_sets))},
+        "ingest": ingest_stats,
+        "query": query_stats,
+        "stub": stub_stats.as_dict(),
+    }
+    os.makedirs(args.out, exist_ok=True)
+    out_path = os.path.join(args.out, f"bench_{result['commit'] or 'nogit'}_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    q = query_stats
+    print(f"\n📊 入库 {ingest_stats['files']} 文件 / {ingest_stats['children']} 子块 | "
+          f"{ingest_stats['seconds']:.1f}s ({ingest_stats['files_per_s']:.1f} 文件/s) | "
+          f"索引 {ingest_stats['index_total_mb']:.1f} MB | 峰值 RSS {ingest_stats['peak_rss_mb']['self']:.0f} MB")
+    print(f"🎯 recall@{q['k']} {q['recall_at_k']:.3f} | hit@1 {q['hit_at_1']:.3f} | "
+          f"候选召回 {q['candidate_recall']:.3f} | 峰值 RSS {q['peak_rss_mb']['self']:.0f} MB")
+    if q["packing"]:
+        p = q["packing"]
+        print(f"📦 上下文 {p['上下文token']:.0f} token (基线 {p['基线token']:.0f}) | "
+              f"入选 {p['入选']:.1f} / 候选 {p['候选']:.1f} | 合并 {p['合并']:.1f} | 去重 {p['去重']:.1f}")
+    for stage, s in q["stage_ms"].items():
+        print(f"   {stage:<6} p50 {s['p50']:7.1f}ms | p95 {s['p95']:7.1f}ms")
+    print(f"💾 结果已写入 {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# 基准：比较重排序后端 (torch fp32 / int8 / onnx / onnx-int8) 的延迟与排序一致性。
+# 用法: PYTHONPATH=. python -m scripts.bench_reranker --backends torch int8 onnx onnx-int8
+#       可选 --pairs my_pairs.jsonl，每行 {"query": "...", "passages": ["...", ...]}
+import argparse
+import json
+import statistics
+import time
+
+from reranker import Reranker
+
+FIXED_SET = [
+    ("什么是检索增强生成？", [
+        "检索增强生成 (RAG) 先从知识库检索相关文档，再把文档作为上下文交给大模型生成答案。",
+        "向量数据库使用近似最近邻索引来加速高维向量的相似度查询。",
+        "Obsidian 使用 [[双链]] 语法在笔记之间建立关联。",
+        "交叉编码器同时编码查询和文档，通常比双塔模型更准确但更慢。",
+        "今天的天气晴朗，适合出门散步。",
+    ]),
+    ("BM25 的参数 k1 和 b 分别控制什么？", [
+        "BM25 中 k1 控制词频饱和的速度，b 控制文档长度归一化的强度。",
+        "TF-IDF 用词频乘以逆文档频率来衡量词的重要性。",
+        "倒排索引把每个词映射到包含它的文档列表。",
+        "PyMuPDF 可以提取 PDF 的文本层内容。",
+        "Streamlit 适合快速搭建数据应用的前端界面。",
+    ]),
+    ("How does int8 dynamic quantization speed up inference?", [
+        "Dynamic quantization stores linear layer weights as int8 and quantizes activations on the fly, "
+        "reducing memory bandwidth and using faster integer kernels on CPU.",
+        "Knowledge graphs represent entities as nodes and relations as edges.",
+        "Reciprocal rank fusion combines multiple ranked lists by summing 1/(k + rank).",
+        "Markdown headers start with one or more # characters.",
+        "ONNX Runtime executes exported computation graphs with optimized CPU kernels.",
+    ]),
+    ("知识图谱如何增强检索结果？", [
+        "通过笔记之间的双链关系，可以把相邻笔记作为补充候选或推荐阅读。",
+        "图谱中节点的度数反映了该笔记被引用或引用他人的次数。",
+        "分块大小过小会导致上下文缺失，过大则会稀释检索精度。",
+        "Ollama 可以在本地运行量化后的大语言模型。",
+        "数据库事务需要满足原子性、一致性、隔离性和持久性。",
+    ]),
+]
+
+
+def load_pairs(path):
+    if not path:
+        return FIXED_SET
+    sets = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                sets.append((row["query"], row["passages"]))
+    return sets
+
+
+def kendall_tau(a, b):
+    n, concordant, discordant = len(a), 0, 0
+    for i in range(n):
+        for j in range(i + 1, n):
+            s = (a[i] - a[j]) * (b[i] - b[j])
+            if s > 0:
+                concordant += 1
+            elif s < 0:
+                discordant += 1
+    total = n * (n - 1) / 2
+    return (concordant - discordant) / total if total else 1.0
+
+
+def run_backend(backend, sets, repeats):
+    reranker = Reranker(backend=backend, cache_size=0)
+    reranker.predict([[sets[0][0], sets[0][1][0]]])  # 预热
+    if reranker.backend != backend:
+        return reranker.backend, None, None  # 加载失败回退到其他后端，结果不代表所请求的后端
+    latencies, scores = [], []
+    for query, passages in sets:
+        pairs = [[query, p] for p in passages]
+        samples = []
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            result = reranker.predict(pairs)
+            samples.append((time.perf_counter() - t0) * 1000)
+        latencies.append(statistics.median(samples))
+        scores.append(result)
+    return reranker.backend, latencies, scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重排序后端延迟与一致性对比")
+    parser.add_argument("--backends", nargs="+", default=["torch", "int8", "onnx", "onnx-int8"])
+    parser.add_argument("--pairs", help="JSONL 测试集 (默认使用内置固定集合)")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    sets = load_pairs(args.pairs)
+    baseline = None
+    print(f"{'backend':<12}{'loaded':<12}{'p50(ms)':>10}{'mean(ms)':>10}{'tau':>8}{'top1':>8}")
+    for backend in ["torch"] + [b for b in args.backends if b != "torch"]:
+        loaded, latencies, scores = run_backend(backend, sets, args.repeats)
+        if scores is None:
+            print(f"{backend:<12}{loaded:<12}  ⚠️ 加载失败已回退，跳过")
+            continue
+        if baseline is None:
+            baseline = scores
+        taus = [kendall_tau(s, b) for s, b in zip(scores, baseline)]
+        top1 = [max(range(len(s)), key=s.__getitem__) == max(range(len(b)), key=b.__getitem__)
+                for s, b in zip(scores, baseline)]
+        print(f"{backend:<12}{loaded:<12}{statistics.median(latencies):>10.1f}{statistics.mean(latencies):>10.1f}"
+              f"{statistics.mean(taus):>8.3f}{sum(top1) / len(top1):>8.2f}")
+
+if __name__ == "__main__":
+    main()
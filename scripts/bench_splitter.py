@@ -0,0 +1,105 @@
+# 基准：切分流水线对比 —— 三段式 (MarkdownHeaderTextSplitter -> 父块 Recursive -> 子块 Recursive) 与单遍结构化切分。
+# 报告耗时、吞吐 (MB/s)、Python 堆峰值 (tracemalloc)、父 / 子块数量与长度分布，并校验结构化子块偏移可还原原文。
+# 用法: PYTHONPATH=. python -m scripts.bench_splitter --notes 500 --sections 8
+#       真实仓库: ... --vault "/mnt/c/Users/.../Obsidian Vault"
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import config
+from loader import ContentLoader
+from scripts.bench_e2e import generate_vault
+from splitter import TextSplitterFactory
+
+
+def run_langchain(factory, docs):
+    parent, child = factory.get_parent_splitter(), factory.get_child_splitter()
+    for section in factory.pre_split_markdown(docs):
+        for p_doc in parent.split_documents([section]):
+            yield p_doc, child.split_documents([p_doc])
+
+
+def run_structured(factory, docs):
+    splitter = factory.get_structured_splitter()
+    for doc in docs:
+        yield from splitter.split_document(doc)
+
+
+def measure(name, pipeline, factory, docs, repeat):
+    """计时取 repeat 次最小值；内存峰值单独跑一遍 (tracemalloc 会拖慢计时)"""
+    seconds = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = list(pipeline(factory, docs))
+        seconds.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    list(pipeline(factory, docs))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    parent_len = np.array([len(p.page_content) for p, _ in out])
+    child_len = np.array([len(c.page_content) for _, cs in out for c in cs])
+    by_path = {d.metadata["path"]: d.page_content for d in docs}
+    offsets_ok = None
+    if name == "structured":
+        offsets_ok = all(by_path[c.metadata["path"]][c.metadata["start"]:c.metadata["end"]] == c.page_content
+                         for _, cs in out for c in cs)
+    chars = sum(len(d.page_content) for d in docs)
+    return {
+        "pipeline": name,
+        "seconds": min(seconds),
+        "mb_per_s": chars / 2 ** 20 / min(seconds),
+        "peak_heap_mb": peak / 2 ** 20,
+        "parents": len(parent_len),
+        "children": len(child_len),
+        "parent_chars": {"mean": float(parent_len.mean()), "p95": float(np.percentile(parent_len, 95))},
+        "child_chars": {"mean": float(child_len.mean()), "p95": float(np.percentile(child_len, 95))},
+        "offsets_ok": offsets_ok,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="三段式切分 vs 单遍结构化切分")
+    parser.add_argument("--vault", default=None, help="真实仓库路径 (默认生成合成仓库)")
+    parser.add_argument("--notes", type=int, default=500)
+    parser.add_argument("--pdfs", type=int, default=10)
+    parser.add_argument("--sections", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    workdir = None
+    if args.vault is None:
+        workdir = tempfile.mkdtemp(prefix="rag_bench_splitter_")
+        args.vault = os.path.join(workdir, "vault")
+        generate_vault(args.vault, args.notes, args.pdfs, args.sections, args.seed)
+    try:
+        config.VAULT_PATH = args.vault
+        docs, _ = ContentLoader().load_vault()
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    chars = sum(len(d.page_content) for d in docs)
+    print(f"📊 {len(docs)} 篇文档 / {chars / 2 ** 20:.1f} MB 文本 | 父块 {config.PARENT_CHUNK_SIZE} 字符, "
+          f"子块 {config.CHILD_CHUNK_SIZE} 字符")
+
+    factory = TextSplitterFactory()
+    results = [measure(name, fn, factory, docs, args.repeat)
+               for name, fn in (("langchain", run_langchain), ("structured", run_structured))]
+
+    print(f"\n{'pipeline':<12}{'秒':>8}{'MB/s':>8}{'堆峰值MB':>10}{'父块':>8}{'子块':>8}{'父均长':>8}{'子均长':>8}")
+    for r in results:
+        print(f"{r['pipeline']:<12}{r['seconds']:>8.2f}{r['mb_per_s']:>8.2f}{r['peak_heap_mb']:>10.1f}"
+              f"{r['parents']:>8}{r['children']:>8}{r['parent_chars']['mean']:>8.0f}{r['child_chars']['mean']:>8.0f}")
+    base, new = results
+    print(f"⚡ 结构化切分加速 {base['seconds'] / new['seconds']:.1f}x | 子块偏移还原原文: "
+          f"{'✅' if new['offsets_ok'] else '❌'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# 基准：比较不同关键词分词器在笔记抽样上的 recall@k。
+# 用法: PYTHONPATH=. python -m scripts.bench_tokenizer --sample 200 --queries 300 --k 10
+#
+# 无标注数据时采用自检索评测：从子块中随机截取一段文本作为查询，
+# 原子块出现在 top-k 中即视为命中。
+import argparse
+import random
+import tempfile
+import time
+
+from bm25_index import SparseBM25Index
+from loader import ContentLoader
+from splitter import TextSplitterFactory
+from tokenizer import TOKENIZERS
+
+
+def build_chunks(sample: int, seed: int):
+    loader = ContentLoader()
+    paths = [p for p in loader.scan_vault() if p.lower().endswith((".md", ".pdf"))]
+    random.Random(seed).shuffle(paths)
+    docs, _ = loader.load_vault(paths=paths[:sample])
+    factory = TextSplitterFactory()
+    child = factory.get_child_splitter()
+    chunks = child.split_documents(factory.pre_split_markdown(docs))
+    for i, c in enumerate(chunks):
+        c.metadata["doc_id"] = str(i)
+    return chunks
+
+
+def make_queries(chunks, n: int, seed: int, min_len: int = 6, max_len: int = 16):
+    rng = random.Random(seed)
+    queries = []
+    candidates = [i for i, c in enumerate(chunks) if len(c.page_content.strip()) >= max_len]
+    for i in rng.sample(candidates, min(n, len(candidates))):
+        text = chunks[i].page_content
+        size = rng.randint(min_len, max_len)
+        start = rng.randint(0, len(text) - size)
+        queries.append((text[start:start + size], i))
+    return queries
+
+
+def evaluate(name: str, chunks, queries, k: int):
+    index = SparseBM25Index(tempfile.mkdtemp(prefix=f"bm25_{name}_"), tokenizer=name)
+    t0 = time.perf_counter()
+    index.add_documents(chunks)
+    build = time.perf_counter() - t0
+
+    hits = 0
+    t0 = time.perf_counter()
+    for query, target in queries:
+        if any(idx == target for idx, _ in index.search(query, k)):
+            hits += 1
+    latency = (time.perf_counter() - t0) / max(len(queries), 1)
+    return {
+        "tokenizer": name,
+        "recall": hits / max(len(queries), 1),
+        "vocab": len(index.vocab),
+        "build_s": build,
+        "query_ms": latency * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="关键词分词器 recall@k 对比")
+    parser.add_argument("--sample", type=int, default=200, help="抽样笔记数量")
+    parser.add_argument("--queries", type=int, default=300, help="评测查询数量")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--tokenizers", nargs="+", default=list(TOKENIZERS))
+    args = parser.parse_args()
+
+    chunks = build_chunks(args.sample, args.seed)
+    queries = make_queries(chunks, args.queries, args.seed)
+    print(f"📊 {len(chunks)} 个子块 / {len(queries)} 条查询 / k={args.k}")
+
+    print(f"{'tokenizer':<12}{'recall@k':>10}{'vocab':>10}{'build(s)':>10}{'query(ms)':>11}")
+    for name in args.tokenizers:
+        r = evaluate(name, chunks, queries, args.k)
+        print(f"{r['tokenizer']:<12}{r['recall']:>10.3f}{r['vocab']:>10}{r['build_s']:>10.2f}{r['query_ms']:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# 基准：向量后端对比 —— Chroma (HNSW) 与 vector_index.py 的 flat / IVF / int8 / float16 / Matryoshka 截断变体。
+# 报告构建耗时、磁盘大小、打开耗时、常驻与峰值 RSS、查询延迟 (p50/p95) 与 recall@k (相对精确暴力检索)。
+# 用法: PYTHONPATH=. python -m scripts.bench_vector --n 200000 --dim 768 --queries 200
+#       只测部分变体: ... --variants chroma ivf-int8 ivf-int8-half
+#       调 IVF 参数: ... --nprobe 32 --rescore 8
+#
+# 向量为聚类高斯分布，第 d 维尺度按 (1+d)^-decay 衰减，模拟 Matryoshka 训练的嵌入 (信息集中在前若干维)；
+# --decay 0 时各维同分布，截断变体的 recall 会明显下降。每个变体在独立的 spawn 子进程中构建并查询，峰值 RSS 互不干扰。
+import argparse
+import json
+import multiprocessing as mp
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from scripts.bench_e2e import _dir_size, _git_commit
+
+# 变体名 -> QuantizedVectorIndex 参数 (search_dim 为 "half" 时取 dim // 2)
+VARIANTS = {
+    "flat-int8": {"quant": "int8", "n_lists": 0},
+    "ivf-int8": {"quant": "int8"},
+    "ivf-float16": {"quant": "float16"},
+    "ivf-int8-half": {"quant": "int8", "search_dim": "half"},
+    "chroma": None,
+}
+
+
+def generate(path, n, dim, clusters, decay, seed):
+    """分块生成 float32 向量写入 .npy (memmap)，大规模时不在内存中整体驻留"""
+    rng = np.random.default_rng(seed)
+    scale = (1.0 + np.arange(dim)) ** -decay
+    centers = rng.normal(size=(clusters, dim)) * scale
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(n, dim))
+    for a in range(0, n, 50_000):
+        b = min(n, a + 50_000)
+        out[a:b] = centers[rng.integers(0, clusters, b - a)] + 0.6 * rng.normal(size=(b - a, dim)) * scale
+    out.flush()
+    return out
+
+
+def exact_topk(data, queries, k):
+    """分块暴力计算余弦 top-k 作为真值"""
+    q = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    best_s = np.full((len(q), k), -np.inf, dtype=np.float32)
+    best_i = np.zeros((len(q), k), dtype=np.int64)
+    for a in range(0, len(data), 50_000):
+        block = np.asarray(data[a:a + 50_000])
+        s = q @ (block / np.linalg.norm(block, axis=1, keepdims=True)).T
+        s = np.concatenate([best_s, s], axis=1)
+        i = np.concatenate([best_i, np.arange(a, a + len(block))[None, :].repeat(len(q), 0)], axis=1)
+        top = np.argpartition(-s, k - 1, axis=1)[:, :k]
+        best_s, best_i = np.take_along_axis(s, top, 1), np.take_along_axis(i, top, 1)
+    return best_i
+
+
+def _rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def _build_numpy(path, data, params, batch):
+    from vector_index import QuantizedVectorIndex
+    index = QuantizedVectorIndex(path, **params)
+    for a in range(0, len(data), batch):
+        b = min(len(data), a + batch)
+        index.add([str(i) for i in range(a, b)], np.asarray(data[a:b]),
+                  [f"子块 {i}" for i in range(a, b)], [{"doc_id": str(i)} for i in range(a, b)])
+    index.save()
+    index.close()
+
+
+def _open_numpy(path, nprobe, rescore):
+    from vector_index import QuantizedVectorIndex
+    index = QuantizedVectorIndex.load(path)
+    return lambda q, k: [int(index.ids[r]) for r, _ in index.search(q, k, nprobe=nprobe, rescore=rescore)]
+
+
+def _build_chroma(path, data, batch):
+    import chromadb
+    collection = chromadb.PersistentClient(path=path).get_or_create_collection(
+        "bench", metadata={"hnsw:space": "cosine"})
+    for a in range(0, len(data), batch):
+        b = min(len(data), a + batch)
+        collection.add(ids=[str(i) for i in range(a, b)], embeddings=np.asarray(data[a:b]),
+                       documents=[f"子块 {i}" for i in range(a, b)], metadatas=[{"doc_id": str(i)} for i in range(a, b)])
+
+
+def _open_chroma(path):
+    import chromadb
+    collection = chromadb.PersistentClient(path=path).get_collection("bench")
+    return lambda q, k: [int(i) for i in collection.query(query_embeddings=[q.tolist()], n_results=k)["ids"][0]]
+
+
+def run_variant(name, data_path, queries, truth, k, workdir, nprobe, rescore, batch):
+    """子进程：构建 -> 重新打开 -> 逐条查询；返回该变体的全部指标"""
+    data = np.load(data_path, mmap_mode="r")
+    path = os.path.join(workdir, name)
+    shutil.rmtree(path, ignore_errors=True)
+    params = dict(VARIANTS[name] or {})
+    if params.get("search_dim") == "half":
+        params["search_dim"] = data.shape[1] // 2
+
+    t0 = time.perf_counter()
+    if name == "chroma":
+        _build_chroma(path, data, batch)
+    else:
+        _build_numpy(path, data, params, batch)
+    build_s = time.perf_counter() - t0
+    build_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    del data
+
+    rss0 = _rss_mb()
+    t0 = time.perf_counter()
+    search = _open_chroma(path) if name == "chroma" else _open_numpy(path, nprobe, rescore)
+    open_ms = (time.perf_counter() - t0) * 1000
+
+    latencies, hits = [], 0
+    for q, tr in zip(queries, truth):
+        t0 = time.perf_counter()
+        got = search(q, k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        hits += len(set(got) & set(tr.tolist()))
+    return {
+        "variant": name,
+        "params": params,
+        "build_s": build_s,
+        "disk_mb": _dir_size(path) / 2 ** 20,
+        "open_ms": open_ms,
+        "query_rss_mb": _rss_mb() - rss0,  # 打开索引并查询后新增的常驻内存 (memmap 只计被访问的页)
+        "build_peak_rss_mb": build_peak,
+        "latency_ms": {"p50": float(np.percentile(latencies, 50)), "p95": float(np.percentile(latencies, 95)),
+                       "mean": float(np.mean(latencies))},
+        "recall_at_k": hits / (len(queries) * k),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量后端内存 / 延迟 / recall 对比")
+    parser.add_argument("--n", type=int, default=100_000, help="向量条数 (子块数)")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--decay", type=float, default=0.5, help="各维尺度衰减指数 (模拟 Matryoshka 嵌入)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=None, help="默认取 config.VECTOR_NPROBE")
+    parser.add_argument("--rescore", type=int, default=None, help="默认取 config.VECTOR_RESCORE")
+    parser.add_argument("--batch", type=int, default=5000, help="每次写入的向量数")
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=list(VARIANTS))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", default=None, help="默认使用临时目录并在结束后删除")
+    parser.add_argument("--out", default="bench_results")
+    args = parser.parse_args()
+
+    import config
+    nprobe = args.nprobe or config.VECTOR_NPROBE
+    rescore = args.rescore or config.VECTOR_RESCORE
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag_bench_vector_")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        print(f"🧪 生成 {args.n} 条 {args.dim} 维向量...")
+        data_path = os.path.join(workdir, "vectors.npy")
+        data = generate(data_path, args.n, args.dim, args.clusters, args.decay, args.seed)
+        rng = np.random.default_rng(args.seed + 1)
+        # 查询 = 库内向量加扰动，真值由精确暴力检索给出
+        picks = rng.integers(0, args.n, args.queries)
+        queries = np.asarray(data[picks]) + 0.3 * rng.normal(size=(args.queries, args.dim)) * \
+            (1.0 + np.arange(args.dim)) ** -args.decay
+        queries = queries.astype(np.float32)
+        truth = exact_topk(data, queries, args.k)
+        del data
+
+        results = []
+        ctx = mp.get_context("spawn")
+        for name in args.variants:
+            if name == "chroma":
+                try:
+                    import chromadb  # noqa: F401
+                except ImportError:
+                    print("⚠️ 未安装 chromadb，跳过 chroma")
+                    continue
+            print(f"⏱️ {name} ...")
+            with ctx.Pool(1) as pool:
+                r = pool.apply(run_variant, (name, data_path, queries, truth, args.k, workdir,
+                                             nprobe, rescore, args.batch))
+            results.append(r)
+            print(f"   构建 {r['build_s']:.1f}s | 磁盘 {r['disk_mb']:.1f} MB | 打开 {r['open_ms']:.0f}ms | "
+                  f"查询新增 RSS {r['query_rss_mb']:.0f} MB | p50 {r['latency_ms']['p50']:.2f}ms "
+                  f"p95 {r['latency_ms']['p95']:.2f}ms | recall@{args.k} {r['recall_at_k']:.3f}")
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {"n": args.n, "dim": args.dim, "clusters": args.clusters, "decay": args.decay,
+                   "queries": args.queries, "k": args.k, "nprobe": nprobe, "rescore": rescore, "seed": args.seed},
+        "results": results,
+    }
+    os.makedirs(args.out, exist_ok=True)
+    out_path = os.path.join(args.out, f"vector_{result['commit'] or 'nogit'}_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    print(f"\n{'variant':<16}{'build(s)':>10}{'disk(MB)':>10}{'RSS(MB)':>9}{'p50(ms)':>9}{'p95(ms)':>9}{'recall':>8}")
+    for r in results:
+        print(f"{r['variant']:<16}{r['build_s']:>10.1f}{r['disk_mb']:>10.1f}{r['query_rss_mb']:>9.0f}"
+              f"{r['latency_ms']['p50']:>9.2f}{r['latency_ms']['p95']:>9.2f}{r['recall_at_k']:>8.3f}")
+    print(f"📄 结果已写入 {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# 压测：并发请求查询服务，报告 p50/p95/p99 延迟、QPS 与服务端微批指标。
+# 用法: PYTHONPATH=. python -m scripts.ollama_stub --port 11500          (终端 1，桩 Ollama)
+#       python server.py --ollama http://127.0.0.1:11500                  (终端 2，查询服务)
+#       PYTHONPATH=. python -m scripts.load_test --concurrency 16 --requests 400   (终端 3)
+#       --endpoint ask 压测含生成的完整链路；--queries my_queries.txt 每行一个查询
+import argparse
+import json
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+DEFAULT_QUERIES = [
+    "什么是检索增强生成？",
+    "BM25 的参数 k1 和 b 分别控制什么？",
+    "知识图谱如何增强检索结果？",
+    "交叉编码器和双塔模型的区别",
+    "如何在 Obsidian 中使用双链？",
+    "向量数据库的近似最近邻索引",
+    "int8 动态量化为什么能加速推理？",
+    "倒排索引的存储结构",
+]
+
+
+def load_queries(path):
+    if not path:
+        return DEFAULT_QUERIES
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def one_request(url, endpoint, query, timeout):
+    payload = {"query": query}
+    if endpoint == "ask":
+        payload["stream"] = False
+    req = urllib.request.Request(f"{url}/{endpoint}", data=json.dumps(payload).encode("utf-8"),
+                                 headers={"Content-Type": "application/json"})
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = "error"
+    return status, (time.perf_counter() - t0) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询服务压测")
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--endpoint", choices=["search", "ask"], default="search")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--queries", help="查询文件，每行一个 (默认内置集合)")
+    parser.add_argument("--unique", action="store_true",
+                        help="为每个请求附加序号，绕过答案缓存与精排缓存")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries)
+    jobs = [queries[i % len(queries)] + (f" #{i}" if args.unique else "") for i in range(args.requests)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda q: one_request(args.url, args.endpoint, q, args.timeout), jobs))
+    elapsed = time.perf_counter() - start
+
+    statuses = Counter(s for s, _ in results)
+    ok = np.asarray([ms for s, ms in results if s == 200])
+    print(f"📊 /{args.endpoint} | 并发 {args.concurrency} | 请求 {len(results)} | 耗时 {elapsed:.1f}s")
+    print(f"   状态码: {dict(statuses)}")
+    if len(ok):
+        p50, p95, p99 = np.percentile(ok, [50, 95, 99])
+        print(f"   延迟 p50 {p50:.0f}ms | p95 {p95:.0f}ms | p99 {p99:.0f}ms | 成功 QPS {len(ok) / elapsed:.1f}")
+
+    try:
+        with urllib.request.urlopen(f"{args.url}/metrics", timeout=5) as resp:
+            metrics = json.load(resp)
+        for name, b in metrics.get("batchers", {}).items():
+            print(f"   微批 {name}: 平均批大小 {b['avg_batch']:.1f} | 批数 {b['batches']} | "
+                  f"最大排队 {b['max_depth']} | 拒绝 {b['rejected']}")
+        print(f"   准入拒绝 {metrics['rejected']} | 错误 {metrics['errors']}")
+    except Exception as e:
+        print(f"⚠️ 获取服务端指标失败: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# 桩服务：模拟 Ollama 的 /api/embed 与 /api/chat，用于压测与基准 (不依赖真实模型)。
+# 用法: PYTHONPATH=. python -m scripts.ollama_stub --port 11500 --embed-latency 20 --token-delay 5
+#       查询服务指向桩: python server.py --ollama http://127.0.0.1:11500
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+class StubStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.embed_calls = 0
+        self.embed_inputs = 0
+        self.chat_calls = 0
+        self.prompt_chars = 0
+
+    def as_dict(self):
+        with self.lock:
+            return {"embed_calls": self.embed_calls, "embed_inputs": self.embed_inputs,
+                    "chat_calls": self.chat_calls,
+                    "avg_prompt_chars": self.prompt_chars / self.chat_calls if self.chat_calls else 0.0,
+                    "avg_embed_batch": self.embed_inputs / self.embed_calls if self.embed_calls else 0.0}
+
+
+def fake_embedding(text, dim):
+    """
+    确定性的特征哈希向量：字符二元组 / 英文单词哈希到 dim 维并归一化。
+    相同文本得到相同向量，字面相近的文本余弦相似度也高，基准中的向量召回因此有意义。
+    """
+    vec = np.zeros(dim, dtype=np.float32)
+    lowered = text.lower()
+    grams = [lowered[i:i + 2] for i in range(len(lowered) - 1)] + lowered.split()
+    for g in grams:
+        h = int.from_bytes(hashlib.md5(g.encode("utf-8")).digest()[:4], "little")
+        vec[h % dim] += 1.0 if h >> 31 else -1.0
+    norm = np.linalg.norm(vec)
+    if not norm:
+        vec[0], norm = 1.0, 1.0
+    return (vec / norm).tolist()
+
+
+def make_handler(dim, embed_latency, per_item, answer_tokens, token_delay, stats, prefill_ms=0.0):
+    """
+    embed 耗时 = embed_latency + per_item * 条数，模拟 GPU 批处理「固定开销 + 边际成本」的特征；
+    chat 首个 token 前等待 prefill_ms * 提示词千字符数，模拟 CPU 上 prefill 随提示长度增长。
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _json(self, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            # ollama 客户端偶尔探测 /api/version 或 /api/tags
+            self._json({"version": "stub", "models": []})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path == "/api/embed":
+                inputs = body.get("input", [])
+                inputs = [inputs] if isinstance(inputs, str) else inputs
+                with stats.lock:
+                    stats.embed_calls += 1
+                    stats.embed_inputs += len(inputs)
+                time.sleep((embed_latency + per_item * len(inputs)) / 1000)
+                self._json({"model": body.get("model"), "embeddings": [fake_embedding(t, dim) for t in inputs]})
+            elif self.path == "/api/chat":
+                with stats.lock:
+                    stats.chat_calls += 1
+                self._chat(body)
+            else:
+                self.send_error(404)
+
+        def _chat(self, body):
+            model = body.get("model", "stub")
+            tokens = [f"桩{i} " for i in range(answer_tokens)]
+            prompt_chars = sum(len(m.get("content") or "") for m in body.get("messages", []))
+            with stats.lock:
+                stats.prompt_chars += prompt_chars
+            time.sleep(prefill_ms * prompt_chars / 1000 / 1000)
+            if not body.get("stream", True):
+                time.sleep(token_delay * answer_tokens / 1000)
+                self._json({"model": model, "created_at": "", "done": True, "done_reason": "stop",
+                            "message": {"role": "assistant", "content": "".join(tokens)}})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def send(obj):
+                data = (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            for tok in tokens:
+                time.sleep(token_delay / 1000)
+                send({"model": model, "created_at": "", "done": False,
+                      "message": {"role": "assistant", "content": tok}})
+            send({"model": model, "created_at": "", "done": True, "done_reason": "stop",
+                  "message": {"role": "assistant", "content": ""}})
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+def start_stub(port=11500, dim=768, embed_latency=20.0, per_item=0.5, answer_tokens=32, token_delay=5.0,
+               prefill_ms=0.0):
+    """在后台线程启动桩服务，返回 (server, stats)"""
+    stats = StubStats()
+    handler = make_handler(dim, embed_latency, per_item, answer_tokens, token_delay, stats, prefill_ms)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ollama 桩服务 (embed / chat)")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--embed-latency", type=float, default=20.0, help="每次 embed 调用的固定耗时 (ms)")
+    parser.add_argument("--per-item", type=float, default=0.5, help="每条输入的边际耗时 (ms)")
+    parser.add_argument("--answer-tokens", type=int, default=32)
+    parser.add_argument("--token-delay", type=float, default=5.0, help="流式生成每个 token 的间隔 (ms)")
+    parser.add_argument("--prefill-ms", type=float, default=0.0, help="每千字符提示词的 prefill 耗时 (ms)")
+    args = parser.parse_args()
+
+    server, stats = start_stub(args.port, args.dim, args.embed_latency, args.per_item,
+                               args.answer_tokens, args.token_delay, args.prefill_ms)
+    print(f"🧪 Ollama 桩服务: http://127.0.0.1:{args.port} (Ctrl+C 退出)")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"   {stats.as_dict()}")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
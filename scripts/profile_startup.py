@@ -0,0 +1,40 @@
+# 启动剖析：逐个模块测量冷启动导入耗时 (每个模块在独立解释器中导入)，再同步加载检索引擎并打印各组件耗时。
+# 用法: PYTHONPATH=. python -m scripts.profile_startup [--skip-engine]
+#       更细的依赖级明细可用: python -X importtime -c "import retriever" 2> importtime.log
+import argparse
+import subprocess
+import sys
+
+MODULES = ["config", "storage", "reranker", "hybrid", "retriever", "generator", "answer_cache",
+           "chromadb", "torch", "streamlit"]
+
+PROBE = "import time; t = time.perf_counter(); import {mod}; print((time.perf_counter() - t) * 1000)"
+
+
+def import_ms(mod):
+    out = subprocess.run([sys.executable, "-c", PROBE.format(mod=mod)], capture_output=True, text=True)
+    if out.returncode != 0:
+        return None
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动耗时剖析")
+    parser.add_argument("--skip-engine", action="store_true", help="只测导入，不加载索引与模型")
+    args = parser.parse_args()
+
+    print(f"{'module':<14}{'cold import(ms)':>16}")
+    for mod in MODULES:
+        ms = import_ms(mod)
+        print(f"{mod:<14}{'N/A' if ms is None else f'{ms:.0f}':>16}")
+
+    if not args.skip_engine:
+        from retriever import RAGRetriever
+        engine = RAGRetriever(background=False)
+        print("\n🧩 组件加载:")
+        for stage, ms in engine.startup_profile.items():
+            print(f"   {stage:<12}{ms:>10.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+# 职责：无界面 HTTP 查询服务 —— 包装 RAGRetriever / RAGGenerator，查询嵌入与精排跨请求微批，带准入控制与指标。
+import json
+import time
+import argparse
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import config
+from answer_cache import AnswerCache
+from batching import Overloaded
+from generator import RAGGenerator
+from retriever import RAGRetriever
+from storage import StorageManager
+from tracing import tracer
+
+
+def _percentiles(values, qs=(50, 95, 99)):
+    if not values:
+        return {f"p{q}": 0.0 for q in qs}
+    arr = np.asarray(values)
+    return {f"p{q}": float(np.percentile(arr, q)) for q in qs}
+
+
+class RAGService:
+    """
+    线程安全的查询服务核心 (与 HTTP 层解耦，便于在其他入口复用)。
+    - 准入控制：同时处理的请求数不超过 max_inflight，超出立即拒绝而不是排队等待；
+    - 微批：查询嵌入与精排各有一个 MicroBatcher，并发请求在 SERVE_BATCH_WAIT_MS 内合并。
+    """
+
+    def __init__(self, base_url: str = config.OLLAMA_BASE_URL,
+                 max_inflight: int = config.SERVE_MAX_INFLIGHT):
+        storage = StorageManager(base_url=base_url, batch_queries=True)
+        self.retriever = RAGRetriever(storage=storage)
+        self.generator = RAGGenerator(base_url=base_url)
+        self.rerank_batcher = self.retriever.reranker.enable_batching(
+            max_batch=config.SERVE_RERANK_BATCH, max_wait_ms=config.SERVE_BATCH_WAIT_MS,
+            max_queue=config.SERVE_MAX_QUEUE)
+        self.answer_cache = AnswerCache(embed_fn=storage.embedding.embed_query)
+
+        self.max_inflight = max_inflight
+        self._slots = threading.BoundedSemaphore(max_inflight)
+        self._lock = threading.Lock()
+        self.inflight = 0
+        self.served = 0
+        self.rejected = 0
+        self.errors = 0
+        self.started = time.time()
+        self._latency = {"search": deque(maxlen=2000), "ask": deque(maxlen=2000)}
+
+    @contextmanager
+    def admit(self, kind: str):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise Overloaded(f"并发请求已达上限 {self.max_inflight}")
+        t0 = time.perf_counter()
+        with self._lock:
+            self.inflight += 1
+        try:
+            yield
+        except Overloaded:
+            with self._lock:
+                self.rejected += 1
+            raise
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        else:
+            with self._lock:
+                self.served += 1
+                self._latency[kind].append((time.perf_counter() - t0) * 1000)
+        finally:
+            with self._lock:
+                self.inflight -= 1
+            self._slots.release()
+
+    def search(self, query: str) -> dict:
+        with self.admit("search"), tracer.trace("search", query=query[:50]):
+            context, parent_ids = self.retriever.retrieve(query)
+            return {"context": context, "parent_ids": parent_ids}
+
+    def ask(self, query: str):
+        """返回答案片段迭代器；整个生成过程占用一个并发名额"""
+        with self.admit("ask"), tracer.trace("ask", query=query[:50]) as span:
+            cached = self.answer_cache.lookup(query)
+            if cached is not None:
+                span.set(答案缓存=True)
+                yield cached["answer"]
+                return
+            context, parent_ids = self.retriever.retrieve(query)
+            answer = ""
+            for chunk in self.generator.generate_stream(query, context):
+                answer += chunk
+                yield chunk
+            self.answer_cache.put(query, context, answer, parent_ids)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            latency = {kind: _percentiles(list(v)) for kind, v in self._latency.items()}
+            core = {
+                "uptime_s": time.time() - self.started,
+                "inflight": self.inflight,
+                "max_inflight": self.max_inflight,
+                "served": self.served,
+                "rejected": self.rejected,
+                "errors": self.errors,
+            }
+        batchers = {"rerank": self.rerank_batcher.stats()}
+        if self.retriever.storage.query_batcher is not None:
+            batchers["embed"] = self.retriever.storage.query_batcher.stats()
+        return {**core, "latency_ms": latency, "batchers": batchers,
+                "answer_cache": self.answer_cache.stats(), "rerank_cache": self.retriever.reranker.stats(),
+                "index_version": self.retriever.index_version}
+
+
+class RAGRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET  /healthz  /metrics  /metrics/prometheus (各阶段耗时直方图与计数器)
+    POST /search {"query": "..."}                -> {"context", "parent_ids", "latency_ms"}
+    POST /ask    {"query": "...", "stream": true} -> 流式 text/plain (stream=false 时返回 JSON)
+    """
+    protocol_version = "HTTP/1.1"
+    service: RAGService = None
+
+    def log_message(self, fmt, *args):
+        pass  # 默认每个请求一行日志，高并发压测时噪声太大
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_query(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        query = str(payload.get("query", "")).strip()
+        return query, payload
+
+    def do_GET(self):
+        if self.path == "/healthz":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/metrics":
+            self._send_json(200, self.service.metrics())
+        elif self.path == "/metrics/prometheus":
+            body = tracer.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        try:
+            query, payload = self._read_query()
+        except (ValueError, json.JSONDecodeError):
+            self._send_json(400, {"error": "请求体必须是 JSON"})
+            return
+        if not query:
+            self._send_json(400, {"error": "缺少 query"})
+            return
+
+        t0 = time.perf_counter()
+        try:
+            if self.path == "/search":
+                result = self.service.search(query)
+                result["latency_ms"] = (time.perf_counter() - t0) * 1000
+                self._send_json(200, result)
+            elif self.path == "/ask":
+                chunks = self.service.ask(query)
+                if payload.get("stream", True):
+                    self._stream(chunks)
+                else:
+                    answer = "".join(chunks)
+                    self._send_json(200, {"answer": answer, "latency_ms": (time.perf_counter() - t0) * 1000})
+            else:
+                self._send_json(404, {"error": "not found"})
+        except Overloaded as e:
+            self._send_json(503, {"error": str(e)})
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+
+    def _stream(self, chunks):
+        # 先取第一个片段：准入拒绝等错误在发送响应头之前抛出，仍可返回正确的状态码
+        first = next(chunks, "")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for chunk in itertools.chain([first], chunks):
+                data = chunk.encode("utf-8")
+                if data:
+                    self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                    self.wfile.flush()
+        except Exception as e:
+            # 响应头已发出，无法再改状态码：直接断开，客户端据缺少结束块判断失败
+            print(f"⚠️ 流式生成中断: {e}")
+            self.close_connection = True
+            return
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="神经符号知识库 HTTP 查询服务")
+    parser.add_argument("--host", default=config.SERVE_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVE_PORT)
+    parser.add_argument("--ollama", default=config.OLLAMA_BASE_URL, help="Ollama 地址 (压测时可指向桩服务)")
+    parser.add_argument("--max-inflight", type=int, default=config.SERVE_MAX_INFLIGHT)
+    args = parser.parse_args()
+
+    RAGRequestHandler.service = RAGService(base_url=args.ollama, max_inflight=args.max_inflight)
+    server = ThreadingHTTPServer((args.host, args.port), RAGRequestHandler)
+    server.daemon_threads = True
+    print(f"🌐 查询服务已启动: http://{args.host}:{args.port} (Ollama: {args.ollama})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# 职责：分片入库 —— 按文件哈希把仓库分给 N 个工作进程 (各自连接一个 Ollama 端点)，完成后合并为主索引。
+import os
+import json
+import shutil
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import networkx as nx
+from langchain_core.documents import Document
+
+import config
+from answer_cache import AnswerCache
+from bm25_index import SparseBM25Index
+from ingest import _record
+from loader import ContentLoader, NoteIndex
+from manifest import FileManifest
+from splitter import TextSplitterFactory
+from storage import StorageManager
+
+
+def _shard_of(path, n_shards):
+    """按仓库内相对路径哈希分片：同一文件每次都落在同一分片，便于断点续跑与复用分片嵌入缓存"""
+    rel = os.path.relpath(path, config.VAULT_PATH).encode("utf-8")
+    return int.from_bytes(hashlib.sha1(rel).digest()[:8], "big") % n_shards
+
+
+def _shard_dir(shard_id):
+    return os.path.join(config.SHARD_WORK_DIR, f"shard-{shard_id:02d}")
+
+
+def _run_shard(shard_id, paths, endpoint, note_index, load_workers):
+    """
+    工作进程：切分 -> 嵌入 -> 写入本分片的 Chroma / 父文档库。
+    每处理 SHARD_CHECKPOINT_FILES 个文件保存一次分片清单 (即检查点)，重启后只处理清单中没有的文件；
+    崩溃时写了一半的子块/父块不在清单中，合并阶段会被过滤掉。
+    """
+    shard_dir = _shard_dir(shard_id)
+    storage = StorageManager(
+        persist_dir=shard_dir, base_url=endpoint,
+        embed_cache_dir=os.path.join(config.EMBED_CACHE_DIR, f"shard-{shard_id:02d}"),
+    )
+    manifest = FileManifest(os.path.join(shard_dir, "manifest.json"))
+    changed, removed, unchanged = manifest.diff(paths)
+    for path in removed:
+        manifest.remove(path)
+    if unchanged:
+        print(f"♻️ 分片 {shard_id}: 从检查点恢复，跳过 {len(unchanged)} 个已完成文件")
+
+    loader = ContentLoader()
+    splitter = TextSplitterFactory()
+    retriever = storage._make_parent_retriever(storage._open_vectorstore(), storage.docstore)
+    step = config.SHARD_CHECKPOINT_FILES
+    for start in range(0, len(changed), step):
+        segment = changed[start:start + step]
+        batches = loader.iter_vault(paths=segment, note_index=note_index, workers=load_workers)
+        id_map = retriever.add_documents(d for batch in batches for d in splitter.pre_split(batch))
+        # 先落盘父块，再记录清单，保证检查点中的文件数据完整
+        if hasattr(storage.docstore, "flush"):
+            storage.docstore.flush()
+        _record(manifest, segment, loader, id_map)
+        manifest.save()
+        print(f"📌 分片 {shard_id}: 检查点 {min(start + step, len(changed))}/{len(changed)}")
+    manifest.save()
+    storage._flush_stores()
+    return len(changed), len(unchanged)
+
+
+def _prepare_work_dir(n_shards):
+    """分片数或仓库路径变化时，旧的分片结果无法复用，整体清空"""
+    plan_path = os.path.join(config.SHARD_WORK_DIR, "plan.json")
+    plan = {"shards": n_shards, "vault": config.VAULT_PATH}
+    if os.path.exists(plan_path):
+        with open(plan_path, "r", encoding="utf-8") as f:
+            if json.load(f) == plan:
+                return
+        print("🧹 分片方案已变化，丢弃旧的分片检查点")
+        shutil.rmtree(config.SHARD_WORK_DIR)
+    os.makedirs(config.SHARD_WORK_DIR, exist_ok=True)
+    with open(plan_path, "w", encoding="utf-8") as f:
+        json.dump(plan, f)
+
+
+def _merge_shard(storage, shard_id, manifest, vectorstore, bm25):
+    """把一个分片中清单登记过的父块与子块 (含向量) 复制到主库，并流式喂给 BM25"""
+    shard = StorageManager(persist_dir=_shard_dir(shard_id), embed_cache_dir=None)
+    shard_manifest = FileManifest(os.path.join(shard.persist_dir, "manifest.json"))
+    valid = set(shard_manifest.parent_ids(list(shard_manifest.entries)))
+    page = config.MERGE_PAGE_SIZE
+
+    # 1. 父文档库
+    ids = sorted(valid)
+    for start in range(0, len(ids), page):
+        batch = ids[start:start + page]
+        storage.docstore.mset([(k, v) for k, v in zip(batch, shard.docstore.mget(batch)) if v is not None])
+
+    # 2. Chroma 子块 (复用分片已算好的向量，不再嵌入)
+    collection = shard._open_vectorstore()._collection
+    copied = 0
+    for offset in range(0, collection.count(), page):
+        data = collection.get(limit=page, offset=offset, include=["documents", "metadatas", "embeddings"])
+        keep = [i for i, m in enumerate(data["metadatas"]) if m.get("doc_id") in valid]
+        if not keep:
+            continue
+        docs = [data["documents"][i] for i in keep]
+        metas = [data["metadatas"][i] for i in keep]
+        vectorstore._collection.add(
+            ids=[data["ids"][i] for i in keep],
+            embeddings=[data["embeddings"][i] for i in keep],
+            documents=docs,
+            metadatas=metas,
+        )
+        bm25.add_documents(Document(page_content=d, metadata=m) for d, m in zip(docs, metas))
+        copied += len(keep)
+
+    manifest.entries.update(shard_manifest.entries)
+    print(f"🔀 分片 {shard_id}: 合并 {len(ids)} 个父块 / {copied} 个子块")
+
+
+def _build_graph(manifest):
+    """由各文件清单中的规范双链重建知识图谱"""
+    graph = nx.Graph()
+    for path, entry in manifest.entries.items():
+        if entry.get("parent_ids"):
+            graph.add_node(entry["source"], path=path, type=os.path.splitext(path)[1].lower())
+    for entry in manifest.entries.values():
+        graph.add_edges_from((entry["source"], t) for t in entry.get("links", []))
+    return graph
+
+
+def sharded_ingest(storage, paths, n_shards, endpoints=None):
+    """分片全量入库。返回 False 表示有分片失败 (已完成部分保存在检查点中，重新运行同一命令即可续跑)"""
+    endpoints = endpoints or config.OLLAMA_ENDPOINTS
+    _prepare_work_dir(n_shards)
+
+    # 1. 预扫描 frontmatter，建立全仓库笔记名索引 (分片间的双链与别名才能正确消解)
+    note_index = NoteIndex.scan(paths)
+    shards = [[] for _ in range(n_shards)]
+    for path in paths:
+        shards[_shard_of(path, n_shards)].append(path)
+    load_workers = max(1, config.LOAD_WORKERS // n_shards)
+
+    # 2. 各分片并行入库 (spawn：避免 fork 继承 Chroma / 线程池状态)
+    failed = []
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=n_shards, mp_context=ctx) as pool:
+        futures = {
+            pool.submit(_run_shard, i, shards[i], endpoints[i % len(endpoints)], note_index, load_workers): i
+            for i in range(n_shards)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                done, skipped = future.result()
+                print(f"✅ 分片 {i} ({endpoints[i % len(endpoints)]}): 新处理 {done} / 检查点跳过 {skipped} 个文件")
+            except Exception as e:
+                print(f"❌ 分片 {i} 失败: {e}")
+                failed.append(i)
+    if failed:
+        print(f"⚠️ {len(failed)} 个分片失败，已完成的文件保存在检查点中，重新运行即可续跑")
+        return False
+
+    # 3. 合并为主索引
+    print("🔀 正在合并分片...")
+    storage.clear_data()
+    AnswerCache.publish_invalidation(["*"])
+    manifest = FileManifest()
+    vectorstore = storage._open_vectorstore()
+    bm25 = SparseBM25Index(storage.bm25_index_dir, tokenizer=config.BM25_TOKENIZER)
+    for i in range(n_shards):
+        _merge_shard(storage, i, manifest, vectorstore, bm25)
+    bm25.save()
+    storage._flush_stores()
+    manifest.save()
+    storage.save_graph(_build_graph(manifest), manifest.parents_by_source())
+
+    shutil.rmtree(config.SHARD_WORK_DIR)
+    return True
@@ -1,5 +1,15 @@
 # 职责：提供 Markdown 语义切分与父子块切分逻辑。
+import re
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter, MarkdownHeaderTextSplitter
+import config
+
+# 句末 (优先级 2) 与逗号 / 空白 (优先级 3) 断点，断点位置取匹配末尾
+_SENTENCE_END = re.compile(r"[。！？；!?;]+|\.(?=\s)")
+_SOFT_BREAK = re.compile(r"[，,、：:]|[ \t]+")
 
 class TextSplitterFactory:
     def __init__(self):
@@ -7,12 +17,14 @@ class TextSplitterFactory:
         self.headers_to_split_on = [("#", "H1"), ("##", "H2"), ("###", "H3")]
 
     def get_parent_splitter(self):
-        """父块：提供给 LLM 的完整语义上下文 (1000字符)"""
-        return RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+        """父块：提供给 LLM 的完整语义上下文 (默认 1000字符)"""
+        return RecursiveCharacterTextSplitter(chunk_size=config.PARENT_CHUNK_SIZE,
+                                              chunk_overlap=config.PARENT_CHUNK_OVERLAP)
 
     def get_child_splitter(self):
-        """子块：用于精确向量匹配 (200字符)"""
-        return RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=20)
+        """子块：用于精确向量匹配 (默认 200字符)"""
+        return RecursiveCharacterTextSplitter(chunk_size=config.CHILD_CHUNK_SIZE,
+                                              chunk_overlap=config.CHILD_CHUNK_OVERLAP)
     
     def pre_split_markdown(self, docs):
         """
@@ -33,4 +45,150 @@ class TextSplitterFactory:
                 # PDF 等非 MD 文件直接进入下一阶段
                 split_docs.append(doc)
                 
-        return split_docs
\ No newline at end of file
+        return split_docs
+
+    def get_structured_splitter(self) -> "StructuredSplitter":
+        """单遍结构化切分：标题 / 代码块 / 列表只解析一次，父子块以原文偏移表示"""
+        return StructuredSplitter(self.headers_to_split_on)
+
+    def pre_split(self, docs):
+        """入库前处理：三段式切分时按标题预切；结构化切分在单遍扫描中自行处理标题，原样返回"""
+        if config.SPLITTER == "structured":
+            return docs
+        return self.pre_split_markdown(docs)
+
+
+class TextSpan:
+    """原文中的一段 [start, end)；父块携带标题元数据与子块区间"""
+    __slots__ = ("start", "end", "headers", "children")
+
+    def __init__(self, start: int, end: int, headers: Dict[str, str], children: List[Tuple[int, int]]):
+        self.start = start
+        self.end = end
+        self.headers = headers
+        self.children = children
+
+
+class StructuredSplitter:
+    """
+    单遍扫描一篇笔记：逐行识别标题 (与 MarkdownHeaderTextSplitter 相同的规则，标题行不计入正文)、
+    代码块与段落 / 列表行边界，记录为按优先级分组的断点位置：
+      0 段落空行、代码块前后  1 普通换行 (含列表项)  2 句末标点、代码块内换行  3 逗号与空白
+    父块与子块都在同一组断点上贪心选取：窗口 (size/2, size] 内取优先级最高的最后一个断点，
+    找不到则硬切；下一块从 [end - overlap, end) 内最早的断点开始。
+    切分只产生 (start, end) 偏移，正文字符串到写入存储时才切片生成。
+    """
+
+    def __init__(self, headers_to_split_on: Sequence[Tuple[str, str]] = (("#", "H1"), ("##", "H2"), ("###", "H3")),
+                 parent_size: int = config.PARENT_CHUNK_SIZE, parent_overlap: int = config.PARENT_CHUNK_OVERLAP,
+                 child_size: int = config.CHILD_CHUNK_SIZE, child_overlap: int = config.CHILD_CHUNK_OVERLAP):
+        self.header_keys = {len(sep): key for sep, key in headers_to_split_on}
+        self.parent_size, self.parent_overlap = parent_size, parent_overlap
+        self.child_size, self.child_overlap = child_size, child_overlap
+
+    # --- 解析 ---
+    def parse(self, text: str, markdown: bool = True) -> Tuple[List[Tuple[int, int, Dict[str, str]]], List[List[int]]]:
+        """返回 (章节 [(start, end, 标题元数据)], 各优先级的断点位置 (升序))"""
+        breaks: List[List[int]] = [[], [], [], []]
+        sections = []
+        headers: Dict[str, str] = {}
+        levels: Dict[str, int] = {}
+        sec_start = pos = 0
+        fence = ""
+        for line in text.splitlines(keepends=True):
+            end = pos + len(line)
+            stripped = line.strip()
+            if markdown and fence:
+                if stripped.startswith(fence):
+                    fence = ""
+                    breaks[0].append(end)
+                else:
+                    breaks[2].append(end)
+            elif markdown and (stripped.startswith("```") and stripped.count("```") == 1 or stripped.startswith("~~~")):
+                fence = stripped[:3]
+                breaks[0].append(pos)
+                breaks[2].append(end)
+            elif markdown and stripped.startswith("#") and self._header_level(stripped):
+                level = self._header_level(stripped)
+                if text[sec_start:pos].strip():
+                    sections.append((sec_start, pos, headers))
+                key = self.header_keys[level]
+                headers = {k: v for k, v in headers.items() if levels[k] < level}
+                headers[key] = stripped[level:].strip()
+                levels[key] = level
+                sec_start = end
+            else:
+                breaks[0 if not stripped else 1].append(end)
+            pos = end
+        if text[sec_start:].strip():
+            sections.append((sec_start, len(text), headers))
+
+        # 句内断点：两次正则扫描在 C 层完成，代码块内的命中只作为低优先级候选
+        breaks[2].extend(m.end() for m in _SENTENCE_END.finditer(text))
+        breaks[3].extend(m.end() for m in _SOFT_BREAK.finditer(text))
+        breaks[2].sort()
+        breaks[3].sort()
+        return sections, breaks
+
+    def _header_level(self, stripped: str) -> int:
+        n = len(stripped) - len(stripped.lstrip("#"))
+        if n in self.header_keys and (len(stripped) == n or stripped[n] == " "):
+            return n
+        return 0
+
+    # --- 切分 ---
+    @staticmethod
+    def _last_break(breaks: List[List[int]], lo: int, hi: int) -> Optional[int]:
+        """(lo, hi] 内优先级最高的最后一个断点"""
+        for points in breaks:
+            i = bisect_right(points, hi) - 1
+            if i >= 0 and points[i] > lo:
+                return points[i]
+        return None
+
+    @staticmethod
+    def _first_break(breaks: List[List[int]], lo: int, hi: int) -> Optional[int]:
+        """[lo, hi) 内最早的断点 (任意优先级)"""
+        first = None
+        for points in breaks:
+            i = bisect_left(points, lo)
+            if i < len(points) and points[i] < hi and (first is None or points[i] < first):
+                first = points[i]
+        return first
+
+    def _chunks(self, text: str, breaks: List[List[int]], lo: int, hi: int,
+                size: int, overlap: int) -> List[Tuple[int, int]]:
+        spans = []
+        a = lo
+        while True:
+            while a < hi and text[a].isspace():
+                a += 1
+            if a >= hi:
+                return spans
+            b = hi if hi - a <= size else (self._last_break(breaks, a + size // 2, a + size) or a + size)
+            e = b
+            while e > a and text[e - 1].isspace():
+                e -= 1
+            spans.append((a, e))
+            if b >= hi:
+                return spans
+            start = self._first_break(breaks, b - overlap, b) if overlap else b
+            a = max(start if start is not None else b - overlap, a + 1)
+
+    def split_text(self, text: str, markdown: bool = True) -> List[TextSpan]:
+        sections, breaks = self.parse(text, markdown)
+        parents = []
+        for lo, hi, headers in sections:
+            for ps, pe in self._chunks(text, breaks, lo, hi, self.parent_size, self.parent_overlap):
+                children = self._chunks(text, breaks, ps, pe, self.child_size, self.child_overlap)
+                parents.append(TextSpan(ps, pe, headers, children))
+        return parents
+
+    def split_document(self, doc: Document) -> Iterator[Tuple[Document, List[Document]]]:
+        """生成 (父块, 子块列表)；metadata 的 start / end 为在原笔记正文中的字符偏移"""
+        text = doc.page_content
+        for span in self.split_text(text, markdown=doc.metadata.get("type") == ".md"):
+            meta = {**doc.metadata, **span.headers, "start": span.start, "end": span.end}
+            children = [Document(page_content=text[a:b], metadata={**meta, "start": a, "end": b})
+                        for a, b in span.children]
+            yield Document(page_content=text[span.start:span.end], metadata=meta), children
@@ -1,19 +1,29 @@
 import os
+import json
+import mmap
 import shutil
 import pickle
+import struct
+import threading
+import time
 import uuid
-import networkx as nx
-from typing import Iterator, List, Optional, Sequence, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 # 核心依赖 (适配 LangChain 0.3+)
 from langchain_core.stores import ByteStore
 from langchain_core.documents import Document
-from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
 from langchain_ollama import OllamaEmbeddings
-from langchain_community.retrievers import BM25Retriever
 
 import config
+from batching import BatchedEmbeddings
+from bm25_index import SparseBM25Index, SparseBM25Retriever
+from embedding_cache import CachedEmbeddings
+from graph_index import GraphIndex
 from splitter import TextSplitterFactory
+from tracing import tracer
 
 # --- 1. 轻量化本地存储存储父文档 ---
 class LocalFileStore(ByteStore):
@@ -23,9 +33,10 @@ class LocalFileStore(ByteStore):
 
     def mget(self, keys: Sequence[str]) -> List[Optional[bytes]]:
         results = []
-        for k in keys:
-            path = os.path.join(self.root_path, k)
-            results.append(open(path, "rb").read() if os.path.exists(path) else None)
+        with tracer.span("文档库读取", 键数=len(keys)):
+            for k in keys:
+                path = os.path.join(self.root_path, k)
+                results.append(open(path, "rb").read() if os.path.exists(path) else None)
         return results
 
     def mset(self, key_value_pairs: Sequence[Tuple[str, bytes]]) -> None:
@@ -42,123 +53,655 @@ class LocalFileStore(ByteStore):
         for k in os.listdir(self.root_path):
             if prefix is None or k.startswith(prefix): yield k
 
+class PackedFileStore(ByteStore):
+    """
+    单文件追加式父文档存储：
+    - segment.dat 顺序追加 [key_len:u16][val_len:u32][key][value] 记录，删除写入墓碑记录
+    - index.json 持久化 key -> (offset, length)，并记录已覆盖的 segment 长度；
+      打开时只需回放该长度之后的尾部记录，因此 mset 只追加 + 一次 fsync
+    - 读取走 mmap；死记录占比过高时在 flush() 中压缩
+    """
+
+    HEADER = struct.Struct("<HI")
+    TOMBSTONE = 0xFFFFFFFF
+    COMPACT_RATIO = 0.5          # 死字节占比超过该值时压缩
+    COMPACT_MIN_BYTES = 64 << 20  # 小文件不值得压缩
+
+    def __init__(self, root_path: str):
+        self.root_path = root_path
+        os.makedirs(root_path, exist_ok=True)
+        self.segment_path = os.path.join(root_path, "segment.dat")
+        self.index_path = os.path.join(root_path, "index.json")
+        self._lock = threading.RLock()
+        self.index = {}      # key -> [offset, length]
+        self.indexed_size = 0
+        self.dead_bytes = 0
+        self._mm = None
+        self._mm_size = 0
+        self._inode = None
+        if not os.path.exists(self.segment_path):
+            open(self.segment_path, "wb").close()
+        self._load_index()
+        self.refresh()
+
+    # --- 索引维护 ---
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.index = meta["keys"]
+            self.indexed_size = meta["segment_size"]
+            self.dead_bytes = meta.get("dead_bytes", 0)
+        except Exception as e:
+            print(f"⚠️ 父文档索引损坏: {e}，将从 segment 重建")
+            self.index, self.indexed_size, self.dead_bytes = {}, 0, 0
+
+    def refresh(self):
+        """回放 segment 中尚未进入索引的尾部记录 (其他进程追加的数据也能被看到)"""
+        with self._lock:
+            st = os.stat(self.segment_path)
+            size = st.st_size
+            if st.st_ino != self._inode or size < self.indexed_size:
+                # segment 被压缩/替换 (inode 变化)：整体重建
+                if self._inode is not None or size < self.indexed_size:
+                    self.index, self.indexed_size, self.dead_bytes = {}, 0, 0
+                if self._mm is not None:
+                    self._mm.close()
+                    self._mm, self._mm_size = None, 0
+                self._inode = st.st_ino
+            if size == self.indexed_size:
+                return
+            with open(self.segment_path, "rb") as f:
+                f.seek(self.indexed_size)
+                pos = self.indexed_size
+                while pos + self.HEADER.size <= size:
+                    key_len, val_len = self.HEADER.unpack(f.read(self.HEADER.size))
+                    body = key_len + (0 if val_len == self.TOMBSTONE else val_len)
+                    if pos + self.HEADER.size + body > size:
+                        break  # 写入未完成的半条记录，等待下次回放
+                    key = f.read(key_len).decode("utf-8")
+                    pos += self.HEADER.size + key_len
+                    old = self.index.pop(key, None)
+                    if old:
+                        self.dead_bytes += old[1]
+                    if val_len == self.TOMBSTONE:
+                        continue
+                    self.index[key] = [pos, val_len]
+                    f.seek(val_len, os.SEEK_CUR)
+                    pos += val_len
+                self.indexed_size = pos
+
+    def _view(self):
+        size = self.indexed_size
+        if self._mm is None or self._mm_size < size:
+            if self._mm is not None:
+                self._mm.close()
+            with open(self.segment_path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+            self._mm_size = size
+        return self._mm
+
+    def _append(self, records: List[bytes]):
+        with open(self.segment_path, "ab") as f:
+            f.write(b"".join(records))
+            f.flush()
+            os.fsync(f.fileno())
+        self.refresh()
+
+    # --- ByteStore 接口 ---
+    def mget(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        with tracer.span("文档库读取", 键数=len(keys)), self._lock:
+            self.refresh()  # 一次 stat，感知其他进程的追加/压缩
+            mm = self._view()
+            results = []
+            for k in keys:
+                loc = self.index.get(k)
+                results.append(mm[loc[0]:loc[0] + loc[1]] if loc else None)
+            return results
+
+    def mset(self, key_value_pairs: Sequence[Tuple[str, bytes]]) -> None:
+        records = []
+        for k, v in key_value_pairs:
+            kb = k.encode("utf-8")
+            records.append(self.HEADER.pack(len(kb), len(v)) + kb + v)
+        if records:
+            with self._lock:
+                self._append(records)
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        with self._lock:
+            records = []
+            for k in keys:
+                if k in self.index:
+                    kb = k.encode("utf-8")
+                    records.append(self.HEADER.pack(len(kb), self.TOMBSTONE) + kb)
+            if records:
+                self._append(records)
+
+    def yield_keys(self, prefix: Optional[str] = None) -> Iterator[str]:
+        with self._lock:
+            self.refresh()
+            keys = list(self.index)
+        for k in keys:
+            if prefix is None or k.startswith(prefix): yield k
+
+    # --- 持久化与压缩 ---
+    def flush(self):
+        """持久化索引；死记录过多时顺带压缩"""
+        with self._lock:
+            self.refresh()
+            if self.dead_bytes > self.COMPACT_MIN_BYTES and \
+                    self.dead_bytes > self.indexed_size * self.COMPACT_RATIO:
+                self.compact()
+                return
+            self._write_index()
+
+    def _write_index(self):
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"segment_size": self.indexed_size, "dead_bytes": self.dead_bytes,
+                       "keys": self.index}, f)
+        os.replace(tmp, self.index_path)
+
+    def compact(self):
+        """只保留存活记录重写 segment，并原子替换"""
+        with self._lock:
+            self.refresh()
+            mm = self._view()
+            tmp = self.segment_path + ".compact"
+            new_index, pos = {}, 0
+            with open(tmp, "wb") as f:
+                for k, (off, length) in self.index.items():
+                    kb = k.encode("utf-8")
+                    f.write(self.HEADER.pack(len(kb), length) + kb)
+                    pos += self.HEADER.size + len(kb)
+                    f.write(mm[off:off + length])
+                    new_index[k] = [pos, length]
+                    pos += length
+                f.flush()
+                os.fsync(f.fileno())
+            if self._mm is not None:
+                self._mm.close()
+                self._mm, self._mm_size = None, 0
+            os.replace(tmp, self.segment_path)
+            self.index, self.indexed_size, self.dead_bytes = new_index, pos, 0
+            self._inode = os.stat(self.segment_path).st_ino
+            self._write_index()
+
+
+def dumps_doc(doc: Document) -> bytes:
+    """父块序列化：JSON (正文 + 元数据)，替代 pickle"""
+    return json.dumps({"c": doc.page_content, "m": doc.metadata},
+                      ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads_doc(data: bytes) -> Document:
+    # 兼容旧版 LocalFileStore 中的 pickle 数据 (全量重建后即不再出现)
+    if data[:1] != b"{":
+        return pickle.loads(data)
+    obj = json.loads(data)
+    return Document(page_content=obj["c"], metadata=obj["m"])
+
+
 # --- 2. 手写父子文档管理逻辑 ---
+class IngestStats:
+    """入库吞吐计数：用于调节 EMBED_BATCH_SIZE / EMBED_CONCURRENCY"""
+    def __init__(self):
+        self.chunks = 0
+        self.batches = 0
+        self.embed_time = 0.0  # 各批嵌入耗时之和 (并发时大于墙钟时间)
+        self.write_time = 0.0
+        self.start = time.perf_counter()
+
+    def report(self) -> str:
+        elapsed = time.perf_counter() - self.start
+        rate = self.chunks / elapsed if elapsed > 0 else 0.0
+        return (f"📈 {self.chunks} 子块 / {self.batches} 批 | {rate:.1f} chunks/s | "
+                f"嵌入 {self.embed_time:.1f}s (累计) | 写入 {self.write_time:.1f}s | 总耗时 {elapsed:.1f}s")
+
+
 class SimpleParentRetriever:
-    def __init__(self, vectorstore, docstore, child_splitter, parent_splitter):
+    def __init__(self, vectorstore, docstore, child_splitter, parent_splitter,
+                 batch_size: int = config.EMBED_BATCH_SIZE,
+                 max_workers: int = config.EMBED_CONCURRENCY,
+                 structured_splitter=None):
+        """structured_splitter 给定时整篇笔记单遍切出父子块 (child / parent_splitter 不再使用)"""
         self.vectorstore = vectorstore
         self.docstore = docstore
         self.child_splitter = child_splitter
         self.parent_splitter = parent_splitter
+        self.structured_splitter = structured_splitter
         self.id_key = "doc_id"
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.stats = IngestStats()
+        self._on_children: Optional[Callable[[List[Document]], None]] = None
+
+    def _embed(self, texts: List[str]):
+        t0 = time.perf_counter()
+        vectors = self.vectorstore.embeddings.embed_documents(texts)
+        return vectors, time.perf_counter() - t0
+
+    def _write(self, batch: List[Document], future):
+        """等待一批嵌入结果，并以预计算向量一次性写入 Chroma"""
+        vectors, embed_time = future.result()
+        t0 = time.perf_counter()
+        self.vectorstore._collection.add(
+            ids=[str(uuid.uuid4()) for _ in batch],
+            embeddings=vectors,
+            documents=[d.page_content for d in batch],
+            metadatas=[d.metadata for d in batch],
+        )
+        if self._on_children is not None:
+            self._on_children(batch)
+        self.stats.write_time += time.perf_counter() - t0
+        self.stats.embed_time += embed_time
+        self.stats.chunks += len(batch)
+        self.stats.batches += 1
+
+    def _split(self, doc: Document) -> Iterator[Tuple[Document, List[Document]]]:
+        """一篇文档 -> (父块, 子块列表)"""
+        if self.structured_splitter is not None:
+            yield from self.structured_splitter.split_document(doc)
+            return
+        # 生成语义完整的父块 (用于最终阅读)，再切细颗粒度子块 (用于精准匹配)
+        for p_doc in self.parent_splitter.split_documents([doc]):
+            yield p_doc, self.child_splitter.split_documents([p_doc])
+
+    def add_documents(self, documents: Iterable[Document],
+                      on_children: Optional[Callable[[List[Document]], None]] = None,
+                      id_map: Optional[Dict[str, List[str]]] = None) -> Dict[str, List[str]]:
+        """
+        切分并入库，返回 原始文件路径 -> 父块 ID 列表 (供增量清单记录)。
+        子块跨父块攒批后并发嵌入，在途批次数不超过 max_workers，写入在主线程串行进行。
+        on_children: 每批子块写入 Chroma 后回调 (用于流式构建 BM25，无需事后从 Chroma 全量拉回)。
+        id_map: 调用方传入时就地填充；中途失败时调用方据此回滚已写入的父子块。
+        """
+        self.stats = IngestStats()
+        self._on_children = on_children
+        id_map = {} if id_map is None else id_map
+        pending_parents: List[Tuple[str, bytes]] = []
+        pending_children: List[Document] = []
+        in_flight = deque()
+
+        def flush():
+            # 父块先落盘，保证子块可检索时父块已存在
+            if pending_parents:
+                self.docstore.mset(pending_parents)
+                pending_parents.clear()
+            if pending_children:
+                batch = pending_children[:]
+                pending_children.clear()
+                in_flight.append((batch, pool.submit(self._embed, [d.page_content for d in batch])))
+            while len(in_flight) > self.max_workers:
+                self._write(*in_flight.popleft())
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for doc in documents:
+                for p_doc, child_docs in self._split(doc):
+                    _id = str(uuid.uuid4())
+                    ids = id_map.setdefault(doc.metadata.get("path", ""), [])
+                    # 父块在文件内的顺序号：上下文打包据此合并相邻章节
+                    p_doc.metadata["parent_seq"] = len(ids)
+                    ids.append(_id)
+                    # 存储原始父块
+                    pending_parents.append((_id, dumps_doc(p_doc)))
+                    for c_doc in child_docs:
+                        c_doc.metadata["parent_seq"] = len(ids) - 1
+                        c_doc.metadata[self.id_key] = _id
+                    pending_children.extend(child_docs)
+                    if len(pending_children) >= self.batch_size:
+                        flush()
+            flush()
+            while in_flight:
+                self._write(*in_flight.popleft())
+
+        print(self.stats.report())
+        return id_map
+
+class TracedEmbeddings(Embeddings):
+    """最内层包装：只有真正发往 Ollama 的嵌入请求 (缓存未命中) 才计入 "Ollama嵌入" span"""
+
+    def __init__(self, base: Embeddings):
+        self.base = base
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with tracer.span("Ollama嵌入", 条数=len(texts)):
+            return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with tracer.span("Ollama嵌入", 条数=1):
+            return self.base.embed_query(text)
 
-    def add_documents(self, documents: List[Document]):
-        for doc in documents:
-            # 生成语义完整的父块 (用于最终阅读)
-            parent_docs = self.parent_splitter.split_documents([doc])
-            for p_doc in parent_docs:
-                _id = str(uuid.uuid4())
-                # 存储原始父块
-                self.docstore.mset([(_id, pickle.dumps(p_doc))])
-                # 生成细颗粒度子块 (用于精准匹配)
-                child_docs = self.child_splitter.split_documents([p_doc])
-                for c_doc in child_docs:
-                    c_doc.metadata[self.id_key] = _id
-                self.vectorstore.add_documents(child_docs)
 
 # --- 3. 存储管理器 (核心) ---
 class StorageManager:
-    def __init__(self):
-        # 初始化 Embedding
-        self.embedding = OllamaEmbeddings(
+    # Chroma where-$in 过滤的单批 ID 数量
+    DELETE_BATCH = 500
+
+    def __init__(self, persist_dir: str = config.PERSIST_DIR,
+                 base_url: str = config.OLLAMA_BASE_URL,
+                 embed_cache_dir: str = config.EMBED_CACHE_DIR,
+                 batch_queries: bool = False):
+        """
+        persist_dir / base_url / embed_cache_dir 默认取自 config；
+        分片入库时每个工作进程使用独立的数据目录、Ollama 端点与嵌入缓存 (embed_cache_dir=None 关闭缓存)。
+        batch_queries: 查询服务中把并发请求的查询嵌入合并为一次调用 (位于磁盘缓存之下，只批量未命中的查询)。
+        """
+        # 各存储路径沿用 config 中相对 PERSIST_DIR 的布局
+        rebase = lambda p: os.path.join(persist_dir, os.path.relpath(p, config.PERSIST_DIR))
+        self.persist_dir = persist_dir
+        self.db_path = rebase(config.DB_PATH)
+        self.doc_store_path = rebase(config.DOC_STORE_PATH)
+        self.graph_path = rebase(config.GRAPH_PATH)
+        self.graph_index_dir = rebase(config.GRAPH_INDEX_DIR)
+        self.bm25_index_dir = rebase(config.BM25_INDEX_DIR)
+        self.vector_index_dir = rebase(config.VECTOR_INDEX_DIR)
+        self.index_version_path = rebase(config.INDEX_VERSION_PATH)
+        self._numpy_store = None  # numpy 向量后端：同一实例在入库期间累积增量段，_flush_stores 时写出
+        self._live_bm25 = None  # 实时索引：跨事务常驻的 BM25 索引，只写增量，compact_indexes 时合并
+
+        # 初始化 Embedding (可选包一层磁盘缓存，入库与查询共用)
+        self.embedding = TracedEmbeddings(OllamaEmbeddings(
             model=config.EMBED_MODEL_NAME,
-            base_url=config.OLLAMA_BASE_URL
-        )
+            base_url=base_url
+        ))
+        self.query_batcher = None
+        if batch_queries:
+            self.embedding = BatchedEmbeddings(
+                self.embedding, max_batch=config.SERVE_EMBED_BATCH,
+                max_wait_ms=config.SERVE_BATCH_WAIT_MS, max_queue=config.SERVE_MAX_QUEUE)
+            self.query_batcher = self.embedding.batcher
+        if config.EMBED_CACHE_ENABLED and embed_cache_dir:
+            self.embedding = CachedEmbeddings(self.embedding, config.EMBED_MODEL_NAME, cache_dir=embed_cache_dir)
         self.splitter_factory = TextSplitterFactory()
         # 确保数据目录存在
-        self.docstore = LocalFileStore(config.DOC_STORE_PATH)
-        os.makedirs(config.PERSIST_DIR, exist_ok=True)
+        os.makedirs(self.persist_dir, exist_ok=True)
+        self.docstore = self._open_docstore()
+
+    def _open_docstore(self):
+        """父文档库后端：packed (单文件追加) 或 files (一键一文件)"""
+        if config.DOC_STORE_BACKEND == "packed":
+            return PackedFileStore(self.doc_store_path)
+        return LocalFileStore(self.doc_store_path)
 
     def clear_data(self):
         """清空所有本地索引数据"""
-        if os.path.exists(config.PERSIST_DIR):
-            shutil.rmtree(config.PERSIST_DIR)
-        os.makedirs(config.PERSIST_DIR, exist_ok=True)
+        if self._numpy_store is not None:
+            self._numpy_store.index.close()
+            self._numpy_store = None
+        self._live_bm25 = None
+        if os.path.exists(self.persist_dir):
+            shutil.rmtree(self.persist_dir)
+        os.makedirs(self.persist_dir, exist_ok=True)
+        self.docstore = self._open_docstore()
+
+    # --- 索引版本：入库 / 实时索引提交后发布，运行中的检索引擎据此热加载 ---
+    def read_index_version(self) -> Optional[dict]:
+        try:
+            with open(self.index_version_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def publish_index_version(self, **info) -> dict:
+        """版本号递增并原子替换版本文件 (先写临时文件再 os.replace，读者不会看到半个文件)"""
+        version = (self.read_index_version() or {}).get("version", 0) + 1
+        record = {"version": version, "updated_at": time.time(), **info}
+        tmp = self.index_version_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp, self.index_version_path)
+        return record
+
+    def index_stamp(self) -> Optional[Tuple[int, int]]:
+        """版本文件指纹 (mtime_ns, inode)：查询路径上只需一次 stat，不解析 JSON"""
+        try:
+            st = os.stat(self.index_version_path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_ino
+
+    def reopen(self):
+        """丢弃本进程缓存的索引句柄，随后的 get_retriever_components 读到其他进程提交的新数据"""
+        # 不关闭旧的 numpy 向量索引：在途查询可能仍持有它，memmap 随对象回收释放
+        self._numpy_store = None
+        self._live_bm25 = None
+        if hasattr(self.docstore, "refresh"):
+            self.docstore.refresh()
+        if config.VECTOR_BACKEND != "numpy":
+            # Chroma 在进程内缓存 HNSW 段，不会感知其他进程的写入；清掉共享 System 后重新打开
+            try:
+                from chromadb.api.client import SharedSystemClient
+                SharedSystemClient.clear_system_cache()
+            except Exception as e:
+                print(f"⚠️ Chroma 客户端缓存清理失败: {e}")
 
     # --- 修复：补全缺失的 load_graph 方法 ---
-    def load_graph(self) -> nx.Graph:
-        """从本地持久化文件加载知识图谱"""
-        if os.path.exists(config.GRAPH_PATH):
+    def load_graph(self) -> "nx.Graph":
+        """从本地持久化文件加载知识图谱 (仅入库侧需要可变图，networkx 按需导入)"""
+        import networkx as nx
+        if os.path.exists(self.graph_path):
             try:
-                with open(config.GRAPH_PATH, "rb") as f:
-                    print(f"🕸️ 正在加载知识图谱: {config.GRAPH_PATH}")
-                    return pickle.load(f)
+                with open(self.graph_path, "rb") as f:
+                    print(f"🕸️ 正在加载知识图谱: {self.graph_path}")
+                    graph = pickle.load(f)
             except Exception as e:
                 print(f"⚠️ 图谱加载失败: {e}, 返回空图")
                 return nx.Graph()
         else:
             print("⚠️ 未发现图谱文件，初始化新图谱")
             return nx.Graph()
+        # 回放实时索引写出的增量节点 (尚未合并进 graph.pkl 的边增删)
+        for node, rec in GraphIndex.read_delta(self.graph_index_dir).items():
+            if rec is None:
+                if graph.has_node(node):
+                    graph.remove_node(node)
+                continue
+            if graph.has_node(node):
+                adj = set(rec["adj"])
+                graph.remove_edges_from([(node, nb) for nb in list(graph.neighbors(node)) if nb not in adj])
+                graph.nodes[node].clear()
+            graph.add_node(node, **rec["attrs"])
+            graph.add_edges_from((node, nb) for nb in rec["adj"])
+        return graph
 
-    def save_graph(self, graph: nx.Graph):
-        """将知识图谱保存到本地"""
-        with open(config.GRAPH_PATH, "wb") as f:
+    def save_graph(self, graph: "nx.Graph", parents_by_source: Optional[Dict[str, List[str]]] = None):
+        """将知识图谱保存到本地，并重建查询侧使用的紧凑图谱索引"""
+        with open(self.graph_path, "wb") as f:
             pickle.dump(graph, f)
-            print(f"✅ 图谱已保存至: {config.GRAPH_PATH}")
+            print(f"✅ 图谱已保存至: {self.graph_path}")
+        GraphIndex.build(graph, parents_by_source or {}, self.graph_index_dir, top_n=config.GRAPH_TOP_N)
 
-    def build_vector_bm25_index(self, docs: List[Document]):
-        """构建双路索引：Chroma(向量) + BM25(关键词)"""
-        # 1. 初始化 Chroma
-        vectorstore = Chroma(
+    def save_graph_delta(self, graph: "nx.Graph", nodes: Iterable[str],
+                         parents_by_source: Dict[str, List[str]]) -> bool:
+        """
+        实时索引：只写出本事务触及节点的邻接与父块 (图谱索引 delta.json)，不重写 graph.pkl、不重建索引。
+        图谱索引尚无主段 (未入库过 / 由旧版本构建) 时返回 False，由调用方整体保存。
+        """
+        if GraphIndex.generation_of(self.graph_index_dir) is None:
+            return False
+        GraphIndex.write_delta(graph, nodes, parents_by_source, self.graph_index_dir, top_n=config.GRAPH_TOP_N)
+        return True
+
+    def load_graph_index(self) -> Optional[GraphIndex]:
+        """查询侧：memmap 加载图谱索引，不依赖 networkx"""
+        index = GraphIndex.load(self.graph_index_dir)
+        if index is None:
+            print("⚠️ 未发现图谱索引，请重新运行入库脚本以启用图谱增强")
+        return index
+
+    def _open_vectorstore(self):
+        if config.VECTOR_BACKEND == "numpy":
+            if self._numpy_store is None:
+                from vector_index import NumpyVectorStore
+                self._numpy_store = NumpyVectorStore(self.vector_index_dir, self.embedding)
+            return self._numpy_store
+        from langchain_chroma import Chroma  # chromadb 导入较重，仅在真正打开向量库时加载
+        return Chroma(
             collection_name="rag_collection",
             embedding_function=self.embedding,
-            persist_directory=config.DB_PATH
+            persist_directory=self.db_path
         )
-        
-        # 2. 初始化父文档存储 (ByteStore)
-        doc_store = LocalFileStore(config.DOC_STORE_PATH)
-        
-        # 3. 运行父子文档切分逻辑
-        retriever = SimpleParentRetriever(
+
+    def _make_parent_retriever(self, vectorstore, doc_store):
+        return SimpleParentRetriever(
             vectorstore=vectorstore, 
             docstore=doc_store,
             child_splitter=self.splitter_factory.get_child_splitter(),
-            parent_splitter=self.splitter_factory.get_parent_splitter()
+            parent_splitter=self.splitter_factory.get_parent_splitter(),
+            structured_splitter=(self.splitter_factory.get_structured_splitter()
+                                 if config.SPLITTER == "structured" else None),
         )
 
-        print(f"💾 正在向量化并索引 {len(docs)} 个原始文档...")
-        retriever.add_documents(docs)
-
-        # 4. 构建并保存 BM25 索引
-        print("🧮 正在构建 BM25 关键词索引...")
-        all_data = vectorstore.get()
-        if all_data['documents']:
-            bm25_docs = [
-                Document(page_content=d, metadata=m) 
-                for d, m in zip(all_data['documents'], all_data['metadatas'])
-            ]
-            bm25_retriever = BM25Retriever.from_documents(bm25_docs)
-            with open(config.BM25_PATH, "wb") as f:
-                pickle.dump(bm25_retriever, f)
+    def build_vector_bm25_index(self, docs: Iterable[Document]) -> Dict[str, List[str]]:
+        """构建双路索引：Chroma(向量) + BM25(关键词)"""
+        # 1. 初始化 Chroma
+        vectorstore = self._open_vectorstore()
+        
+        # 2. 初始化父文档存储 (ByteStore)
+        doc_store = self.docstore
+        
+        # 3. 运行父子文档切分逻辑
+        retriever = self._make_parent_retriever(vectorstore, doc_store)
+
+        # docs 可以是生成器：解析、切分与向量化流水并行；
+        # 子块每写入 Chroma 一批即喂给 BM25 增量段，语料不会在内存中完整驻留
+        print("💾 正在向量化并索引原始文档 (同步构建 BM25 关键词索引)...")
+        bm25 = SparseBM25Index(self.bm25_index_dir, tokenizer=config.BM25_TOKENIZER)
+        id_map = retriever.add_documents(docs, on_children=bm25.add_documents)
+
+        # 4. 合并并保存 BM25 倒排索引
+        print("🧮 正在写出 BM25 关键词索引...")
+        bm25.save()
+        self._flush_stores()
         print("✅ 存储层构建成功！")
+        return id_map
+
+    def update_vector_bm25_index(self, docs: Iterable[Document], stale_ids: Iterable[str],
+                                 compact: bool = True) -> Dict[str, List[str]]:
+        """
+        增量更新双路索引：先只为新增/修改的文档切分、向量化并追加，全部写入成功后
+        再删除旧父块 (Chroma 子块 + 父文档 + BM25 条目)。
+        中途失败 (如 Ollama 不可用) 时删除本次已写入的新父子块并丢弃常驻 BM25，
+        索引保持在上一个已提交的状态，重试不会产生孤儿或重复。
+        compact=False (实时索引的小事务)：BM25 / numpy 向量索引只写增量段 (delta.npz)，
+        父文档库的 segment 追加已 fsync、不重写 index.json；合并由 compact_indexes() 另行调度。
+        """
+        stale_ids = list(stale_ids)
+        vectorstore = self._open_vectorstore()
+        doc_store = self.docstore
+
+        # 1. 仅对变更文档执行切分与向量化，新子块同步追加到原有倒排索引
+        print("💾 正在向量化并索引变更文档...")
+        bm25 = self._open_bm25_for_update()
+        id_map: Dict[str, List[str]] = {}
+        try:
+            self._make_parent_retriever(vectorstore, doc_store).add_documents(
+                docs, on_children=bm25.add_documents, id_map=id_map)
+
+            # 2. 新块全部写入后再清理过期父块及其子块
+            if stale_ids:
+                print(f"🗑️ 正在删除 {len(stale_ids)} 个过期父块...")
+                self.delete_parents(stale_ids, vectorstore, doc_store)
+            bm25.delete_parents(stale_ids)
+        except Exception:
+            new_ids = [pid for ids in id_map.values() for pid in ids]
+            print(f"↩️ 事务失败，回滚本次已写入的 {len(new_ids)} 个父块")
+            self.delete_parents(new_ids, vectorstore, doc_store)
+            # 常驻 BM25 已混入部分新子块，丢弃后下次按磁盘上已提交的主段 + 增量段重新加载
+            self._live_bm25 = None
+            raise
 
-    def get_retriever_components(self):
-        """为前端提供检索所需的全部物理组件"""
+        # 3. 保存 BM25：合并增量段整体写出，或只追加增量
+        if compact:
+            print("🧮 正在更新 BM25 关键词索引...")
+            bm25.save()
+            self._live_bm25 = None
+            self._flush_stores()
+            print("✅ 增量更新完成！")
+        else:
+            bm25.save_delta()
+            self._live_bm25 = bm25
+            if self._numpy_store is not None:
+                self._numpy_store.save_delta()
+            if isinstance(self.embedding, CachedEmbeddings):
+                self.embedding.flush()
+        return id_map
+
+    def compact_indexes(self, graph: "nx.Graph", parents_by_source: Dict[str, List[str]]):
+        """把实时索引累积的增量段合并进主段：BM25 / 向量索引整体重写，父文档索引落盘，图谱与图谱索引重建"""
+        bm25 = self._live_bm25 if self._live_bm25 is not None else \
+            SparseBM25Index.load(self.bm25_index_dir, tokenizer=config.BM25_TOKENIZER)
+        if bm25 is not None:
+            bm25.save()
+        self._live_bm25 = None
+        if config.VECTOR_BACKEND == "numpy":
+            self._open_vectorstore()  # 新进程中尚未打开时由 load 回放 delta.npz，随后整体写出
+        self._flush_stores()
+        self.save_graph(graph, parents_by_source)
+
+    def has_index_delta(self) -> bool:
+        """是否存在尚未合并的增量段 (实时索引停机前未来得及合并)"""
+        return any(os.path.exists(p) for p in (
+            os.path.join(self.bm25_index_dir, "delta.npz"), os.path.join(self.vector_index_dir, "delta.npz"),
+            os.path.join(self.graph_index_dir, "delta.json")))
+
+    def _flush_stores(self):
+        if self._numpy_store is not None:
+            print("🧊 正在写出量化向量索引...")
+            self._numpy_store.save()
+        if hasattr(self.docstore, "flush"):
+            self.docstore.flush()
+        if isinstance(self.embedding, CachedEmbeddings):
+            self.embedding.flush()
+            print(self.embedding.report())
+
+    def delete_parents(self, parent_ids: Sequence[str], vectorstore=None, doc_store=None):
+        """按父块 ID 删除父文档及其在 Chroma 中的全部子块"""
+        vectorstore = vectorstore or self._open_vectorstore()
+        doc_store = doc_store or self.docstore
+        parent_ids = list(parent_ids)
+        for start in range(0, len(parent_ids), self.DELETE_BATCH):
+            batch = parent_ids[start:start + self.DELETE_BATCH]
+            vectorstore.delete(where={"doc_id": {"$in": batch}})
+            doc_store.mdelete(batch)
+
+    def _open_bm25_for_update(self) -> SparseBM25Index:
+        """
+        写入侧打开 BM25：只有磁盘上确实没有索引时才新建空索引。
+        已有索引加载失败 (如建索引用的 jieba 未安装) 时直接抛出 —— 若退回空索引，随后的 save() 会用本次变更的
+        少量文档覆盖整个语料的倒排索引。
+        """
+        if self._live_bm25 is not None:
+            return self._live_bm25
+        bm25 = SparseBM25Index.load(self.bm25_index_dir, tokenizer=config.BM25_TOKENIZER)
+        if bm25 is None:
+            bm25 = SparseBM25Index(self.bm25_index_dir, tokenizer=config.BM25_TOKENIZER)
+        return bm25
+
+    def _load_bm25(self) -> Optional[SparseBM25Index]:
+        """查询侧：加载失败只告警并关闭 BM25 通道"""
+        try:
+            return SparseBM25Index.load(self.bm25_index_dir, tokenizer=config.BM25_TOKENIZER)
+        except Exception as e:
+            print(f"⚠️ BM25 加载失败: {e}")
+            return None
+
+    def get_retriever_components(self, profile=None):
+        """为前端提供检索所需的全部物理组件；profile (StageTimer) 用于记录各组件加载耗时"""
+        lap = profile.lap if profile is not None else (lambda stage: None)
         # 加载向量库
-        vectorstore = Chroma(
-            collection_name="rag_collection", 
-            persist_directory=config.DB_PATH, 
-            embedding_function=self.embedding
-        )
+        vectorstore = self._open_vectorstore()
+        lap("向量库")
         # 加载父文档库
-        doc_store = LocalFileStore(config.DOC_STORE_PATH)
+        doc_store = self.docstore
         
-        # 加载 BM25 (如果存在)
-        bm25 = None
-        if os.path.exists(config.BM25_PATH):
-            try:
-                with open(config.BM25_PATH, "rb") as f:
-                    bm25 = pickle.load(f)
-            except Exception as e:
-                print(f"⚠️ BM25 加载失败: {e}")
+        # 加载 BM25 倒排索引 (如果存在)
+        index = self._load_bm25()
+        bm25 = SparseBM25Retriever(index=index) if index is not None and len(index) else None
+        lap("BM25")
                 
         return vectorstore, doc_store, bm25
\ No newline at end of file
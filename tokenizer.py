@@ -0,0 +1,84 @@
+# 职责：关键词索引的分词器 (中文二元组 / jieba 词典分词 / 空白切分)，建索引与查询共用。
+import re
+from typing import Callable, Dict, List
+
+# CJK 统一表意文字 (含扩展 A、兼容区) 与日文假名、韩文音节
+_CJK = r"㐀-䶿一-鿿豈-﫿぀-ヿ가-힯"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[^\W_{_CJK}]+(?:[._-][^\W_{_CJK}]+)*")
+_CJK_RUN_RE = re.compile(rf"[{_CJK}]")
+
+
+def whitespace_tokenize(text: str) -> List[str]:
+    """旧行为：按空白切分 (中文段落会整体成为一个 token)"""
+    return text.split()
+
+
+def _bigrams(run: str) -> List[str]:
+    # 不按整段缓存：CJK 连续段常有一整段落长，建索引时几乎不会重复命中，缓存只会驻留大量长字符串
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def bigram_tokenize(text: str) -> List[str]:
+    """中文按重叠二元组切分，拉丁词转小写整体保留"""
+    tokens = []
+    for run in _TOKEN_RE.findall(text):
+        if _CJK_RUN_RE.match(run):
+            tokens.extend(_bigrams(run))
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+_jieba = None
+
+
+def _jieba_cut(run: str) -> List[str]:
+    return [w for w in _jieba.cut_for_search(run) if w.strip()]
+
+
+def _load_jieba() -> bool:
+    global _jieba
+    if _jieba is None:
+        try:
+            import jieba
+            jieba.setLogLevel(60)
+            _jieba = jieba
+        except ImportError:
+            print("⚠️ 未安装 jieba，关键词分词回退为二元组")
+            _jieba = False
+    return bool(_jieba)
+
+
+def jieba_tokenize(text: str) -> List[str]:
+    """jieba 搜索引擎模式分词；未安装 jieba 时退回二元组"""
+    if not _load_jieba():
+        return bigram_tokenize(text)
+    tokens = []
+    for run in _TOKEN_RE.findall(text):
+        if _CJK_RUN_RE.match(run):
+            tokens.extend(_jieba_cut(run))
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+TOKENIZERS: Dict[str, Callable[[str], List[str]]] = {
+    "whitespace": whitespace_tokenize,
+    "bigram": bigram_tokenize,
+    "jieba": jieba_tokenize,
+}
+
+
+def resolve_tokenizer(name: str) -> str:
+    """实际生效的分词器名：配置 jieba 但未安装时为 bigram (写入索引元数据，查询端据此对齐)"""
+    if name == "jieba" and not _load_jieba():
+        return "bigram"
+    return name
+
+
+def get_tokenizer(name: str) -> Callable[[str], List[str]]:
+    if name not in TOKENIZERS:
+        raise ValueError(f"未知分词器: {name}，可选: {', '.join(TOKENIZERS)}")
+    return TOKENIZERS[name]
@@ -0,0 +1,203 @@
+# 职责：轻量追踪与指标 —— 上下文管理器 span (单调时钟计时) 与计数器，导出 Prometheus 文本或 JSONL 追踪文件。
+import json
+import os
+import time
+import threading
+import contextvars
+from collections import deque
+from typing import Dict, List, Optional
+
+import config
+
+# 直方图桶上界 (秒)，覆盖 BM25 的毫秒级到生成的十秒级
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current: contextvars.ContextVar = contextvars.ContextVar("rag_span", default=None)
+
+
+class _NoopSpan:
+    """关闭追踪时所有 span 共用的空对象：进出与计数都不做任何事"""
+    __slots__ = ()
+    result = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+    def count(self, name: str, n: int = 1):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """
+    一个计时区间。进入时挂到当前上下文的 span 之下，退出时把耗时计入直方图；
+    根 span (tracer.trace 创建) 退出时整条追踪写入最近记录与 JSONL 文件。
+    不在任何追踪内的 span (如入库、后台批处理线程) 只更新指标。
+    """
+    __slots__ = ("tracer", "name", "attrs", "root", "parent", "spans", "start", "ms", "result", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: dict, root: bool = False):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.root = root
+        self.spans: List[dict] = []  # 仅根 span 使用：整条追踪的扁平 span 列表
+        self.ms = 0.0
+        self.result: Optional[dict] = None  # 根 span 结束后的完整追踪
+
+    def __enter__(self):
+        self.parent = None if self.root else _current.get()
+        self.start = time.perf_counter()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.ms = (time.perf_counter() - self.start) * 1000
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # 未迭代完的流式生成器在别的上下文中被关闭
+            _current.set(self.parent)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer._observe(self.name, self.ms)
+        if self.root:
+            self.tracer._finish(self)
+        elif self.parent is not None:
+            self.parent._trace_root()._attach(self.name, self.start, self.ms, self.attrs)
+        return False
+
+    def _trace_root(self) -> "Span":
+        span = self
+        while not span.root and span.parent is not None:
+            span = span.parent
+        return span
+
+    def _attach(self, name: str, start: float, ms: float, attrs: dict):
+        if self.root:
+            # list.append 在 GIL 下原子，召回线程池中的 span 可直接并发写入
+            self.spans.append({"name": name, "start_ms": (start - self.start) * 1000, "ms": ms, **attrs})
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def count(self, name: str, n: int = 1):
+        """span 属性与全局计数器同时累加 (候选数、父块数、生成片段数等)"""
+        self.attrs[name] = self.attrs.get(name, 0) + n
+        self.tracer.incr(name, n)
+
+
+class Tracer:
+    def __init__(self, enabled: bool = config.TRACE_ENABLED, jsonl_path: Optional[str] = config.TRACE_JSONL_PATH,
+                 keep: int = config.TRACE_KEEP):
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+        self.recent: deque = deque(maxlen=keep)
+        self._lock = threading.Lock()
+        self._hist: Dict[str, List[float]] = {}  # span 名 -> [各桶计数..., 总次数, 总秒数]
+        self.counters: Dict[str, float] = {}
+
+    # --- 记录 ---
+    def trace(self, name: str, **attrs):
+        """开始一条追踪 (一次查询)，其中嵌套的 span 都归入这条追踪；已在追踪内时退化为普通 span"""
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attrs, root=_current.get() is None)
+
+    def span(self, name: str, **attrs):
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attrs)
+
+    def record(self, name: str, ms: float, **attrs):
+        """登记一段已测得的耗时 (如 StageTimer 的阶段、并发召回各路)，结束时刻视为现在"""
+        if not self.enabled:
+            return
+        self._observe(name, ms)
+        parent = _current.get()
+        if parent is not None:
+            parent._trace_root()._attach(name, time.perf_counter() - ms / 1000, ms, attrs)
+
+    def incr(self, name: str, n: float = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def current(self):
+        """当前上下文的 span (无则返回空对象)，供深层代码追加计数"""
+        return _current.get() or NOOP_SPAN
+
+    def _observe(self, name: str, ms: float):
+        seconds = ms / 1000
+        with self._lock:
+            hist = self._hist.get(name)
+            if hist is None:
+                hist = self._hist[name] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    hist[i] += 1
+                    break
+            hist[-2] += 1
+            hist[-1] += seconds
+
+    def _finish(self, root: Span):
+        trace = {"ts": time.time(), "name": root.name, "ms": root.ms, **root.attrs,
+                 "spans": sorted(root.spans, key=lambda s: s["start_ms"])}
+        root.result = trace
+        self.recent.append(trace)
+        if self.jsonl_path:
+            line = json.dumps(trace, ensure_ascii=False) + "\n"
+            with self._lock:
+                os.makedirs(os.path.dirname(self.jsonl_path), exist_ok=True)
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(line)
+
+    # --- 导出 ---
+    def last_trace(self) -> Optional[dict]:
+        return self.recent[-1] if self.recent else None
+
+    def prometheus_text(self) -> str:
+        """Prometheus 文本格式：rag_span_seconds 直方图 + rag_events_total 计数器"""
+        esc = lambda s: s.replace("\\", "\\\\").replace('"', '\\"')
+        lines = ["# HELP rag_span_seconds 各阶段耗时", "# TYPE rag_span_seconds histogram"]
+        with self._lock:
+            hists = {k: list(v) for k, v in self._hist.items()}
+            counters = dict(self.counters)
+        for name, hist in sorted(hists.items()):
+            label = esc(name)
+            cumulative = 0
+            for bound, n in zip(BUCKETS, hist):
+                cumulative += n
+                lines.append(f'rag_span_seconds_bucket{{span="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'rag_span_seconds_bucket{{span="{label}",le="+Inf"}} {hist[-2]}')
+            lines.append(f'rag_span_seconds_sum{{span="{label}"}} {hist[-1]:.6f}')
+            lines.append(f'rag_span_seconds_count{{span="{label}"}} {hist[-2]}')
+        lines += ["# HELP rag_events_total 累计计数 (召回候选、父块、生成片段等)", "# TYPE rag_events_total counter"]
+        for name, value in sorted(counters.items()):
+            lines.append(f'rag_events_total{{name="{esc(name)}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+
+def format_trace(trace: dict) -> List[str]:
+    """把一条追踪渲染为缩进的耗时明细行 (区间被前一个 span 包含时缩进一级)"""
+    lines, stack = [], []
+    for s in trace["spans"]:
+        end = s["start_ms"] + s["ms"]
+        while stack and end > stack[-1] + 0.01:
+            stack.pop()
+        extras = ", ".join(f"{k}={v}" for k, v in s.items() if k not in ("name", "start_ms", "ms"))
+        lines.append(f"{'  ' * len(stack)}{s['name']}: {s['ms']:.0f}ms" + (f" ({extras})" if extras else ""))
+        stack.append(end)
+    return lines
+
+
+tracer = Tracer()
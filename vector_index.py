@@ -0,0 +1,493 @@
+# 职责：纯 NumPy 向量索引 —— int8 标量量化 / Matryoshka 截断的 memmap 数组 + IVF 倒排分桶，候选用全精度向量重打分。
+import os
+import json
+import mmap
+import tempfile
+import uuid
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+import config
+
+BLOCK = 8192           # 扫描 / 写出的分块行数 (int8 -> float32 临时块约 BLOCK * 维度 * 4 字节)
+KMEANS_ITERS = 10
+KMEANS_SAMPLE_PER_LIST = 32  # 训练样本 = 桶数 * 32：质心估计足够稳定，百万级子块的训练仍在分钟内
+SCALE_SAMPLE = 100_000
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+def _spherical_kmeans(sample: np.ndarray, k: int, seed: int = 0) -> np.ndarray:
+    """余弦 k-means (Lloyd)：质心归一化，按最大内积分配；空桶用随机样本重新播种"""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+    for _ in range(KMEANS_ITERS):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        counts = np.bincount(assign, minlength=k)
+        order = np.argsort(assign, kind="stable")
+        sums = np.zeros_like(centroids)
+        starts = np.flatnonzero(np.r_[True, np.diff(assign[order]) != 0])
+        sums[counts > 0] = np.add.reduceat(sample[order], starts, axis=0)
+        empty = counts == 0
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids.astype(np.float32)
+
+
+class QuantizedVectorIndex:
+    """
+    目录布局：
+    - codes.npy        (n, search_dim) 检索用编码：int8 标量量化 (每维对称缩放) 或 float16；
+                       search_dim < dim 时为 Matryoshka 截断后重新归一化的前若干维
+    - scale.npy        int8 每维缩放系数 (码值 127 对应的浮点值)
+    - full.npy         (n, dim) float16 归一化全维向量，只对候选行读取做精确重打分
+    - centroids.npy / list_ptr.npy   IVF 质心与各桶在 codes 中的行区间 (行按桶连续存放)
+    - ids.txt / parents.txt          子块 ID 与所属父块 ID (每行一个)
+    - docs.bin + doc_offsets.npy     子块 JSON 记录 (正文 + 元数据)
+    - meta.json                      含主段代号 generation
+    - delta.npz                      save_delta() 写出的增量段与删除标记 (实时索引)，generation 匹配时由 load() 回放
+    新增向量先以 float16 追加到临时文件 (增量段，查询时暴力扫描)，save() 时与主段合并、
+    重新估计缩放系数与质心并整体写出；删除只做标记，save() 时剔除。
+    add / get / count / query 与 Chroma collection 的同名方法参数一致，入库、分片合并与批量检索无需区分后端。
+    """
+
+    def __init__(self, path: str, quant: str = config.VECTOR_QUANT, search_dim: Optional[int] = config.VECTOR_DIM,
+                 n_lists: Optional[int] = config.VECTOR_IVF_LISTS):
+        self.path = path
+        self.quant = quant
+        self.search_dim = search_dim  # None: 与全维相同 (首次写入时确定)
+        self.n_lists_cfg = n_lists  # 配置值 (None: 每次 save 按 sqrt(n) 重新推算)；实际桶数见 n_lists 属性
+        self.dim: Optional[int] = None
+
+        self.codes = self.full = self.scale = self.centroids = None
+        self.list_ptr = np.zeros(1, dtype=np.int64)
+        self.doc_offsets = np.zeros(1, dtype=np.int64)
+        self.ids: List[str] = []
+        self.parents: List[str] = []
+        self.alive = np.zeros(0, dtype=bool)
+        self._alive_buf: Optional[np.ndarray] = None  # alive 的底层缓冲区，按容量翻倍增长
+        self._alive_cap = 0
+        self._blob = None
+        self._n_base = 0
+        self.generation: Optional[str] = None  # 主段代号，save() 时更新；None 表示尚未写出过主段
+        self._rows_by_parent: Optional[Dict[str, List[int]]] = None  # 父块 ID -> 行号，首次删除时构建
+
+        # 增量段：向量与记录各一个临时文件
+        self._delta_vec = None
+        self._delta_rec = None
+        self._delta_offsets = array("q", [0])
+        self._delta_view = None
+
+    # --- 加载 ---
+    @classmethod
+    def load(cls, path: str) -> Optional["QuantizedVectorIndex"]:
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        # 旧版 meta 只有推算后的桶数，配置值按当前 config 处理
+        index = cls(path, quant=meta["quant"], search_dim=meta["search_dim"],
+                    n_lists=meta.get("n_lists_cfg", config.VECTOR_IVF_LISTS))
+        index.dim = meta["dim"]
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        index.codes, index.full = load("codes"), load("full")
+        index.scale, index.centroids, index.list_ptr = load("scale"), load("centroids"), load("list_ptr")
+        index.doc_offsets = load("doc_offsets")
+        for name in ("ids", "parents"):
+            with open(os.path.join(path, f"{name}.txt"), "r", encoding="utf-8") as f:
+                text = f.read()
+            setattr(index, name, text.split("\n") if text else [])
+        index._n_base = meta["n"]
+        index.alive = np.ones(meta["n"], dtype=bool)
+        index.generation = meta.get("generation")
+        if index.doc_offsets[-1] > 0:
+            with open(os.path.join(path, "docs.bin"), "rb") as f:
+                index._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        delta_path = os.path.join(path, "delta.npz")
+        if index.generation and os.path.exists(delta_path):
+            index._apply_delta(delta_path)
+        return index
+
+    def _apply_delta(self, delta_path: str):
+        with np.load(delta_path, allow_pickle=False) as z:
+            if str(z["generation"]) != self.generation:
+                return  # 属于已被 save() 合并替换的旧主段
+            vectors = z["vectors"]
+            if len(vectors):
+                self._open_delta()
+                self._delta_vec.write(vectors.tobytes())
+                self._delta_vec.flush()
+                self._delta_rec.write(z["blob"].tobytes())
+                self._delta_rec.flush()
+                self._delta_offsets = array("q", z["offsets"].tolist())
+                self.ids.extend(str(z["ids"]).split("\n"))
+                self.parents.extend(str(z["parents"]).split("\n"))
+                self._append_alive(len(vectors))
+            self.alive[z["dead"]] = False
+
+    def _append_alive(self, m: int):
+        """alive 追加 m 个存活行：写入按容量翻倍增长的缓冲区，对外仍是长度为行数的视图 (逐批追加不再整体拷贝)"""
+        n = len(self.alive)
+        if n + m > self._alive_cap:
+            cap = max(2 * self._alive_cap, n + m, 1024)
+            buf = np.zeros(cap, dtype=bool)
+            buf[:n] = self.alive
+            self._alive_buf, self._alive_cap = buf, cap
+        self._alive_buf[n:n + m] = True
+        self.alive = self._alive_buf[:n + m]
+
+    def _open_delta(self):
+        if self._delta_vec is None:
+            os.makedirs(self.path, exist_ok=True)
+            self._delta_vec = tempfile.TemporaryFile(dir=self.path, prefix="delta-vec-")
+            self._delta_rec = tempfile.TemporaryFile(dir=self.path, prefix="delta-rec-")
+
+    def count(self) -> int:
+        return int(self.alive.sum())
+
+    @property
+    def n_lists(self) -> int:
+        return 0 if self.centroids is None else len(self.centroids)
+
+    # --- 增删 (与 Chroma collection 对齐) ---
+    def add(self, ids: Sequence[str], embeddings: Sequence[Sequence[float]],
+            documents: Sequence[str], metadatas: Sequence[dict]):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if not len(vectors):
+            return
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"向量维度 {vectors.shape[1]} 与索引维度 {self.dim} 不一致")
+        self._open_delta()
+        self._delta_vec.write(_normalize(vectors).astype(np.float16).tobytes())
+        self._delta_vec.flush()
+        for doc, meta in zip(documents, metadatas):
+            record = json.dumps({"c": doc, "m": meta}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            self._delta_rec.write(record)
+            self._delta_offsets.append(self._delta_offsets[-1] + len(record))
+        self._delta_rec.flush()
+        start = len(self.ids)
+        self.ids.extend(ids)
+        self.parents.extend(m.get("doc_id", "") for m in metadatas)
+        if self._rows_by_parent is not None:
+            for row in range(start, len(self.parents)):
+                self._rows_by_parent.setdefault(self.parents[row], []).append(row)
+        self._append_alive(len(vectors))
+        self._delta_view = None
+
+    def delete_parents(self, parent_ids: Iterable[str]):
+        """按父块 ID 标记删除其全部子块 (save 时物理剔除)；父块 -> 行号映射首次删除时构建，之后每次只触及被删的行"""
+        stale = set(parent_ids)
+        if not stale:
+            return
+        if self._rows_by_parent is None:
+            self._rows_by_parent = {}
+            for row, parent in enumerate(self.parents):
+                self._rows_by_parent.setdefault(parent, []).append(row)
+        rows = [r for p in stale for r in self._rows_by_parent.pop(p, ())]
+        self.alive[np.asarray(rows, dtype=np.int64)] = False
+
+    def _delta(self) -> np.ndarray:
+        """增量段 float16 向量 (memmap 临时文件)"""
+        n = len(self.alive) - self._n_base
+        if n == 0:
+            return np.zeros((0, self.dim or 0), dtype=np.float16)
+        if self._delta_view is None or len(self._delta_view) != n:
+            self._delta_view = np.memmap(self._delta_vec, dtype=np.float16, mode="r", shape=(n, self.dim))
+        return self._delta_view
+
+    def _full_rows(self, rows: np.ndarray) -> np.ndarray:
+        """按全局行号取 float16 全维向量 (主段 / 增量段混合)"""
+        rows = np.asarray(rows)
+        out = np.empty((len(rows), self.dim), dtype=np.float16)
+        base = rows < self._n_base
+        if base.any():
+            out[base] = self.full[rows[base]]
+        if (~base).any():
+            out[~base] = self._delta()[rows[~base] - self._n_base]
+        return out
+
+    def _record(self, row: int) -> bytes:
+        if row < self._n_base:
+            return self._blob[self.doc_offsets[row]:self.doc_offsets[row + 1]]
+        i = row - self._n_base
+        lo, hi = self._delta_offsets[i], self._delta_offsets[i + 1]
+        return os.pread(self._delta_rec.fileno(), hi - lo, lo)
+
+    def get_document(self, row: int) -> Document:
+        obj = json.loads(self._record(row))
+        return Document(id=self.ids[row], page_content=obj["c"], metadata=obj["m"])
+
+    def get(self, limit: Optional[int] = None, offset: int = 0, include: Sequence[str] = ("documents", "metadatas")):
+        """按存活行分页导出 (分片合并用)，返回结构与 Chroma collection.get 相同"""
+        rows = np.flatnonzero(self.alive)[offset:None if limit is None else offset + limit]
+        docs = [json.loads(self._record(int(r))) for r in rows]
+        result: Dict[str, Any] = {"ids": [self.ids[r] for r in rows]}
+        if "documents" in include:
+            result["documents"] = [d["c"] for d in docs]
+        if "metadatas" in include:
+            result["metadatas"] = [d["m"] for d in docs]
+        if "embeddings" in include:
+            result["embeddings"] = self._full_rows(rows).astype(np.float32) if len(rows) else []
+        return result
+
+    # --- 查询 ---
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        """全维归一化向量 -> 检索用截断向量 (Matryoshka：取前 search_dim 维后重新归一化)"""
+        return _normalize(np.asarray(vectors, dtype=np.float32)[:, :self.search_dim])
+
+    def search(self, vector: Sequence[float], k: int, nprobe: int = config.VECTOR_NPROBE,
+               rescore: int = config.VECTOR_RESCORE) -> List[Tuple[int, float]]:
+        """
+        返回 [(行号, 余弦相似度)]，按相似度降序。
+        1. 只扫描 nprobe 个最近的 IVF 桶 (无质心时全量扫描)，以量化编码的近似内积取 k * rescore 个候选；
+        2. 候选读取 float16 全维向量计算精确余弦，取前 k。增量段直接精确暴力计算。
+        """
+        if self.dim is None or not self.alive.any():
+            return []
+        q = _normalize(np.asarray(vector, dtype=np.float32)[None, :])[0]
+        n_cand = max(k * rescore, k)
+        cand_rows, cand_scores = [], []
+
+        if self._n_base:
+            qs = self._encode(q[None, :])[0]
+            # int8: 码值 * scale / 127 还原分量，把缩放折进查询向量，扫描时只做一次 BLAS 矩阵向量乘
+            qw = qs * self.scale / 127.0 if self.quant == "int8" else qs
+            if self.n_lists:
+                probe = np.argsort(-(self.centroids @ qs))[:nprobe]
+                ranges = sorted((int(self.list_ptr[l]), int(self.list_ptr[l + 1])) for l in probe)
+            else:
+                ranges = [(0, self._n_base)]
+            for lo, hi in ranges:
+                for a in range(lo, hi, BLOCK):
+                    b = min(hi, a + BLOCK)
+                    scores = np.asarray(self.codes[a:b], dtype=np.float32) @ qw
+                    scores[~self.alive[a:b]] = -np.inf
+                    if len(scores) > n_cand:
+                        top = np.argpartition(-scores, n_cand - 1)[:n_cand]
+                        scores, rows = scores[top], top + a
+                    else:
+                        rows = np.arange(a, b)
+                    cand_rows.append(rows)
+                    cand_scores.append(scores)
+        if cand_rows:
+            rows, scores = np.concatenate(cand_rows), np.concatenate(cand_scores)
+            keep = np.isfinite(scores)
+            rows, scores = rows[keep], scores[keep]
+            if len(rows) > n_cand:
+                rows = rows[np.argpartition(-scores, n_cand - 1)[:n_cand]]
+        else:
+            rows = np.zeros(0, dtype=np.int64)
+
+        delta = np.arange(self._n_base, len(self.alive))
+        rows = np.concatenate([rows, delta[self.alive[delta]]]).astype(np.int64)
+        if not len(rows):
+            return []
+        exact = self._full_rows(rows).astype(np.float32) @ q
+        k = min(k, len(rows))
+        top = np.argpartition(-exact, k - 1)[:k]
+        top = top[np.argsort(-exact[top])]
+        return [(int(rows[i]), float(exact[i])) for i in top]
+
+    def query(self, query_embeddings: Sequence[Sequence[float]], n_results: int = 10,
+              include: Sequence[str] = ("documents", "metadatas", "distances")) -> Dict[str, List[list]]:
+        """多向量查询，返回结构与 Chroma collection.query 相同 (distances 为 1 - 余弦相似度)"""
+        result: Dict[str, List[list]] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for vector in query_embeddings:
+            hits = self.search(vector, n_results)
+            records = [json.loads(self._record(row)) for row, _ in hits]
+            result["ids"].append([self.ids[row] for row, _ in hits])
+            result["documents"].append([r["c"] for r in records])
+            result["metadatas"].append([r["m"] for r in records])
+            result["distances"].append([1.0 - score for _, score in hits])
+        return {key: value for key, value in result.items() if key == "ids" or key in include}
+
+    # --- 持久化 ---
+    def save(self):
+        """合并增量段、剔除已删除行，重新估计量化缩放与 IVF 质心后分块写出 (先写临时文件再替换)"""
+        live = np.flatnonzero(self.alive)
+        n = len(live)
+        if self.dim is None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        search_dim = self.search_dim = min(self.search_dim or self.dim, self.dim)
+        rng = np.random.default_rng(0)
+
+        # 1. 缩放系数与质心：在抽样上估计
+        sample = self._encode(self._full_rows(np.sort(rng.choice(live, min(n, SCALE_SAMPLE), replace=False)))
+                              if n else np.zeros((0, self.dim)))
+        scale = np.maximum(np.abs(sample).max(axis=0), 1e-6).astype(np.float32) if n else \
+            np.ones(search_dim, dtype=np.float32)
+        n_lists = self.n_lists_cfg
+        if n_lists is None:
+            n_lists = int(np.sqrt(n)) if n >= config.VECTOR_IVF_MIN else 0
+        n_lists = min(n_lists, n // KMEANS_SAMPLE_PER_LIST) if n_lists else 0
+        if n_lists:
+            train = sample[rng.choice(len(sample), min(len(sample), n_lists * KMEANS_SAMPLE_PER_LIST), replace=False)]
+            centroids = _spherical_kmeans(train, n_lists)
+            assign = np.empty(n, dtype=np.int32)
+            for a in range(0, n, BLOCK):
+                assign[a:a + BLOCK] = np.argmax(self._encode(self._full_rows(live[a:a + BLOCK])) @ centroids.T, axis=1)
+            order = np.argsort(assign, kind="stable")
+            list_ptr = np.zeros(n_lists + 1, dtype=np.int64)
+            list_ptr[1:] = np.cumsum(np.bincount(assign, minlength=n_lists))
+        else:
+            centroids = np.zeros((0, search_dim), dtype=np.float32)
+            order = np.arange(n)
+            list_ptr = np.asarray([0, n], dtype=np.int64)
+        rows = live[order]
+
+        # 2. 分块写出编码与全维向量 (行按桶连续)
+        tmp = lambda name: os.path.join(self.path, name + ".tmp")
+        code_dtype = np.int8 if self.quant == "int8" else np.float16
+        codes = np.lib.format.open_memmap(tmp("codes.npy"), mode="w+", dtype=code_dtype, shape=(n, search_dim))
+        full = np.lib.format.open_memmap(tmp("full.npy"), mode="w+", dtype=np.float16, shape=(n, self.dim))
+        for a in range(0, n, BLOCK):
+            block = self._full_rows(rows[a:a + BLOCK])
+            full[a:a + len(block)] = block
+            enc = self._encode(block)
+            if self.quant == "int8":
+                enc = np.clip(np.rint(enc / scale * 127.0), -127, 127)
+            codes[a:a + len(block)] = enc.astype(code_dtype)
+        codes.flush()
+        full.flush()
+        del codes, full
+
+        offsets = array("q", [0])
+        with open(tmp("docs.bin"), "wb") as f:
+            for r in rows:
+                rec = self._record(int(r))
+                f.write(rec)
+                offsets.append(offsets[-1] + len(rec))
+        for name, arr in (("scale", scale), ("centroids", centroids), ("list_ptr", list_ptr),
+                          ("doc_offsets", np.frombuffer(offsets, dtype=np.int64))):
+            with open(tmp(f"{name}.npy"), "wb") as f:
+                np.save(f, arr)
+        for name, values in (("ids", self.ids), ("parents", self.parents)):
+            with open(tmp(f"{name}.txt"), "w", encoding="utf-8") as f:
+                f.write("\n".join(values[r] for r in rows))
+        with open(tmp("meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"n": n, "dim": self.dim, "search_dim": search_dim, "quant": self.quant,
+                       "n_lists": n_lists, "n_lists_cfg": self.n_lists_cfg, "generation": uuid.uuid4().hex}, f)
+        # meta.json 最后替换：中途失败时旧索引仍然完整可读
+        for name in ("codes.npy", "full.npy", "docs.bin", "scale.npy", "centroids.npy", "list_ptr.npy",
+                     "doc_offsets.npy", "ids.txt", "parents.txt", "meta.json"):
+            os.replace(tmp(name), os.path.join(self.path, name))
+        # 新主段已包含全部增量，旧 delta.npz 的 generation 不再匹配，删除即可
+        if os.path.exists(os.path.join(self.path, "delta.npz")):
+            os.remove(os.path.join(self.path, "delta.npz"))
+
+        fresh = QuantizedVectorIndex.load(self.path)
+        self.close()
+        self.__dict__.update(fresh.__dict__)
+
+    def save_delta(self):
+        """
+        只持久化上次 save() 以来的增量段与删除标记：整体写一个 delta.npz (fsync 后原子替换)，
+        不重新训练质心、不重写主段，开销与增量大小成正比；尚无主段时退化为 save()。
+        """
+        if self.generation is None:
+            self.save()
+            return
+        base = self._n_base
+        vectors = np.array(self._delta())
+        size = self._delta_offsets[-1]
+        blob = os.pread(self._delta_rec.fileno(), size, 0) if size else b""
+        tmp = os.path.join(self.path, "delta.npz.tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, generation=np.array(self.generation), vectors=vectors,
+                     offsets=np.frombuffer(self._delta_offsets, dtype=np.int64).copy(),
+                     blob=np.frombuffer(blob, dtype=np.uint8), ids=np.array("\n".join(self.ids[base:])),
+                     parents=np.array("\n".join(self.parents[base:])), dead=np.flatnonzero(~self.alive))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.path, "delta.npz"))
+
+    @property
+    def n_delta(self) -> int:
+        """增量段行数 (实时索引据此决定何时合并)"""
+        return len(self.alive) - self._n_base
+
+    def close(self):
+        for f in (self._blob, self._delta_vec, self._delta_rec):
+            if f is not None:
+                f.close()
+        self._blob = self._delta_vec = self._delta_rec = self._delta_view = None
+
+    def disk_bytes(self) -> int:
+        return sum(os.path.getsize(os.path.join(self.path, f)) for f in os.listdir(self.path)
+                   if not f.startswith("delta-")) if os.path.isdir(self.path) else 0
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    QuantizedVectorIndex 的 LangChain 适配：as_retriever() 与 Chroma 用法一致；
+    _collection 指向索引本身 (add / get / count / query)，delete(where={"doc_id": {"$in": [...]}}) 按父块删除。
+    """
+
+    def __init__(self, path: str, embedding: Embeddings):
+        self.path = path
+        self._embedding = embedding
+        self.index = QuantizedVectorIndex.load(path) or QuantizedVectorIndex(path)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    @property
+    def _collection(self) -> QuantizedVectorIndex:
+        return self.index
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs) -> List[str]:
+        texts = list(texts)
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        self.index.add(ids, self._embedding.embed_documents(texts), texts, metadatas or [{} for _ in texts])
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[dict] = None, **kwargs):
+        if where is not None:
+            self.index.delete_parents(where["doc_id"]["$in"])
+        if ids:
+            drop = set(ids)
+            self.index.alive &= ~np.fromiter((i in drop for i in self.index.ids), dtype=bool,
+                                             count=len(self.index.ids))
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4) -> List[Tuple[Document, float]]:
+        return [(self.index.get_document(row), score) for row, score in self.index.search(embedding, k)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (1.0 + score) / 2  # 余弦相似度映射到 [0, 1]
+
+    def save(self):
+        self.index.save()
+
+    def save_delta(self):
+        self.index.save_delta()
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   path: str = config.VECTOR_INDEX_DIR, **kwargs) -> "NumpyVectorStore":
+        store = cls(path, embedding)
+        store.add_texts(texts, metadatas)
+        store.save()
+        return store